@@ -1,13 +1,22 @@
 ## Builtin
+import atexit
 import collections
+import contextlib
 import filecmp
+import fnmatch
 import functools
+import hashlib
 import importlib
+import io
 import json
+import os
 import pathlib
 import re
 import shutil
 import sqlite3
+import struct
+import tempfile
+import threading
 import time
 ## This Module
 from aldb2 import filestructure
@@ -29,7 +38,10 @@ which configures the module's datbase tables and settings. It should have the fo
         "updates" (Optional)- a mapping of previous version numbers paired with a list of method names
                   that can be used to upgrade to the current version. Previous version numbers can use * wildcards
                   to include minor versions (i.e.- 2.*.* would provide an upgrade path from any subversion of major
-                  version 2 to the current version.
+                  version 2 to the current version. Instead of a method name, a step can be a mapping {"rebuild": table name,
+                  "columns" (Optional): {column: sql expression}} to rebuild the table using its current "sql" (see rebuildtable).
+                  Instead of a list of steps, a version can be paired with a mapping {"version": intermediate version,
+                  "steps": list of steps} in which case upgrading continues from the intermediate version (see resolveupdates).
     "views"- a list of mappings with the same keys as "tables" (except concerning views).
         
 
@@ -54,11 +66,16 @@ def row_factory_saver(function):
     return inner
 
 ################## Extension Functions
+## {sql.json path: ((mtime, size), configuration)} (see loadsqljson)
+_SQLJSONCACHE = {}
+
 def loadsqljson(file,filename = "sql.json"):
     """ Loads sql configuratoin json; file should be the module's __file__ attribute. 
     
     By default, assumes that the sql file is located in the module's root directory and is named
     "sql.json;" to change this behavoir supply filename as a string relative to the module's root directory.
+    Parsed configurations are cached until the file's modification time or size changes; as the same
+    configuration is returned to every caller, it should not be modified.
     """
     path = pathlib.Path(file).resolve()
     parent = path.parent
@@ -67,8 +84,14 @@ def loadsqljson(file,filename = "sql.json"):
         definitions.relative_to(parent)
     except:
         raise ValueError("sql configuration file must be located relative to the module's root file!")
+    stat = definitions.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _SQLJSONCACHE.get(definitions)
+    if cached and cached[0] == key:
+        return cached[1]
     with open(definitions,'r') as f:
         data = json.load(f)
+    _SQLJSONCACHE[definitions] = (key, data)
     return data
 
 def compatibletables(configuration):
@@ -89,6 +112,76 @@ def setuptable(configuration, connection, table):
     return connection.execute(table['sql'])
 
 CheckTableResults = collections.namedtuple("tablevalidation","version, missing, different, passed")
+
+## Records the schema of each app which last passed checktables (see storefingerprint)
+FINGERPRINTTABLE = "schema_fingerprints"
+
+def configfingerprint(configuration)-> str:
+    """ Returns a hash of the configuration's appname, version, and expected CREATE TABLE statements """
+    hasher = hashlib.sha256()
+    for value in [configuration['appname'], configuration.get('version')]:
+        hasher.update(f"{value}\0".encode())
+    for table in configuration['tables']:
+        hasher.update(f"{table['name']}\0{table['sql']}\0".encode())
+    return hasher.hexdigest()
+
+@row_factory_saver
+def getschemaversion(connection)-> int:
+    """ Returns the database's schema_version (which SQLite changes whenever the schema is modified) """
+    return connection.execute("""PRAGMA schema_version;""").fetchone()[0]
+
+def createfingerprinttable(connection):
+    """ Creates the table of stored fingerprints (see storefingerprint) if it does not exist.
+
+        Called by loadcoretables: databases which were not set up with it are never fingerprinted.
+    """
+    connection.execute(f"""CREATE TABLE IF NOT EXISTS "{FINGERPRINTTABLE}" (appname TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, schemaversion INT NOT NULL);""")
+
+@row_factory_saver
+def hasfingerprints(connection)-> bool:
+    """ Returns whether the database has a table of stored fingerprints """
+    return connection.execute("""SELECT 1 FROM sqlite_master WHERE type = "table" AND name = :name;""",dict(name = FINGERPRINTTABLE)).fetchone() is not None
+
+@row_factory_saver
+def matchesfingerprint(connection, configuration)-> bool:
+    """ Returns whether the fingerprint stored for the configuration's app matches the configuration and the database's current schema_version.
+
+        The stored fingerprint, the schema_version and the app's registration are compared in a single query.
+        Configurations with a version only match while that version is registered in installed_apps; configurations
+        without one (such as Core's) only match while the app is not registered.
+        Returns False if the database does not have a fingerprint table (see createfingerprinttable).
+    """
+    try:
+        return connection.execute(f"""SELECT 1 FROM "{FINGERPRINTTABLE}"
+WHERE appname = :appname AND fingerprint = :fingerprint AND schemaversion = (SELECT schema_version FROM pragma_schema_version)
+AND CASE WHEN :version IS NULL THEN NOT EXISTS (SELECT 1 FROM installed_apps WHERE module = :appname)
+    ELSE EXISTS (SELECT 1 FROM installed_apps WHERE module = :appname AND version = :version) END;""",
+            dict(appname = configuration['appname'], fingerprint = configfingerprint(configuration), version = configuration.get('version'))).fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
+@row_factory_saver
+def storefingerprint(connection, configuration):
+    """ Records that the database's current schema passed checktables for the configuration.
+
+        Called by loadtables and migrateapp once checktables passes and only if the database has a fingerprint table
+        (see createfingerprinttable); the fingerprint is not committed (it is committed along with the caller's changes).
+    """
+    connection.execute(f"""INSERT OR REPLACE INTO "{FINGERPRINTTABLE}" (appname, fingerprint, schemaversion) VALUES (:appname, :fingerprint, :schemaversion);""",
+                       dict(appname = configuration['appname'], fingerprint = configfingerprint(configuration), schemaversion = getschemaversion(connection)))
+
+def clearfingerprints(connection):
+    """ Removes all stored fingerprints so that the next checktables performs a full check """
+    if hasfingerprints(connection):
+        connection.execute(f"""DELETE FROM "{FINGERPRINTTABLE}";""")
+
+def _checkpassed(tablecheck, configuration)-> bool:
+    """ Returns whether a checktables result found all of the app's tables to be correct and its registration to match
+        the configuration (see matchesfingerprint)
+    """
+    expected = None if configuration.get('version') is None else True
+    return tablecheck.version is expected and len(tablecheck.passed) == len(configuration['tables'])
+
 @row_factory_saver
 def checktables(connection,configuration): ## Tested- SetupNewDatabase,
     """ Checks that all tables are present and in the form specified by the factory.
@@ -101,12 +194,17 @@ def checktables(connection,configuration): ## Tested- SetupNewDatabase,
     * passed: table configurations that are correctly implemented.
 
     All values will be None if checktables fails to execute properly.
+    checktables does not modify the database. If loadtables or migrateapp have stored a fingerprint of the configuration
+    and the database's schema_version (see storefingerprint), the check is answered from the fingerprint with a single
+    query (see matchesfingerprint) instead of reading sqlite_master as long as neither has changed.
     Most often a app version mismatch will result in tables being listed in "different"; when properly defined,
     the configuration file can be used to safely update the "different" tables so that they match. If the
     configuration file does not provide a way to upgrade from the current version of the table to the new version,
     it will be necessary to procure other tools or otherwise update the table manually.
     """
     version,missing,different,passed = None,list(),list(),list()
+    if matchesfingerprint(connection, configuration):
+        return CheckTableResults(None if configuration.get('version') is None else True,[],[],list(configuration['tables']))
     try:
         connection.row_factory = None
         try: ver = connection.execute("""SELECT version FROM "installed_apps" WHERE module = :appname;""",dict(appname=configuration['appname'])).fetchone()
@@ -160,24 +258,260 @@ def updatedatabaseaccess(configuration, filename): ## Tested- NewConfigCase
     if filename in names: dbs.pop(names.index(filename))
     dbs.insert(0,dict(name = filename, recent=time.time()))
 
-def backupdatabase(filename): ## Tested- GeneralDatabase
-    """ Creates a duplicate of the file named "backup{timecode}_{filename} and checks that the backup is identical. Returns the backup's filepath as a pathlib.Path instance. """
+## Number of pages copied per backup step (other connections can use the database between steps)
+BACKUPPAGES = 1024
+## Backups are named "backup_{timecode}_{filename}"
+BACKUPRE = re.compile(r"^backup_(?P<timecode>\d+(?:\.\d+)?)_(?P<filename>.+)$")
+## The first 16 bytes of every SQLite database file
+SQLITEHEADER = b"SQLite format 3\x00"
+
+def isdatabasefile(file):
+    """ Returns True if the file starts with the SQLite database header """
+    with open(file,'rb') as f:
+        return f.read(len(SQLITEHEADER)) == SQLITEHEADER
+
+def _newbackupfile(dbfile):
+    """ Returns an unused backup file path for the given database file """
+    backup = None
+    while backup is None or backup.exists():
+        timecode = time.time()
+        backup  = dbfile.parent / f"backup_{timecode}_{dbfile.name}"
+    return backup
+
+def backupconnection(connection, target, pages = BACKUPPAGES, verify = True, progress = None):
+    """ Copies the connection's database to the target file using the SQLite backup API.
+
+        The database is copied pages pages at a time, so other connections can continue to read from
+        (and write to) the database while the backup is in progress. If verify is True, the backup is
+        checked with PRAGMA integrity_check and an OSError is raised if it fails.
+        progress is passed to sqlite3.Connection.backup.
+    """
+    with contextlib.closing(sqlite3.connect(str(target))) as destination:
+        connection.backup(destination, pages = pages, progress = progress)
+        if verify:
+            result = destination.execute("""PRAGMA integrity_check;""").fetchall()
+            if result != [("ok",)]:
+                raise OSError(f"Database backup failed integrity check: {result}")
+
+def backupdatabase(filename, pages = BACKUPPAGES, verify = True, keep = None, maxage = None): ## Tested- GeneralDatabase, BackupCase
+    """ Creates a backup of the database named "backup_{timecode}_{filename}" in the database directory. Returns the backup's filepath as a pathlib.Path instance.
+
+        The backup is made online with the SQLite backup API (see backupconnection), so it is consistent even
+        if another connection is writing to the database, and is verified with PRAGMA integrity_check if verify
+        is True. Files which are not SQLite databases (e.g.- placeholder files) are copied and compared instead.
+        If keep or maxage are provided, older backups are removed afterwards (see rotatebackups).
+    """
     dbfile = (filestructure.DATABASEPATH / filename).resolve()
     if not dbfile.exists():
         raise ValueError("File does not exist in the database directory.")
-    timecode = time.time()
-    backup  = dbfile.parent / f"backup_{timecode}_{filename}"
-    while backup.exists():
-        timecode = time.time()
-        backup = dbfile.parent / f"backup_{timecode}_{dbfile.name}"
-    shutil.copy2(str(dbfile), str(backup))
+    backup = _newbackupfile(dbfile)
+    if isdatabasefile(dbfile):
+        try:
+            with contextlib.closing(connectreadonly(dbfile)) as connection:
+                backupconnection(connection, backup, pages = pages, verify = verify)
+        except:
+            if backup.exists(): backup.unlink()
+            raise
+    else:
+        shutil.copy2(str(dbfile), str(backup))
+        filecmp.clear_cache()
+        if not filecmp.cmp(str(dbfile),str(backup), shallow = False):
+            raise OSError("Database backup not identical to original")
     if not backup.exists():
         raise FileNotFoundError(f"Failed to backup database")
-    filecmp.clear_cache()
-    if not filecmp.cmp(str(dbfile),str(backup), shallow = False):
-        raise OSError("Database backup not identical to original")
+    if keep is not None or maxage is not None:
+        rotatebackups(filename, keep = keep, maxage = maxage)
     return backup
 
+def listbackups(filename):
+    """ Returns a list of (timecode, filepath) for the backups of the database (see backupdatabase), newest first """
+    dbfile = (filestructure.DATABASEPATH / filename).resolve()
+    backups = []
+    for file in dbfile.parent.glob(f"backup_*_{dbfile.name}"):
+        match = BACKUPRE.match(file.name)
+        if match and match.group("filename") == dbfile.name:
+            backups.append((float(match.group("timecode")), file))
+    return sorted(backups, key = lambda backup: backup[0], reverse = True)
+
+def rotatebackups(filename, keep = None, maxage = None):
+    """ Removes old backups of the database and returns a list of the removed files.
+
+        If keep is provided, only the newest keep backups are retained. If maxage (in seconds) is provided,
+        backups older than maxage are removed.
+    """
+    removed = []
+    now = time.time()
+    for i,(timecode, file) in enumerate(listbackups(filename)):
+        if (keep is not None and i >= keep) or (maxage is not None and now - timecode > maxage):
+            file.unlink()
+            removed.append(file)
+    return removed
+
+################## Snapshots
+""" The snapshot store keeps deduplicated copies of databases.
+
+A snapshot's database image is split into chunks of SNAPSHOTPAGES pages which are stored once each in
+"chunks/" (named by their sha256 hash) and the snapshot itself is recorded as a json manifest in "manifests/"
+listing its chunks in order. As unchanged pages produce identical chunks, each snapshot after the first only
+stores the chunks that changed.
+"""
+SNAPSHOTPATH = filestructure.DATABASEPATH / "snapshots"
+## Number of database pages per chunk
+SNAPSHOTPAGES = 16
+## Manifests with a different version cannot be restored
+SNAPSHOTVERSION = 1
+
+def _snapshotstore(store = None):
+    """ Returns the chunk and manifest directories of the snapshot store (creating them if necessary) """
+    store = pathlib.Path(store) if store is not None else SNAPSHOTPATH
+    chunks, manifests = store / "chunks", store / "manifests"
+    chunks.mkdir(parents = True, exist_ok = True)
+    manifests.mkdir(parents = True, exist_ok = True)
+    return chunks, manifests
+
+def _chunkfile(chunks, digest):
+    return chunks / digest[:2] / digest
+
+def _writeatomic(file, data):
+    """ Writes the bytes to the file via a temporary file so that partially written files are never left behind """
+    file.parent.mkdir(parents = True, exist_ok = True)
+    temp = file.with_name(f".{file.name}.tmp")
+    temp.write_bytes(data)
+    temp.replace(file)
+
+def getpagesize(file):
+    """ Returns the page size recorded in the header of an SQLite database file (None if the file does not have a header) """
+    with open(file,'rb') as f:
+        header = f.read(100)
+    if len(header) < 100 or not header.startswith(SQLITEHEADER): return None
+    pagesize = struct.unpack(">H", header[16:18])[0]
+    ## A value of 1 represents 65536
+    return 65536 if pagesize == 1 else pagesize
+
+@contextlib.contextmanager
+def _snapshotimage(connection):
+    """ Yields the page size and a binary file object containing a consistent image of the connection's database.
+
+        The image is streamed from the backup API into an in-memory database and read from there, so
+        nothing is written to disk (the image is still held in memory). sqlite3.Connection.serialize
+        requires Python 3.11: on older versions the image is made in a temporary file instead.
+    """
+    with contextlib.closing(sqlite3.connect(":memory:")) as image:
+        if hasattr(image, "serialize"):
+            connection.backup(image)
+            pagesize = image.execute("PRAGMA page_size;").fetchone()[0]
+            yield pagesize, io.BytesIO(image.serialize())
+            return
+    with tempfile.TemporaryDirectory() as directory:
+        file = pathlib.Path(directory) / "snapshot.sqlite"
+        backupconnection(connection, file)
+        with open(file,'rb') as f:
+            yield getpagesize(file) or 4096, f
+
+def snapshot(connection, store = None, pages = SNAPSHOTPAGES, name = None)-> dict:
+    """ Adds a snapshot of the connection's database to the snapshot store and returns its manifest.
+
+        A consistent image of the database is made with the backup API (see _snapshotimage) and split
+        into chunks of pages pages; only chunks which are not already in the store are written.
+        name is recorded in the manifest (by default, the database's file name).
+        The manifest is a dict with keys version, id, database, created, pagesize, size, chunks (a list of
+        chunk hashes) and newchunks (the number of chunks that had to be written).
+    """
+    chunks, manifests = _snapshotstore(store)
+    if name is None:
+        file = getdatabasefile(connection)
+        name = file.name if file else ":memory:"
+    created = time.time()
+    snapshotid = f"{created:.6f}"
+    while (manifests / f"{snapshotid}.json").exists():
+        created = time.time()
+        snapshotid = f"{created:.6f}"
+
+    hashes, newchunks, size = [], 0, 0
+    with _snapshotimage(connection) as (pagesize, f):
+        for chunk in iter(lambda: f.read(pagesize * pages), b""):
+            digest = hashlib.sha256(chunk).hexdigest()
+            chunkfile = _chunkfile(chunks, digest)
+            if not chunkfile.exists():
+                _writeatomic(chunkfile, chunk)
+                newchunks += 1
+            hashes.append(digest)
+            size += len(chunk)
+
+    manifest = dict(version = SNAPSHOTVERSION, id = snapshotid, database = name, created = created, pagesize = pagesize,
+                    size = size, chunks = hashes, newchunks = newchunks)
+    _writeatomic(manifests / f"{snapshotid}.json", json.dumps(manifest).encode())
+    return manifest
+
+def load_snapshot(snapshotid, store = None)-> dict:
+    """ Returns the manifest of the given snapshot """
+    chunks, manifests = _snapshotstore(store)
+    file = manifests / f"{snapshotid}.json"
+    if not file.exists():
+        raise ValueError(f"Snapshot does not exist: {snapshotid}")
+    with open(file,'r') as f:
+        return json.load(f)
+
+def list_snapshots(store = None, database = None)-> list:
+    """ Returns the manifests of the snapshots in the store (only those of the given database name, if provided), newest first """
+    chunks, manifests = _snapshotstore(store)
+    out = []
+    for file in manifests.glob("*.json"):
+        with open(file,'r') as f:
+            manifest = json.load(f)
+        if database is None or manifest['database'] == database:
+            out.append(manifest)
+    return sorted(out, key = lambda manifest: manifest['created'], reverse = True)
+
+def restore_snapshot(snapshotid, target, store = None, overwrite = False)-> pathlib.Path:
+    """ Rebuilds the snapshot's database at target and returns target's filepath.
+
+        target can be a file name in the database directory or a path. Raises FileExistsError if target
+        exists and overwrite is not True. Each chunk is verified against its hash while it is read.
+        Any -wal, -shm or -journal files left beside an overwritten target are removed before it is replaced,
+        as SQLite would otherwise apply them to the restored database; target should not be open elsewhere.
+    """
+    manifest = load_snapshot(snapshotid, store)
+    if manifest['version'] != SNAPSHOTVERSION:
+        raise ValueError(f"Unsupported snapshot version: {manifest['version']}")
+    chunks, manifests = _snapshotstore(store)
+    target = (filestructure.DATABASEPATH / target).resolve()
+    if target.exists() and overwrite is not True:
+        raise FileExistsError("Target already exists!")
+    temp = target.with_name(f".{target.name}.restore")
+    try:
+        with open(temp,'wb') as f:
+            for digest in manifest['chunks']:
+                chunk = _chunkfile(chunks, digest).read_bytes()
+                if hashlib.sha256(chunk).hexdigest() != digest:
+                    raise OSError(f"Snapshot chunk is corrupt: {digest}")
+                f.write(chunk)
+        if temp.stat().st_size != manifest['size']:
+            raise OSError("Restored snapshot does not match the snapshot's size")
+        for suffix in ["-wal","-shm","-journal"]:
+            sidecar = target.with_name(target.name + suffix)
+            if sidecar.exists(): sidecar.unlink()
+        temp.replace(target)
+    finally:
+        if temp.exists(): temp.unlink()
+    return target
+
+def delete_snapshot(snapshotid, store = None)-> int:
+    """ Removes the snapshot and any chunks which are not used by other snapshots; returns the number of chunks removed """
+    manifest = load_snapshot(snapshotid, store)
+    chunks, manifests = _snapshotstore(store)
+    (manifests / f"{snapshotid}.json").unlink()
+    inuse = set()
+    for other in list_snapshots(store):
+        inuse.update(other['chunks'])
+    removed = 0
+    for digest in set(manifest['chunks']) - inuse:
+        chunkfile = _chunkfile(chunks, digest)
+        if chunkfile.exists():
+            chunkfile.unlink()
+            removed += 1
+    return removed
+
 def connectdatabase(db): ## Tested- SetupNewDatabase
     """ The general connection method for databases. Takes the database's file name. """
     try:
@@ -193,6 +527,176 @@ def connectdatabase(db): ## Tested- SetupNewDatabase
     else:
         return conn
 
+def connectreadonly(db, check_same_thread = True):
+    """ Opens a read-only connection (using the mode=ro uri parameter) to a database. Takes the database's file path (not only its name, see getdatabasefile) """
+    try:
+        db = pathlib.Path(db).resolve()
+        assert db.exists()
+        conn = sqlite3.connect(f"{db.as_uri()}?mode=ro", uri = True, check_same_thread = check_same_thread)
+    except Exception as e:
+        raise FileNotFoundError(f"Could not open Database: {str(e)}")
+    else:
+        return conn
+
+@row_factory_saver
+def getdatabasefile(connection):
+    """ Returns the file path of the connection's main database, or None if it is not stored in a file (i.e.- :memory:) """
+    for (seq, name, file) in connection.execute("""PRAGMA database_list;""").fetchall():
+        if name == "main" and file:
+            return pathlib.Path(file)
+    return None
+
+################## Connection Pooling
+## Pragmas applied to each connection handed out by a ConnectionManager
+## (journal_mode is persistent and is only set by read-write connections)
+DEFAULTPRAGMAS = dict(journal_mode = "WAL", synchronous = "NORMAL", foreign_keys = "ON", busy_timeout = 5000,
+                      cache_size = -64000, mmap_size = 268435456, temp_store = "MEMORY")
+
+def applypragmas(connection, pragmas, readonly = False):
+    """ Applies a mapping of {pragma: value} to the connection (pragmas which would write to the database are skipped if readonly is True) """
+    for pragma,value in pragmas.items():
+        if readonly and pragma == "journal_mode": continue
+        connection.execute(f"""PRAGMA {pragma} = {value};""").fetchall()
+
+class ConnectionManager():
+    """ Pools database connections per database file.
+
+        Connections are handed out with connection(db, readonly) (or the reader/writer shortcuts), which
+        should be used as a context manager. Each new connection has DEFAULTPRAGMAS applied (updated with
+        the supplied pragmas), so databases are switched to WAL mode: readers do not block the writer and
+        vice-versa. Read-only connections are opened with mode=ro (see connectreadonly). Read-write
+        connections of the same file are handed out one at a time (per process), so concurrent writers
+        wait for the pool instead of contending for the database lock.
+        When a connection is returned, any open transaction is rolled back and the connection is kept for
+        reuse (up to maxidle per database and mode). close closes all connections; connections which are
+        in use when the manager is closed are closed when they are returned.
+
+        db can be a file name in the database directory (as with connectdatabase) or a path.
+    """
+    def __init__(self, pragmas = None, maxidle = 4):
+        self.pragmas = dict(DEFAULTPRAGMAS, **(pragmas or {}))
+        self.maxidle = maxidle
+        self.closed = False
+        self._lock = threading.Lock()
+        ## {(file, readonly): [connections]}
+        self._idle = collections.defaultdict(list)
+        ## {file: lock}
+        self._writelocks = collections.defaultdict(threading.RLock)
+        self._inuse = set()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def getfile(self, db)-> pathlib.Path:
+        """ Resolves the database file for db """
+        if db == ":memory:":
+            raise ValueError("In-memory databases cannot be pooled")
+        return (filestructure.DATABASEPATH / db).resolve()
+
+    def _connect(self, file, readonly):
+        if readonly:
+            connection = connectreadonly(file, check_same_thread = False)
+        else:
+            if not file.exists():
+                raise FileNotFoundError(f"Could not open Database: {file} does not exist")
+            connection = sqlite3.connect(str(file), check_same_thread = False)
+        applypragmas(connection, self.pragmas, readonly = readonly)
+        return connection
+
+    def acquire(self, db, readonly = False)-> sqlite3.Connection:
+        """ Returns a pooled connection to the database (see connection). Connections should be returned with release. """
+        file = self.getfile(db)
+        if not readonly:
+            self._writelocks[file].acquire()
+        try:
+            with self._lock:
+                if self.closed:
+                    raise RuntimeError("ConnectionManager is closed")
+                idle = self._idle[(file, readonly)]
+                connection = idle.pop() if idle else None
+            if connection is None:
+                connection = self._connect(file, readonly)
+            with self._lock:
+                self._inuse.add((connection, file, readonly))
+        except:
+            if not readonly: self._writelocks[file].release()
+            raise
+        return connection
+
+    def release(self, connection):
+        """ Returns a connection to the pool """
+        with self._lock:
+            entry = next(entry for entry in self._inuse if entry[0] is connection)
+            self._inuse.remove(entry)
+            connection, file, readonly = entry
+            idle = self._idle[(file, readonly)]
+            keep = not self.closed and len(idle) < self.maxidle
+        try:
+            if keep:
+                if connection.in_transaction: connection.rollback()
+                ## Row factories are per-use
+                connection.row_factory = None
+                with self._lock: idle.append(connection)
+            else:
+                connection.close()
+        finally:
+            if not readonly: self._writelocks[file].release()
+
+    @contextlib.contextmanager
+    def connection(self, db, readonly = False):
+        """ A context manager which provides a pooled connection to the database and returns it to the pool afterwards """
+        connection = self.acquire(db, readonly = readonly)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def reader(self, db):
+        """ Shortcut for connection(db, readonly = True) """
+        return self.connection(db, readonly = True)
+
+    def writer(self, db):
+        """ Shortcut for connection(db, readonly = False) """
+        return self.connection(db, readonly = False)
+
+    def close(self):
+        """ Closes all idle connections; connections currently in use are closed when they are released """
+        with self._lock:
+            self.closed = True
+            idle = [connection for connections in self._idle.values() for connection in connections]
+            self._idle.clear()
+        for connection in idle:
+            connection.close()
+
+_CONNECTIONMANAGER = None
+def getconnectionmanager()-> ConnectionManager:
+    """ Returns the shared ConnectionManager (it is created on first use, replaced if it has been closed, and closed when the interpreter exits) """
+    global _CONNECTIONMANAGER
+    if _CONNECTIONMANAGER is None or _CONNECTIONMANAGER.closed:
+        _CONNECTIONMANAGER = ConnectionManager()
+    return _CONNECTIONMANAGER
+
+@atexit.register
+def _closeconnectionmanager():
+    """ Closes the shared ConnectionManager (registered once, so replacing the manager does not add exit hooks) """
+    if _CONNECTIONMANAGER is not None: _CONNECTIONMANAGER.close()
+
+@contextlib.contextmanager
+def pooledconnection(db, readonly = False):
+    """ A context manager which provides a connection for db.
+
+        If db is a database file (a file name in the database directory or a path: see ConnectionManager.getfile),
+        a connection is borrowed from the shared ConnectionManager for the duration of the context.
+        Otherwise db should be a connection, which is provided as-is.
+    """
+    if not isinstance(db, (str, os.PathLike)):
+        yield db
+        return
+    with getconnectionmanager().connection(db, readonly = readonly) as connection:
+        yield connection
+
 def getdefaultdatabase(configuration = None, create = False): ## Partially Tested- NoDatabase
     """ Returns a connection object for the default database.
     
@@ -278,8 +782,9 @@ def getdbstats(configuration): ## General Database
         except:
             out.append(dict(name=db, recent = recent, valid = False))
         else:
+            conn.close()
             out.append(dict(name=db, recent = recent, valid = True))
-    return sorted(out, lambda db: db['recent'], reverse = True)
+    return sorted(out, key = lambda db: db['recent'], reverse = True)
 
 def loadtables(module,configuration, connection, version = True, missing = True, different = True):
     """ Checks all tables across all apps
@@ -287,21 +792,28 @@ def loadtables(module,configuration, connection, version = True, missing = True,
     configuration should be the sql module's configuration file.
     connection is a database connection.
     If version is True (default), any tables that are of the wrong version- and for
-    which an upgrade path is available- will be updated according to the upgrade path.
+    which an upgrade path is available- will be updated according to the upgrade path
+    (see migrateapp); missing and different are checked against the upgraded tables.
     If missing is True (default), any tables defined by the app's sql config will be
     automatically added. Otherwise, an AttributeError will be raised.
     It is recommmended that you back up the database before running this method if
     version, missing or different are True.
+    Once the app's tables pass checktables, their fingerprint is stored (see storefingerprint).
     """
     tablecheck = checktables(connection,configuration)
+    ## Migrate before checking missing and different, since an outdated app's tables differ until they are upgraded
+    if version is True and tablecheck.version is False and configuration.get("updates"):
+        migrateapp(connection, configuration)
+        tablecheck = checktables(connection,configuration)
     if not version is True and not tablecheck.version :
         raise IntegrityError(f"App version mismatch!")
     if not missing is True and tablecheck.missing:
         raise IntegrityError(f"Database missing tables: {','.join([table['name'] for table in tablecheck.missing])}")
     if not different is True and tablecheck.different:
         raise IntegrityError(f"Database tables differ: {','.join([table['name'] for table in tablecheck.different])}")
-    sqlfile = loadmodulesql(configuration['appname'])
     setup = configuration.get("setup")
+    ## The app's sql module is only needed to setup missing tables
+    sqlfile = loadmodulesql(configuration['appname']) if setup and tablecheck.missing else None
     for table in tablecheck.missing:
         tablesetup = setuptable(configuration,connection,table)
         if setup and table['name'] in setup:
@@ -309,11 +821,19 @@ def loadtables(module,configuration, connection, version = True, missing = True,
             for metho in meths:
                 meth = getattr(sqlfile,metho)
                 meth(connection)
+    if tablecheck.missing:
+        tablecheck = checktables(connection,configuration)
+    if _checkpassed(tablecheck, configuration) and not matchesfingerprint(connection, configuration) and hasfingerprints(connection):
+        storefingerprint(connection, configuration)
     connection.commit()
 
 def loadcoretables(connection):
-    """ Executes the loadtables procedure, but for the Core App and using version and missing flags, but not different """
+    """ Executes the loadtables procedure, but for the Core App and using version and missing flags, but not different.
+
+        The table of stored fingerprints is created first (see createfingerprinttable).
+    """
     module,config = loadapp("Core")
+    createfingerprinttable(connection)
     loadtables(module,config,connection,missing=True,version=True, different = False)
 
 def loadapp(app):
@@ -341,10 +861,172 @@ def loadmodulesql(app):
     except:
         return None
 
+################## Migrations
+
+## Suffix for the temporary name of tables being rebuilt
+MIGRATIONSUFFIX = "_migration"
+
+MigrationStep = collections.namedtuple("migrationstep","app, fromversion, toversion, step, rows, seconds")
+MigrationResults = collections.namedtuple("migrationresults","app, fromversion, toversion, steps, seconds")
+
+def resolveupdates(configuration, version)-> list:
+    """ Returns the chain of updates from version to the configuration's version as a list of (fromversion, toversion, steps).
+
+        Versions are compared as strings. The first entry in the configuration's "updates" whose pattern matches
+        (using fnmatch) is used for each version. Raises an IntegrityError if there is no upgrade path.
+    """
+    target = str(configuration.get('version'))
+    updates = configuration.get('updates') or {}
+    chain, current, seen = [], str(version), set()
+    while current != target:
+        if current in seen:
+            raise IntegrityError(f"Upgrade path for {configuration['appname']} loops at version {current}")
+        seen.add(current)
+        for pattern,update in updates.items():
+            if fnmatch.fnmatchcase(current, str(pattern)): break
+        else:
+            raise IntegrityError(f"No upgrade path for {configuration['appname']} from version {current} to {target}")
+        if isinstance(update, dict):
+            toversion, steps = str(update.get('version',target)), update.get('steps',[])
+        else:
+            toversion, steps = target, update
+        chain.append((current, toversion, list(steps)))
+        current = toversion
+    return chain
+
+@contextlib.contextmanager
+def migrationtransaction(connection):
+    """ A context manager which runs the enclosed statements (including CREATE/DROP/ALTER TABLE) in a single transaction.
+
+        Following SQLite's procedure for altering tables, foreign key enforcement is disabled (and foreign_keys is
+        deferred for steps which reenable it) and PRAGMA foreign_key_check is run before committing: an IntegrityError
+        is raised and the transaction is rolled back if any foreign keys are violated. legacy_alter_table is enabled so
+        that renaming a table does not rewrite the references to it in other tables and views.
+        Raises an IntegrityError if the connection is already in a transaction.
+    """
+    if connection.in_transaction:
+        raise IntegrityError("Cannot migrate while the connection is in a transaction")
+    isolation_level = connection.isolation_level
+    pragmas = {pragma: connection.execute(f"""PRAGMA {pragma};""").fetchone()[0] for pragma in ["foreign_keys","legacy_alter_table"]}
+    connection.isolation_level = None
+    try:
+        connection.execute("""PRAGMA foreign_keys = OFF;""")
+        connection.execute("""PRAGMA legacy_alter_table = ON;""")
+        connection.execute("""BEGIN;""")
+        try:
+            connection.execute("""PRAGMA defer_foreign_keys = ON;""")
+            yield connection
+            violations = connection.execute("""PRAGMA foreign_key_check;""").fetchall()
+            if violations:
+                raise IntegrityError(f"Migration violates foreign keys: {violations[:10]}")
+            connection.execute("""COMMIT;""")
+        except:
+            connection.execute("""ROLLBACK;""")
+            raise
+    finally:
+        for pragma,value in pragmas.items():
+            connection.execute(f"""PRAGMA {pragma} = {int(value)};""")
+        connection.isolation_level = isolation_level
+
+@row_factory_saver
+def rebuildtable(connection, configuration, tablename, columns = None)-> int:
+    """ Rebuilds the table using its creation sql in the configuration, returning the number of rows copied.
+
+        The existing table is renamed and its rows are copied into the new table with a single INSERT INTO ... SELECT
+        statement: columns which exist in both tables are copied as-is, and columns may be supplied as a mapping of
+        {column: sql expression} (evaluated against the existing table) to fill or override columns in the new table.
+        The table's indexes and triggers are recreated afterwards. If the table does not exist it is simply created.
+        This function should be run inside of migrationtransaction.
+    """
+    table = [table for table in configuration['tables'] if table['name'] == tablename]
+    if not table: raise ValueError(f"Table is not defined in the configuration: {tablename}")
+    table = table[0]
+    if tablename not in getdatabasetables(connection):
+        setuptable(configuration, connection, table)
+        return 0
+    temp = f"{tablename}{MIGRATIONSUFFIX}"
+    ## Autoindexes do not have sql and are recreated with the table
+    dependents = connection.execute("""SELECT sql FROM sqlite_master WHERE type IN ('index','trigger') AND tbl_name = :tablename AND sql IS NOT NULL;""",dict(tablename = tablename)).fetchall()
+    connection.execute(f"""ALTER TABLE "{tablename}" RENAME TO "{temp}";""")
+    setuptable(configuration, connection, table)
+    oldcolumns = [column[1] for column in connection.execute(f"""PRAGMA table_info("{temp}");""")]
+    newcolumns = [column[1] for column in connection.execute(f"""PRAGMA table_info("{tablename}");""")]
+    selects = {column:f'"{column}"' for column in newcolumns if column in oldcolumns}
+    if columns: selects.update(columns)
+    rows = 0
+    if selects:
+        rows = connection.execute(f"""INSERT INTO "{tablename}" ({", ".join(f'"{column}"' for column in selects)})
+            SELECT {", ".join(selects.values())} FROM "{temp}";""").rowcount
+    connection.execute(f"""DROP TABLE "{temp}";""")
+    for (sql,) in dependents:
+        connection.execute(sql)
+    return rows
+
+def _runmigrationstep(connection, configuration, step, sqlfile)-> int|None:
+    """ Runs a single step from the configuration's "updates", returning the number of rows copied by rebuild steps """
+    if isinstance(step, dict):
+        return rebuildtable(connection, configuration, step['rebuild'], step.get('columns'))
+    method = getattr(sqlfile, step, None)
+    if method is None:
+        raise AttributeError(f"{configuration['appname']} sql module does not have upgrade method: {step}")
+    method(connection)
+    return None
+
+@row_factory_saver
+def migrateapp(connection, configuration, progress = None)-> MigrationResults:
+    """ Upgrades the app's tables from the version registered in installed_apps to the configuration's version.
+
+        The upgrade chain is resolved with resolveupdates and all steps are run in a single migrationtransaction;
+        afterwards the app's version is updated in installed_apps, stored schema fingerprints are cleared and,
+        if the upgraded tables pass checktables, the app's fingerprint is stored.
+        Methods named in "updates" are taken from the app's sql module, are passed the connection, and must not commit.
+        progress, if supplied, is called with the MigrationStep for each step as it finishes.
+        Returns a MigrationResults namedtuple whose steps are the MigrationSteps (which include each step's duration in seconds).
+        Raises an IntegrityError if the app is not installed or there is no upgrade path.
+    """
+    appname = configuration['appname']
+    installed = connection.execute("""SELECT version FROM "installed_apps" WHERE module = :appname;""",dict(appname = appname)).fetchone()
+    if not installed:
+        raise IntegrityError(f"App is not installed: {appname}")
+    chain = resolveupdates(configuration, installed[0])
+    results, start = [], time.perf_counter()
+    if not chain:
+        return MigrationResults(appname, installed[0], configuration.get('version'), results, 0.0)
+    ## Only load the sql module if it is needed
+    sqlfile = loadmodulesql(appname) if any(not isinstance(step, dict) for (_,_,steps) in chain for step in steps) else None
+    with migrationtransaction(connection):
+        for fromversion,toversion,steps in chain:
+            for step in steps:
+                stepstart = time.perf_counter()
+                rows = _runmigrationstep(connection, configuration, step, sqlfile)
+                result = MigrationStep(appname, fromversion, toversion, step, rows, time.perf_counter() - stepstart)
+                results.append(result)
+                if progress: progress(result)
+        connection.execute("""UPDATE "installed_apps" SET version = :version WHERE module = :appname;""",dict(version = configuration['version'], appname = appname))
+        clearfingerprints(connection)
+        if hasfingerprints(connection) and _checkpassed(checktables(connection, configuration), configuration):
+            storefingerprint(connection, configuration)
+    return MigrationResults(appname, installed[0], configuration['version'], results, time.perf_counter() - start)
+
+@row_factory_saver
+def migrate(connection, apps = None, progress = None)-> list:
+    """ Runs migrateapp for each of the given apps (default, all apps in installed_apps which are available), returning a list of MigrationResults.
+
+        Each app is upgraded in its own transaction. progress is passed to migrateapp.
+    """
+    if apps is None:
+        apps = [app for (app,) in connection.execute("""SELECT module FROM "installed_apps";""").fetchall()]
+    results = []
+    for app in apps:
+        module,configuration = loadapp(app)
+        if not module: continue
+        results.append(migrateapp(connection, configuration, progress = progress))
+    return results
+
 @row_factory_saver
 def getdatabasetables(connection):
     """ A simple function to return a list of tables in the provided database. Returns a mapping {tablename:table creation sql} """
-    dbtables = connection.execute("""SELECT tbl_name,sql FROM sqlite_master where type = "table" AND name NOT LIKE "sqlite_%";""").fetchall()
+    dbtables = connection.execute(f"""SELECT tbl_name,sql FROM sqlite_master where type = "table" AND name NOT LIKE "sqlite_%" AND name != '{FINGERPRINTTABLE}';""").fetchall()
     return {db[0]: db[1] for db in dbtables}
 
 def main(connection, userid = None, different = False, version = True, missing = True):
@@ -8,7 +8,11 @@ import hashlib
 import filecmp
 import json
 import pathlib
+import shutil
 import sqlite3
+import tempfile
+import types
+from unittest import mock
 ## This Module
 from aldb2 import filestructure
 from aldb2.Core import tests
@@ -118,6 +122,165 @@ class GeneralDatabase(unittest.TestCase):
         self.assertTrue(isinstance(conn,sqlite3.Connection))
 
 
+class BackupCase(unittest.TestCase):
+    """ Tests backups of SQLite databases """
+    def setUp(self):
+        tests.setuptestfile(self)
+        conn = sqlite3.connect(str(self.testfile))
+        conn.execute("CREATE TABLE test (value INT);")
+        conn.executemany("INSERT INTO test VALUES (?);", [(i,) for i in range(1000)])
+        conn.commit()
+        conn.close()
+        return super().setUp()
+
+    def backup(self, **kw):
+        backup = util.backupdatabase(self.testfile.name, **kw)
+        self.addCleanup(tests.unlinkfile, backup)
+        return backup
+
+    def test_backupdatabase(self):
+        """ Tests that backupdatabase creates a copy of the database with the backup API """
+        backup = self.backup(pages = 1)
+        conn = sqlite3.connect(str(backup))
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM test;").fetchone()[0], 1000)
+
+    def test_rotatebackups(self):
+        """ Tests that only the newest backups are retained """
+        backups = [self.backup() for i in range(3)]
+        backup = self.backup(keep = 2)
+        self.assertEqual([file for timecode,file in util.listbackups(self.testfile.name)], [backup, backups[-1]])
+        self.assertFalse(any(file.exists() for file in backups[:2]))
+
+class SnapshotCase(unittest.TestCase):
+    """ Tests the deduplicated snapshot store """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = pathlib.Path(directory.name)
+        self.connection = sqlite3.connect(":memory:")
+        self.addCleanup(self.connection.close)
+        self.connection.execute("CREATE TABLE test (value TEXT);")
+        self.connection.executemany("INSERT INTO test VALUES (?);", [(str(i)*50,) for i in range(5000)])
+        self.connection.commit()
+        return super().setUp()
+
+    def test_deduplication(self):
+        """ Tests that a second snapshot only stores the changed chunks """
+        first = util.snapshot(self.connection, store = self.store)
+        self.connection.execute("UPDATE test SET value = 'changed' WHERE rowid = 1;")
+        self.connection.commit()
+        second = util.snapshot(self.connection, store = self.store)
+        self.assertEqual(first['newchunks'], len(first['chunks']))
+        self.assertLess(second['newchunks'], len(second['chunks']) / 2)
+        self.assertEqual([manifest['id'] for manifest in util.list_snapshots(self.store)], [second['id'], first['id']])
+
+    def test_restore_snapshot(self):
+        """ Tests that restore_snapshot rebuilds the database """
+        manifest = util.snapshot(self.connection, store = self.store)
+        target = util.restore_snapshot(manifest['id'], self.store / "restored.sqlite", store = self.store)
+        conn = sqlite3.connect(str(target))
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("SELECT * FROM test;").fetchall(), self.connection.execute("SELECT * FROM test;").fetchall())
+        self.assertRaises(FileExistsError, util.restore_snapshot, manifest['id'], target, store = self.store)
+
+    def test_restore_snapshot_wal(self):
+        """ Tests that restoring over a database in WAL mode discards its -wal and -shm files """
+        manifest = util.snapshot(self.connection, store = self.store)
+        target = self.store / "target.sqlite"
+        ## Copy a WAL database while its changes are still in the -wal file (as if it had not been closed cleanly)
+        source = self.store / "source.sqlite"
+        conn = sqlite3.connect(str(source))
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA wal_autocheckpoint = 0;")
+        conn.execute("CREATE TABLE other (value INT);")
+        conn.executemany("INSERT INTO other VALUES (?);", [(i,) for i in range(100)])
+        conn.commit()
+        for suffix in ["","-wal","-shm"]:
+            shutil.copyfile(f"{source}{suffix}", f"{target}{suffix}")
+        conn.close()
+
+        util.restore_snapshot(manifest['id'], target, store = self.store, overwrite = True)
+        for suffix in ["-wal","-shm"]:
+            self.assertFalse(pathlib.Path(f"{target}{suffix}").exists())
+        conn = sqlite3.connect(str(target))
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("PRAGMA integrity_check;").fetchone()[0], "ok")
+        self.assertEqual(conn.execute("SELECT name FROM sqlite_master;").fetchall(), [("test",)])
+        self.assertEqual(conn.execute("SELECT * FROM test;").fetchall(), self.connection.execute("SELECT * FROM test;").fetchall())
+
+class ConnectionManagerCase(unittest.TestCase):
+    """ Tests the ConnectionManager connection pool """
+    def setUp(self):
+        ## Pooled connections use WAL mode, so the database is kept in a temporary directory
+        ## to clean up its -wal and -shm files along with it
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.testfile = pathlib.Path(directory.name) / "test.sqlite"
+        self.testfile.touch()
+        self.manager = util.ConnectionManager()
+        self.addCleanup(self.manager.close)
+        return super().setUp()
+
+    def test_pragmas(self):
+        """ Tests that pooled connections use WAL mode and the configured pragmas """
+        with self.manager.writer(self.testfile) as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode;").fetchone()[0].lower(), "wal")
+            self.assertEqual(conn.execute("PRAGMA foreign_keys;").fetchone()[0], 1)
+            conn.execute("CREATE TABLE test (value INT);")
+            conn.commit()
+        with self.manager.reader(self.testfile) as conn:
+            self.assertEqual(conn.execute("PRAGMA busy_timeout;").fetchone()[0], util.DEFAULTPRAGMAS['busy_timeout'])
+            self.assertRaises(sqlite3.OperationalError, conn.execute, "INSERT INTO test VALUES (1);")
+
+    def test_reuse(self):
+        """ Tests that released connections are reused and that uncommitted changes are rolled back """
+        with self.manager.writer(self.testfile) as conn:
+            conn.execute("CREATE TABLE test (value INT);")
+            conn.commit()
+            conn.execute("INSERT INTO test VALUES (1);")
+        with self.manager.writer(self.testfile) as conn2:
+            self.assertIs(conn, conn2)
+            self.assertEqual(conn2.execute("SELECT COUNT(*) FROM test;").fetchone()[0], 0)
+
+    def test_close(self):
+        """ Tests that close closes idle connections and connections that are released afterwards """
+        with self.manager.reader(self.testfile) as conn:
+            pass
+        with self.manager.writer(self.testfile) as conn2:
+            self.manager.close()
+        for connection in [conn, conn2]:
+            self.assertRaises(sqlite3.ProgrammingError, connection.execute, "SELECT 1;")
+        self.assertRaises(RuntimeError, self.manager.acquire, self.testfile)
+
+    def test_getconnectionmanager(self):
+        """ Tests that the shared ConnectionManager is replaced once closed without registering another exit hook """
+        self.addCleanup(setattr, util, "_CONNECTIONMANAGER", util._CONNECTIONMANAGER)
+        util._CONNECTIONMANAGER = None
+        with mock.patch.object(util.atexit, "register") as register:
+            manager = util.getconnectionmanager()
+            self.assertIs(util.getconnectionmanager(), manager)
+            manager.close()
+            replacement = util.getconnectionmanager()
+        self.assertIsNot(replacement, manager)
+        register.assert_not_called()
+        util._closeconnectionmanager()
+        self.assertTrue(replacement.closed)
+
+    def test_pooledconnection(self):
+        """ Tests that pooledconnection borrows a pooled connection for database files and passes connections through """
+        self.addCleanup(setattr, util, "_CONNECTIONMANAGER", util._CONNECTIONMANAGER)
+        util._CONNECTIONMANAGER = self.manager
+        with util.pooledconnection(str(self.testfile)) as conn:
+            self.assertIn((conn, self.testfile.resolve(), False), self.manager._inuse)
+        with util.pooledconnection(self.testfile, readonly = True) as conn2:
+            self.assertIn((conn2, self.testfile.resolve(), True), self.manager._inuse)
+        self.assertFalse(self.manager._inuse)
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        with util.pooledconnection(connection) as conn3:
+            self.assertIs(conn3, connection)
+
 class NoDatabase(unittest.TestCase):
     """ Tests functions that deal with no database """
 
@@ -186,6 +349,161 @@ class SetupNewDatabase(unittest.TestCase):
         coretables = util.coreconfig()['tables']
         self.assertEqual(len(result.missing),len(coretables))
 
+class FingerprintCase(unittest.TestCase):
+    """ Tests for the schema fingerprint used by checktables """
+    def setUp(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.addCleanup(self.connection.close)
+        util.loadcoretables(self.connection)
+        ## The Core configuration does not have a version
+        self.configuration = dict(util.coreconfig(), version = "1.0")
+        self.connection.execute("""INSERT INTO installed_apps (module, version) VALUES (:appname, :version);""",self.configuration)
+        self.connection.commit()
+        return super().setUp()
+
+    def test_checktables_readonly(self):
+        """ Tests that checktables does not store a fingerprint or otherwise modify the database """
+        schemaversion = util.getschemaversion(self.connection)
+        result = util.checktables(self.connection,self.configuration)
+        self.assertTrue(result.version)
+        self.assertFalse(util.matchesfingerprint(self.connection,self.configuration))
+        self.assertEqual(util.getschemaversion(self.connection),schemaversion)
+        self.assertFalse(self.connection.in_transaction)
+
+    def test_fingerprint(self):
+        """ Tests that loadtables stores a fingerprint once the tables pass, which is invalidated by schema changes """
+        self.assertFalse(util.matchesfingerprint(self.connection,self.configuration))
+        result = util.checktables(self.connection,self.configuration)
+        self.assertEqual(len(result.passed),len(self.configuration['tables']))
+        util.loadtables(None,self.configuration,self.connection)
+        self.assertTrue(util.matchesfingerprint(self.connection,self.configuration))
+        self.assertFalse(self.connection.in_transaction)
+        statements = []
+        self.connection.set_trace_callback(statements.append)
+        self.addCleanup(self.connection.set_trace_callback, None)
+        self.assertEqual(util.checktables(self.connection,self.configuration),result)
+        ## The fingerprint is checked with one query which does not read sqlite_master
+        ## (statements starting with "--" are traced from inside it)
+        statements = [statement for statement in statements if not statement.startswith("--")]
+        self.assertEqual(len(statements),1)
+        self.assertNotIn("sqlite_master",statements[0])
+
+        self.connection.execute("""CREATE TABLE unrelated (id INTEGER);""")
+        self.assertFalse(util.matchesfingerprint(self.connection,self.configuration))
+        self.assertEqual(util.checktables(self.connection,self.configuration),result)
+
+        ## Changing the registered version does not change the schema
+        util.loadtables(None,self.configuration,self.connection)
+        self.connection.execute("""UPDATE installed_apps SET version = "0.9" WHERE module = "Core";""")
+        self.assertFalse(util.matchesfingerprint(self.connection,self.configuration))
+        self.assertIs(util.checktables(self.connection,self.configuration).version,False)
+
+    def test_noversion(self):
+        """ Tests that configurations without a version (such as Core's) are fingerprinted while the app is not registered """
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        util.loadcoretables(connection)
+        configuration = util.coreconfig()
+        self.assertNotIn("version",configuration)
+        self.assertTrue(util.matchesfingerprint(connection,configuration))
+        self.assertEqual(util.checktables(connection,configuration),util.CheckTableResults(None,[],[],configuration['tables']))
+        connection.execute("""INSERT INTO installed_apps (module, version) VALUES ("Core","1.0");""")
+        self.assertFalse(util.matchesfingerprint(connection,configuration))
+        ## The versioned configuration does not match the version-less fingerprint
+        self.assertFalse(util.matchesfingerprint(self.connection,self.configuration))
+
+    def test_nofingerprinttable(self):
+        """ Tests that databases set up without loadcoretables are checked in full and are not fingerprinted """
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        configuration = util.coreconfig()
+        util.loadtables(None,configuration,connection)
+        self.assertFalse(util.hasfingerprints(connection))
+        self.assertFalse(util.matchesfingerprint(connection,configuration))
+        self.assertEqual(len(util.checktables(connection,configuration).passed),len(configuration['tables']))
+
+    def test_changedconfiguration(self):
+        """ Tests that the fingerprint does not hide changes to the configuration """
+        util.loadtables(None,self.configuration,self.connection)
+        configuration = json.loads(json.dumps(self.configuration))
+        configuration['tables'][0]['sql'] += " "
+        result = util.checktables(self.connection,configuration)
+        self.assertEqual(result.different,[configuration['tables'][0]])
+
+class MigrationCase(unittest.TestCase):
+    """ Tests for upgrading app tables with the sql configuration's "updates" """
+    def setUp(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.addCleanup(self.connection.close)
+        util.loadcoretables(self.connection)
+        self.connection.execute("""PRAGMA foreign_keys = ON;""")
+        self.connection.execute("""CREATE TABLE parent (parentid INTEGER PRIMARY KEY, name TEXT NOT NULL);""")
+        self.connection.execute("""CREATE INDEX parent_name ON parent(name);""")
+        self.connection.execute("""CREATE TABLE child (childid INTEGER PRIMARY KEY, parentid INT REFERENCES parent(parentid));""")
+        self.connection.executemany("""INSERT INTO parent (parentid, name) VALUES (?,?);""",[(1,"a"),(2,"b")])
+        self.connection.executemany("""INSERT INTO child (parentid) VALUES (?);""",[(1,),(2,),(2,)])
+        self.connection.execute("""INSERT INTO installed_apps (module, version) VALUES ("TestMigration","1.2");""")
+        self.connection.commit()
+        self.configuration = dict(appname = "TestMigration", version = "2.0",
+            tables = [dict(name = "parent", sql = """CREATE TABLE parent (parentid INTEGER PRIMARY KEY, name TEXT NOT NULL, label TEXT NOT NULL)"""),
+                      dict(name = "child", sql = """CREATE TABLE "child" (childid INTEGER PRIMARY KEY, parentid INT REFERENCES parent(parentid), position INT DEFAULT 0)""")],
+            updates = {"1.5": [dict(rebuild = "child")],
+                       "1.*": dict(version = "1.5", steps = [dict(rebuild = "parent", columns = dict(label = "upper(name)"))])})
+        return super().setUp()
+
+    def test_resolveupdates(self):
+        """ Tests that the upgrade chain follows intermediate versions and that a missing path raises an IntegrityError """
+        self.assertEqual([(fromversion,toversion) for (fromversion,toversion,steps) in util.resolveupdates(self.configuration,"1.2")],[("1.2","1.5"),("1.5","2.0")])
+        self.assertEqual(util.resolveupdates(self.configuration,"2.0"),[])
+        self.assertRaises(util.IntegrityError,util.resolveupdates,self.configuration,"0.9")
+
+    def test_migrateapp(self):
+        """ Tests that migrateapp rebuilds the tables, keeps their rows, indexes, and foreign keys, and updates the app version """
+        steps = []
+        result = util.migrateapp(self.connection,self.configuration, progress = steps.append)
+        self.assertEqual(result.steps,steps)
+        self.assertEqual([(step.toversion,step.rows) for step in steps],[("1.5",2),("2.0",3)])
+        self.assertTrue(all(step.seconds >= 0 for step in steps))
+        self.assertEqual(self.connection.execute("""SELECT * FROM parent;""").fetchall(),[(1,"a","A"),(2,"b","B")])
+        self.assertEqual(self.connection.execute("""SELECT parentid, position FROM child;""").fetchall(),[(1,0),(2,0),(2,0)])
+        self.assertTrue(self.connection.execute("""SELECT name FROM sqlite_master WHERE name = "parent_name";""").fetchone())
+        self.assertRaises(sqlite3.IntegrityError,self.connection.execute,"""INSERT INTO child (parentid) VALUES (3);""")
+        check = util.checktables(self.connection,self.configuration)
+        self.assertTrue(check.version)
+        self.assertEqual(len(check.passed),2)
+        self.assertTrue(util.matchesfingerprint(self.connection,self.configuration))
+
+    def test_main(self):
+        """ Tests that main (with its default arguments, which do not allow different tables) upgrades outdated apps """
+        self.configuration['updates'] = {"1.*": [dict(rebuild = "parent", columns = dict(label = "upper(name)")), dict(rebuild = "child")]}
+        loadapp = util.loadapp
+        def mockloadapp(app):
+            if app == self.configuration['appname']: return types.SimpleNamespace(), self.configuration
+            return loadapp(app)
+        ## main lists the installed apps with Core.sql's getinstalledapps (see Core.sql.admin), which Core.sql does not currently export
+        def getinstalledapps(connection):
+            return [dict(app = app, version = version) for (app, version) in connection.execute("""SELECT module, version FROM installed_apps;""")]
+        with mock.patch.object(util, "loadapp", mockloadapp), mock.patch.object(util.Core, "getinstalledapps", getinstalledapps, create = True):
+            result = util.main(self.connection)
+        self.assertIn(self.configuration['appname'], result['apps'])
+        self.assertEqual(self.connection.execute("""SELECT * FROM parent;""").fetchall(),[(1,"a","A"),(2,"b","B")])
+        self.assertEqual(self.connection.execute("""SELECT version FROM installed_apps WHERE module = "TestMigration";""").fetchone(),("2.0",))
+        self.assertTrue(util.matchesfingerprint(self.connection,self.configuration))
+
+    def test_loadtables_nopath(self):
+        """ Tests that an outdated app without an upgrade path is still rejected when different tables are not allowed """
+        self.configuration['updates'] = {"3.*": [dict(rebuild = "parent")]}
+        self.assertRaises(util.IntegrityError,util.loadtables,None,self.configuration,self.connection,different = False)
+        self.assertEqual(self.connection.execute("""SELECT version FROM installed_apps WHERE module = "TestMigration";""").fetchone(),("1.2",))
+
+    def test_migrateapp_rollback(self):
+        """ Tests that a failed migration leaves the database unchanged """
+        self.configuration['updates']["1.*"]['steps'][0]['columns'] = dict(label = "NULL")
+        self.assertRaises(sqlite3.IntegrityError,util.migrateapp,self.connection,self.configuration)
+        self.assertEqual(util.getdatabasetables(self.connection)['parent'],"""CREATE TABLE parent (parentid INTEGER PRIMARY KEY, name TEXT NOT NULL)""")
+        self.assertEqual(self.connection.execute("""SELECT version FROM installed_apps WHERE module = "TestMigration";""").fetchone(),("1.2",))
+        self.assertEqual(self.connection.execute("""PRAGMA foreign_keys;""").fetchone(),(1,))
+
 class LoadDatabaseCase(unittest.TestCase):
     """ Tests for loading an existing database """
     def setUp(self):
@@ -0,0 +1,149 @@
+""" aldb2.RecordReader.bookchecker
+
+    Reports how the formulas of the Ranking Tables have changed between Record versions.
+
+    Each Record's formula signature (the formulas in the first row of its Week 1 Table) is read
+    with RecordReader.streaming.DirectReader and cached by the Record's sha256 hash, so only new or
+    changed Records are parsed on subsequent runs. Records are then sorted by version and the
+    signatures are compared to report columns which were added, changed, or removed.
+"""
+
+## Builtin
+import concurrent.futures
+import json
+import pathlib
+import typing
+import warnings
+
+## This Module
+from aldb2.Anime import anime
+from aldb2.RecordReader import cache, classes, streaming
+
+## Name of the signature cache (saved in the Record cache directory)
+SIGNATURESNAME = "formulasignatures.json"
+## Signature caches with a different version are discarded
+SIGNATURESVERSION = 1
+
+def getsignaturesfile(cachedir: str|pathlib.Path|None = None)-> pathlib.Path:
+    """ Returns the location of the signature cache """
+    if cachedir is None: cachedir = cache.DEFAULTCACHEDIR
+    return pathlib.Path(cachedir) / SIGNATURESNAME
+
+def load_signatures(file: str|pathlib.Path)-> typing.Dict[str, dict]:
+    """ Loads the signature cache, returning its mapping of {file hash: signature} (empty if the file does not exist or is outdated) """
+    file = pathlib.Path(file)
+    if not file.exists(): return {}
+    try:
+        with open(file,'r', encoding = "utf-8") as f:
+            signatures = json.load(f)
+    except (OSError, ValueError):
+        warnings.warn(f"Could not read signature cache: {file}")
+        return {}
+    if signatures.get("version") != SIGNATURESVERSION: return {}
+    return signatures['signatures']
+
+def save_signatures(signatures: typing.Dict[str, dict], file: str|pathlib.Path):
+    """ Saves the signature cache """
+    file = pathlib.Path(file)
+    file.parent.mkdir(parents = True, exist_ok = True)
+    with open(file,'w', encoding = "utf-8") as f:
+        json.dump(dict(version = SIGNATURESVERSION, signatures = signatures), f)
+
+def getsignature(file: str|pathlib.Path)-> dict:
+    """ Returns the formula signature of a Record.
+
+        The signature is a dict with keys version, season, year, and formulas: formulas is an
+        (ordered) mapping of {column header: formula} for the columns of the first row of the Week 1
+        Table that contain formulas. Only plain values are returned so that this function can be
+        used with a process pool.
+    """
+    summary = classes.SeasonRecord.peek(file)
+    formulas = {}
+    reader = streaming.DirectReader(file, data_only = False)
+    try:
+        tables = [info for name,info in reader.catalogue.items() if (match := classes.WEEKRE.search(name)) and int(match.group("number")) == 1]
+        if tables:
+            rows = streaming.StreamTable(tables[0], reader).todicts()
+            if len(rows) > 1:
+                formulas = {str(header):value for header,value in rows[1].items() if value and str(value).startswith("=")}
+    finally:
+        reader.close()
+    return dict(version = summary.version, season = summary.season, year = summary.year, formulas = formulas)
+
+def scan(files: typing.Iterable[pathlib.Path], workers: int|None = None, cachedir: str|pathlib.Path|None = None)-> typing.List[typing.Tuple[pathlib.Path, dict]]:
+    """ Returns a list of (file, signature) tuples for the given Record files.
+
+        Signatures are loaded from the signature cache (see getsignaturesfile) when the Record's hash is
+        unchanged. Otherwise the Record is parsed: if workers is greater than 1, Records are parsed in a
+        process pool with that many processes (0 or less uses one process per cpu). The cache is updated
+        afterwards (signatures of Records which were not scanned are retained).
+    """
+    files = list(files)
+    signaturesfile = getsignaturesfile(cachedir)
+    signatures = load_signatures(signaturesfile)
+    hashes = [classes.hashfile(file) for file in files]
+    toparse = [(file, filehash) for file,filehash in zip(files,hashes) if filehash not in signatures]
+
+    if toparse and workers is not None and (workers > 1 or workers <= 0):
+        if workers <= 0: workers = None
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+            parsed = list(executor.map(getsignature, [file for file,filehash in toparse]))
+    else:
+        parsed = [getsignature(file) for file,filehash in toparse]
+    for (file,filehash),signature in zip(toparse, parsed):
+        signatures[filehash] = signature
+    if toparse:
+        save_signatures(signatures, signaturesfile)
+    return [(file, signatures[filehash]) for file,filehash in zip(files,hashes)]
+
+def sortkey(signature: dict)-> tuple:
+    """ Sort key for signatures: by version and then season (Records without a version are sorted first) """
+    version = signature['version'] if signature['version'] is not None else -1
+    return version, anime.AnimeSeason(signature['season'], signature['year']).seasonindex
+
+def diffformulas(old: typing.Dict[str,str], new: typing.Dict[str,str])-> typing.List[typing.Tuple[str, str, str|None, str|None]]:
+    """ Compares two formula mappings, returning a list of (change, header, old formula, new formula) tuples.
+
+        change is one of "added", "changed", or "removed".
+    """
+    changes = []
+    for header,formula in new.items():
+        if header not in old:
+            changes.append(("added", header, None, formula))
+        elif formula != old[header]:
+            changes.append(("changed", header, old[header], formula))
+    for header,formula in old.items():
+        if header not in new:
+            changes.append(("removed", header, formula, None))
+    return changes
+
+def iterdrift(signatures: typing.Iterable[typing.Tuple[pathlib.Path, dict]])-> typing.Generator[typing.Tuple[pathlib.Path, dict, list],None,None]:
+    """ Sorts the (file, signature) tuples (see sortkey) and yields (file, signature, changes) for each,
+        where changes are the differences from the formulas of the previous Record (see diffformulas).
+        The first Record is compared against an empty signature.
+    """
+    current = {}
+    for file,signature in sorted(signatures, key = lambda item: sortkey(item[1])):
+        new = signature['formulas']
+        yield file, signature, diffformulas(current, new)
+        current = new
+
+def checkdirectory(directory: str|pathlib.Path, recurse: bool = False, workers: int|None = None, cachedir: str|pathlib.Path|None = None, output = print):
+    """ Scans the Records in the directory and outputs the formula changes between versions """
+    files = list(classes.listvalidfilenames(directory, recurse = recurse))
+    if len(files) <= 1:
+        output(f"Not enough Records to Compare: {len(files)}")
+        return
+    for i,(file, signature, changes) in enumerate(iterdrift(scan(files, workers = workers, cachedir = cachedir))):
+        output(f"Season Record<{file.name}> {signature['season']} {signature['year']} {signature['version']}")
+        ## The first Record is the baseline
+        if not i or not changes: continue
+        output(f"------VERSION: {signature['version']}------")
+        for change, header, old, new in changes:
+            if change == "added":
+                output(f"New Column: {header}\n\t{new}")
+            elif change == "changed":
+                output(f"Column Value Change:\n\t{header}:\n\t\t{old}\n\t=>\n\t\t{new}")
+            else:
+                output(f"Column Removed: {header}")
+    output("Done")
@@ -0,0 +1,110 @@
+""" aldb2.RecordReader.cache
+
+    A content-addressed, on-disk cache of the Table values parsed from Record Workbooks.
+
+    Each Record's Tables (Record Stats, Show Stats, and every Ranking, Hype List, Hype List History,
+    Roundup and Cut Table) are stored as plain values in a pickle file named after the sha256 hash of
+    the Workbook. When the Workbook's hash is unchanged the Tables are rehydrated from the cache as
+    CachedTables (which can be used anywhere a StreamTable can); otherwise the Workbook is read with
+    RecordReader.streaming and the cache is updated.
+"""
+
+## Builtin
+import os
+import pathlib
+import pickle
+import tempfile
+import typing
+
+## This Module
+from aldb2 import filestructure
+from aldb2.RecordReader import streaming
+
+DEFAULTCACHEDIR = (filestructure.DATAPATH / "recordcache").resolve()
+## Cache files with a different version are ignored
+CACHEVERSION = 1
+
+class CachedTable(streaming.StreamTable):
+    """ A StreamTable whose values were loaded from the cache (it is not attached to a Workbook) """
+    def __init__(self, info: streaming.TableInfo, rows: typing.List[tuple]):
+        super().__init__(info, reader = None)
+        self._rows = rows
+
+    @property
+    def worksheet(self):
+        return None
+
+    def rows(self)-> typing.List[tuple]:
+        return self._rows
+
+def getcachefile(filehash: str, data_only: bool = True, cachedir: typing.Optional[str|pathlib.Path] = None)-> pathlib.Path:
+    """ Returns the location of the cache file for the given Workbook hash """
+    if cachedir is None: cachedir = DEFAULTCACHEDIR
+    suffix = "" if data_only else "_formulas"
+    return pathlib.Path(cachedir) / f"{filehash}{suffix}.pickle"
+
+def readcache(cachefile: pathlib.Path)-> typing.Optional[typing.Dict[str, CachedTable]]:
+    """ Returns the cached Tables stored in the given cache file, or None if it does not exist or is unusable """
+    if not cachefile.exists(): return None
+    try:
+        with open(cachefile,'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+    if data.get("version") != CACHEVERSION: return None
+    return {info.displayName:CachedTable(info, rows) for (info, rows) in data['tables']}
+
+def writecache(cachefile: pathlib.Path, tables: typing.Dict[str, streaming.StreamTable]):
+    """ Writes the values of the given Tables to the cache file """
+    cachefile.parent.mkdir(parents = True, exist_ok = True)
+    data = dict(version = CACHEVERSION, tables = [(table.info, table.rows()) for table in tables.values()])
+    ## Write to a unique temporary file first so that an interrupted write does not leave a corrupt cache file
+    ## and concurrent writers of the same Workbook do not share a temporary file
+    fd, temp = tempfile.mkstemp(prefix = f".{cachefile.stem}", suffix = ".tmp", dir = cachefile.parent)
+    try:
+        with os.fdopen(fd,'wb') as f:
+            pickle.dump(data, f, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, cachefile)
+    except BaseException:
+        pathlib.Path(temp).unlink(missing_ok = True)
+        raise
+
+def loadtables(file: str|pathlib.Path, data_only: bool = True, cachedir: typing.Optional[str|pathlib.Path] = None, filehash: typing.Optional[str] = None)-> typing.Dict[str, CachedTable]:
+    """ Returns a mapping of {displayName: CachedTable} for all Tables in the Workbook.
+
+        The Tables are loaded from the cache if the Workbook's hash is unchanged. Otherwise the Workbook is
+        read via RecordReader.streaming.StreamReader and the cache is updated.
+        Workbooks without a RecordStats Table have their Record Stats sheet parsed (see StreamReader.parsesheet)
+        and included under the name "RecordStats".
+        filehash may be supplied if the Workbook's hash is already known.
+    """
+    if filehash is None:
+        ## Import here to avoid a circular import
+        from aldb2.RecordReader.classes import hashfile
+        filehash = hashfile(file)
+    cachefile = getcachefile(filehash, data_only = data_only, cachedir = cachedir)
+    tables = readcache(cachefile)
+    if tables is not None:
+        return tables
+
+    reader = streaming.StreamReader(file, data_only = data_only)
+    try:
+        tables = reader.gettables()
+        if "RecordStats" not in tables and "Record Stats" in reader.sheets:
+            tables["RecordStats"] = reader.parsesheet("Record Stats", "RecordStats")
+        tables = {name:CachedTable(table.info, table.rows()) for name,table in tables.items()}
+    finally:
+        reader.close()
+    writecache(cachefile, tables)
+    return tables
+
+def clearcache(cachedir: typing.Optional[str|pathlib.Path] = None)-> int:
+    """ Removes all cache files from the cache directory, returning the number of files removed """
+    if cachedir is None: cachedir = DEFAULTCACHEDIR
+    cachedir = pathlib.Path(cachedir)
+    if not cachedir.exists(): return 0
+    removed = 0
+    for file in cachedir.glob("*.pickle"):
+        file.unlink()
+        removed += 1
+    return removed
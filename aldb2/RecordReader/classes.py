@@ -1,6 +1,9 @@
 ## Builtin
+import collections.abc
 import csv
 import datetime
+import difflib
+import hashlib
 import itertools
 import pathlib
 import re
@@ -9,12 +12,14 @@ import typing
 
 ## This Module
 from aldb2.Anime import anime
+from aldb2.RecordReader import cache, streaming
 
 ## Custom Module
 from alcustoms import filemodules
 import AL_Excel ## Extension of openpyxl
 from AL_Excel import Tables, EnhancedTable
 from openpyxl.worksheet.worksheet import Worksheet
+import numpy
 
 """
 Sheet Version History:
@@ -599,17 +604,21 @@ CHARTDATARE = re.compile("""^Chart\s*Data_(?P<type>WeeklyRanking|WeeklyOverallRa
 ANIMEAWARDS = re.compile("""^AnimeAwards\s*$""", re.IGNORECASE)
 
 
-def listvalidfilenames(dire: str|pathlib.Path, recurse:bool=False)->typing.Generator[pathlib.Path,None, None]:
+def listvalidfilenames(dire: str|pathlib.Path, recurse:bool=False, peek: bool = False)->typing.Generator["pathlib.Path|RecordSummary",None, None]:
     """ A generator that yields all the validly named Record files (as pathlib.Path instances; does not garauntee that the files are correctly formatted)
     
         Args:
             dire: The directory to search for Record files
             recurse: If True, recursively search the directory for Record files. If False, only search the given directory.
+            peek: If True, yield a RecordSummary for each file instead (see SeasonRecord.peek)
     """
     dire = pathlib.Path(dire).resolve()
     if not dire.exists() or not dire.is_dir():
         raise ValueError("Invalid directory: must be a directory and must exist")
-    yield from filemodules.iterdir_re(dire,FILENAMERE, recurse=recurse)
+    files = filemodules.iterdir_re(dire,FILENAMERE, recurse=recurse)
+    if peek:
+        files = map(SeasonRecord.peek, files)
+    yield from files
 
 def isvalidfilename(filename: str)->bool:
     """ Returns True if the filename is a valid Record filename (does not garauntee that the file is correctly formatted)
@@ -635,43 +644,151 @@ def extractseasonfromfilename(filename:str)->anime.AnimeSeason:
         return anime.parseanimeseason_toobject(out)
     raise ValueError("Invalid filename: does not contain a season and year")
 
+def hashfile(file: str|pathlib.Path, chunksize: int = 2**20)->str:
+    """ Returns the sha256 hexdigest of the file's contents
+
+        Args:
+            file: The file to hash
+            chunksize: The number of bytes to read at a time
+    """
+    hasher = hashlib.sha256()
+    with open(file,'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize),b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class RecordSummary(collections.namedtuple("RecordSummary", "file, version, season, year, tables, weeks, shows")):
+    """ A summary of a Record file produced without loading the Workbook (see SeasonRecord.peek).
+
+        file: the Record's file path
+        version: the Record's version (from Record Stats; None if the Record Stats do not have a Version)
+        season/year: the Record's season and year (from Record Stats or, if missing, the filename)
+        tables: a tuple of the displayNames of all Tables in the Workbook
+        weeks: the number of Ranking (Week) Tables
+        shows: the number of rows in the Stats Table
+    """
+    __slots__ = ()
+    @property
+    def animeseason(self)->anime.AnimeSeason:
+        return anime.AnimeSeason(self.season,self.year)
+
 class SeasonRecord():
+    """ An AnimeLife Excel Record.
+
+        mode determines how the Workbook is read:
+            "full"- (default) the Workbook is loaded via AL_Excel.load_workbook (openpyxl edit mode)
+            "stream"- the Workbook's Table catalogue is read from the xlsx archive and only the cell ranges
+                belonging to Tables are read from a read-only openpyxl Workbook (see RecordReader.streaming).
+                Tables are StreamTables rather than EnhancedTables and the Workbook must remain open (see close)
+                while the Record is being used.
+            "direct"- as "stream", except that the Worksheet xml is parsed directly without openpyxl (see
+                RecordReader.streaming.DirectReader); no Worksheets are available (sheets is empty).
+            "cache"- the Table values are loaded from the Record cache (see RecordReader.cache) if the file's hash
+                is unchanged; otherwise the Workbook is read as in "stream" mode and the cache is updated.
+                Tables are CachedTables and the SeasonRecord does not keep the Workbook open (xlsx and sheets are empty).
+
+        Only the Record Stats are parsed when the SeasonRecord is created: ShowStats and each week's
+        RankingSheet (see RankingWeeks) are parsed the first time they are accessed.
+    """
+    MODES = ("full", "stream", "direct", "cache")
+
     @staticmethod
-    def load_directory(dire: str|pathlib.Path, recurse:bool=False)->typing.Generator["SeasonRecord",None, None]:
+    def load_directory(dire: str|pathlib.Path, recurse:bool=False, mode: str = "full", cache: bool = False, cachedir: str|pathlib.Path|None = None)->typing.Generator["SeasonRecord",None, None]:
         """ A generator that yields all the validly formatted Record files (as SeasonRecord instances)
 
             Args:
                 dire: The directory to search for Record files
                 recurse: If True, recursively search the directory for Record files. If False, only search the given directory.
+                mode: The mode to open each SeasonRecord with (see SeasonRecord)
+                cache: If True, use the Record cache (equivalent to mode = "cache")
+                cachedir: The Record cache directory (defaults to RecordReader.cache.DEFAULTCACHEDIR)
         """
+        if cache: mode = "cache"
         for file in listvalidfilenames(dire,recurse):
-            yield SeasonRecord(file)
+            yield SeasonRecord(file, mode = mode, cachedir = cachedir)
+
+    @staticmethod
+    def peek(file: str|pathlib.Path)-> RecordSummary:
+        """ Returns a RecordSummary for the Record file.
 
-    def __init__(self,file:pathlib.Path, data_only=True):
+            Only the Workbook's Table names and ranges (see RecordReader.streaming.peektables) and its Record Stats
+            are read, which is much faster than creating a SeasonRecord.
+
+            Args:
+                file: The Record file to summarize
+        """
+        file = pathlib.Path(file)
+        reader = streaming.DirectReader(file)
+        try:
+            catalogue = streaming.peektables(reader.archive)
+            table = None
+            if "RecordStats" in catalogue:
+                table = [info for info in reader.sheetcatalogue("Record Stats") if info.displayName == "RecordStats"]
+                if table: table = streaming.StreamTable(table[0], reader)
+            if not table:
+                table = reader.parsesheet("Record Stats", "RecordStats")
+            rows = table.todicts()
+            if len(rows) < 2: raise ValueError("Could not locate Record Stats values on Worksheet: Record Stats")
+            stats = {str(key).lower():v for key,v in rows[1].items()}
+        finally:
+            reader.close()
+        season, year = stats.get("season"), stats.get("year")
+        if not season or not year:
+            fileseason = extractseasonfromfilename(file.name)
+            season, year = season or fileseason.season, year or fileseason.year
+        shows = 0
+        if "Stats" in catalogue:
+            info = catalogue["Stats"]
+            left, top, right, bottom = streaming.range_boundaries(info.ref)
+            shows = bottom - top + 1 - info.headerrows - info.totalsrows
+        version = stats.get("version")
+        if version is not None: version = float(version)
+        return RecordSummary(file = file, version = version, season = season, year = year,
+                             tables = tuple(catalogue), weeks = sum(1 for name in catalogue if WEEKRE.search(name)), shows = shows)
+
+    def __init__(self,file:pathlib.Path, data_only=True, mode: str = "full", cachedir: str|pathlib.Path|None = None):
+        if mode not in SeasonRecord.MODES:
+            raise ValueError(f"Invalid mode: {mode}")
         self._file=file
-        xlsx=self.xlsx=AL_Excel.load_workbook(filename=str(file),data_only=data_only)
-        self._sheets={sheet:xlsx[sheet] for sheet in xlsx.sheetnames}
-        tables = Tables.get_all_tables(xlsx)
-        tables = {table.displayName:table for (ws,table) in tables}
+        self._mode = mode
+        if mode == "cache":
+            self._reader = None
+            self.xlsx = None
+            self._sheets = {}
+            tables = cache.loadtables(file, data_only = data_only, cachedir = cachedir)
+        elif mode == "stream":
+            reader = self._reader = streaming.StreamReader(file, data_only = data_only)
+            self.xlsx = reader.workbook
+            self._sheets = reader.sheets
+            tables = reader.gettables()
+        elif mode == "direct":
+            reader = self._reader = streaming.DirectReader(file, data_only = data_only)
+            self.xlsx = None
+            self._sheets = reader.sheets
+            tables = reader.gettables()
+        else:
+            self._reader = None
+            xlsx=self.xlsx=AL_Excel.load_workbook(filename=str(file),data_only=data_only)
+            self._sheets={sheet:xlsx[sheet] for sheet in xlsx.sheetnames}
+            tables = Tables.get_all_tables(xlsx)
+            tables = {table.displayName:table for (ws,table) in tables}
         try:
             table = tables.pop('RecordStats')
         except KeyError:
-            table = RecordStats.parsesheet(self._sheets['Record Stats'])
+            if self._reader:
+                table = self._reader.parsesheet('Record Stats', "RecordStats")
+            else:
+                table = RecordStats.parsesheet(self._sheets['Record Stats'])
         self._recordstats: RecordStats = RecordStats(table,self)
         self._recordstatssheet = table.worksheet
         if self.recordstats.version >= 3.1:
             self._recordstats = RecordStatsV3_1(table,self)
         
-        table = tables.pop('Stats')
-        # except KeyError:
-        #     table = ShowStats.parsesheet(self._sheets['Show Stats'])
-        if self.recordstats.version < 3:
-            idvalue = ExcelShowStats.NAMEVALUE
-        else: idvalue = ExcelShowStats.ORIGINALIDVALUE
-        self._showstats: ShowStats = ExcelShowStats(table = table, record = self, idvalue = idvalue)
+        self._showstatstable = table = tables.pop('Stats')
         self._showstatssheet = table.worksheet
+        ## ShowStats are parsed on first access (see showstats)
+        self._showstats: ShowStats|None = None
                 
-        self._weeks: typing.Dict[int, RankingSheet]={}
         weektables: typing.Dict[int, Tables.EnhancedTable] = {}
         hypetables: typing.Dict[int, Tables.EnhancedTable] = {}
         cuttables: typing.Dict[int, Tables.EnhancedTable] = {}
@@ -703,30 +820,21 @@ class SeasonRecord():
             else:
                 warnings.warn(f'Unknown Table: "{name}"')
 
-        for week,table in weektables.items():
-            hypetable = hypetables.get(week)
-            cuttable = cuttables.get(week)
-            rounduptable = rounduptables.get(week)
-            rounduprenewaltable = rounduptables.get(week)
-            version = self.recordstats.version
-            if version >= 4:
-                s = RankingSheetV4(table, hypetable, cuttable, rounduptable, rounduprenewaltable, self, historytables.get(week))
-            elif version >= 3.1:
-                s = RankingSheetV3_1(table, hypetable, cuttable, rounduptable, rounduprenewaltable, self)
-            elif version >= 3:
-                s = RankingSheetV3(table, hypetable, cuttable, rounduptable, self)
-            else:
-                s = RankingSheetV1(table, hypetable, self)
-            s.setshowstats(self.showstats.shows)
-            self._weeks[week]=s
+        self._weeks = RankingWeeks(self, weektables = weektables, hypetables = hypetables, cuttables = cuttables,
+                                   rounduptables = rounduptables, rounduprenewaltables = rounduprenewaltables,
+                                   historytables = historytables)
+
     @property
     def file(self)->pathlib.Path:
         return self._file
     @property
+    def mode(self)->str:
+        return self._mode
+    @property
     def sheets(self):
         return self._sheets
     @property
-    def weeks(self)->typing.Dict[int,"RankingSheetVersions"]:
+    def weeks(self)->"RankingWeeks":
         return self._weeks
     def week(self,weeknumber: int)->"RankingSheetVersions":
         """ Returns the RankingSheet for the given week number """
@@ -742,13 +850,21 @@ class SeasonRecord():
         return self._showstatssheet
     @property
     def showstats(self)->"ShowStats":
+        if self._showstats is None:
+            if self.recordstats.version < 3:
+                idvalue = ExcelShowStats.NAMEVALUE
+            else: idvalue = ExcelShowStats.ORIGINALIDVALUE
+            self._showstats = ExcelShowStats(table = self._showstatstable, record = self, idvalue = idvalue)
         return self._showstats
     @property
     def animeseason(self)->anime.AnimeSeason:
         return self.recordstats.animeseason
 
     def close(self):
-        self.xlsx.close()
+        if self._reader:
+            self._reader.close()
+        elif self.xlsx:
+            self.xlsx.close()
 
     def getlastweek(self)->"RankingSheet":
         weeks = [week for week in self.weeks.values() if week.shows]
@@ -785,6 +901,68 @@ class SeasonRecord():
     def __repr__(self):
         return str(f"Season Record<{self.file.name}> {self.animeseason} {self.recordstats.version}")
 
+class RankingWeeks(collections.abc.Mapping):
+    """ A lazily-populated mapping of {week number: RankingSheet} for a SeasonRecord.
+
+        The week's Tables are classified when the SeasonRecord is created, but the week's
+        Ranking Table (and its Hype List, Cut, and Roundup Tables) are only parsed the first time
+        that week is accessed. Iteration order matches the order of the Ranking Tables in the Workbook.
+    """
+    def __init__(self, record: SeasonRecord, weektables: typing.Dict[int, Tables.EnhancedTable],
+                 hypetables: typing.Dict[int, Tables.EnhancedTable], cuttables: typing.Dict[int, Tables.EnhancedTable],
+                 rounduptables: typing.Dict[int, Tables.EnhancedTable], rounduprenewaltables: typing.Dict[int, Tables.EnhancedTable],
+                 historytables: typing.Dict[int, Tables.EnhancedTable]):
+        self.record = record
+        self.weektables = weektables
+        self.hypetables = hypetables
+        self.cuttables = cuttables
+        self.rounduptables = rounduptables
+        self.rounduprenewaltables = rounduprenewaltables
+        self.historytables = historytables
+        self._weeks: typing.Dict[int, RankingSheetVersions] = {}
+
+    def __getitem__(self, week: int)-> "RankingSheetVersions":
+        if week not in self._weeks:
+            ## Raises KeyError for weeks that do not exist
+            table = self.weektables[week]
+            self._weeks[week] = self.buildweek(week, table)
+        return self._weeks[week]
+
+    def __iter__(self):
+        return iter(self.weektables)
+
+    def __len__(self)-> int:
+        return len(self.weektables)
+
+    def __contains__(self, week)-> bool:
+        return week in self.weektables
+
+    def isloaded(self, week: int)-> bool:
+        """ Returns True if the given week's RankingSheet has already been parsed """
+        return week in self._weeks
+
+    def buildweek(self, week: int, table: Tables.EnhancedTable)-> "RankingSheetVersions":
+        """ Creates the appropriate RankingSheet version for the given week """
+        record = self.record
+        hypetable = self.hypetables.get(week)
+        cuttable = self.cuttables.get(week)
+        rounduptable = self.rounduptables.get(week)
+        rounduprenewaltable = self.rounduprenewaltables.get(week)
+        version = record.recordstats.version
+        if version >= 4:
+            s = RankingSheetV4(table, hypetable, cuttable, rounduptable, rounduprenewaltable, record, self.historytables.get(week))
+        elif version >= 3.1:
+            s = RankingSheetV3_1(table, hypetable, cuttable, rounduptable, rounduprenewaltable, record)
+        elif version >= 3:
+            s = RankingSheetV3(table, hypetable, cuttable, rounduptable, record)
+        else:
+            s = RankingSheetV1(table, hypetable, record)
+        s.setshowstats(record.showstats.shows)
+        return s
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}<{self.record.file.name}: {list(self)}>"
+
 class RecordStats():
     
     @staticmethod
@@ -849,25 +1027,52 @@ class ShowStats():
     ONAMEVALUE = "Original Name"
     NAMEVALUE = "Name"
     ORIGINALIDVALUE = "OriginalID"
+    ## Default similarity ratio for getshowbyname's fuzzy matching (see difflib.get_close_matches)
+    FUZZYCUTOFF = 0.8
     def __init__(self, shows:typing.Sequence[dict], idvalue:str):
         self._shows = {show[idvalue.lower()]:Show(self,**show) for show in shows if show[idvalue.lower()]}
         self.idvalue = idvalue
+        self._nameindex: typing.Dict[str,"Show"]|None = None
 
     @property
     def shows(self)->typing.Dict[ShowIdentifier,"Show"]:
         return self._shows
 
-    def getshowbyname(self, show: str)-> "Show":
+    @property
+    def nameindex(self)-> typing.Dict[str,"Show"]:
+        """ A mapping of {casefolded name or originalname: Show}. Built on first access (see buildnameindex). """
+        if self._nameindex is None:
+            self.buildnameindex()
+        return self._nameindex
+
+    def buildnameindex(self):
+        """ (Re)builds the name index. Should be called if shows (or a Show's name/originalname) is modified. """
+        index = {}
+        for s in self.shows.values():
+            for name in (s.originalname, s.name):
+                ## Earlier Shows take precedence
+                if name: index.setdefault(str(name).casefold(), s)
+        self._nameindex = index
+
+    def getshowbyname(self, show: str, fuzzy: bool = False, cutoff: float|None = None)-> "Show":
         """ Returns the Show Object for a show of the given name string.
 
-        Returns the Show Object if name is in shows, else None.
-        If more than one string is passed (positional args), returns a List of results (per this method).
+        The name is compared case-insensitively against each Show's originalname and name.
+        If fuzzy is True and there is no exact match, the closest name whose similarity ratio
+        is at least cutoff (default FUZZYCUTOFF) is used instead.
+        Raises a ValueError if a Show cannot be found.
         """
         if not isinstance(show,str):
             raise ValueError("Arguements to getshowbyname must be strings")
-        shows = [s for s in self.shows.values() if (s.originalname and s.originalname.lower() == show.lower()) or (s.name and s.name.lower() == show.lower())]
-        if shows:
-            return shows[0]
+        key = show.casefold()
+        index = self.nameindex
+        if key in index:
+            return index[key]
+        if fuzzy:
+            if cutoff is None: cutoff = self.FUZZYCUTOFF
+            matches = difflib.get_close_matches(key, index.keys(), n = 1, cutoff = cutoff)
+            if matches:
+                return index[matches[0]]
         raise ValueError(f"Show '{show}' not found in ShowStats")
 
 class MasterShowStats(ShowStats):
@@ -897,6 +1102,11 @@ class ExcelShowStats(ShowStats):
         return self._table
 
 class Show():
+    ## Record histories produce a large number of Shows, so attributes are slotted
+    __slots__ = ("statssheet", "originalid", "kw", "seasonid", "seriesid", "subseriesid", "watching", "include", "originalname", "name",
+                 "channel", "day", "firstepisode", "group", "channelhomepage", "rssfeedname", "hashtag", "website", "pv",
+                 "showboyid", "annid", "anilistid", "malid", "anidbid", "image", "renewal", "lastepisode", "totalepisodes",
+                 "lastnormalize", "lasthypelist", "lastseason", "notes", "episodeurls", "seasonorder")
     def __init__(self,statssheet: ShowStats, originalid: int, seasonid: typing.Optional[int] = None, seriesid: typing.Optional[int] = None, subseriesid: typing.Optional[int] = None,
                  watching: typing.Optional[bool] = None, include: typing.Optional[bool] = None, originalname: typing.Optional[str] = None, name: typing.Optional[str] = None, channel: typing.Optional[str] = None,
                  day: typing.Optional[str] = None, firstepisode: str|datetime.datetime|None = None, group: typing.Optional[int] = None, channelhomepage: typing.Optional[str] = None, image: typing.Optional[str] = None,
@@ -973,21 +1183,40 @@ class Show():
     def __str__(self):
         return f"Season Show: {self.name}"
 
+def _originalidkey(value)-> str|None:
+    """ Normalizes an OriginalID (which may be read from Excel as an int, float, or str) for use as a lookup key """
+    if value is None or value == "": return None
+    try: return str(int(value))
+    except (TypeError, ValueError): return str(value)
+
 class HypeList():
+    """ Base class for Hype Lists.
+
+        The Hype List's rows are read once when the HypeList is created and rank lookups
+        use indexes built at the same time (see buildindexes).
+    """
     NAMEHEADER = "name"
     LASTHEADER = "lastlist"
     def __init__(self,table: Tables.EnhancedTable, week: "RankingSheet"):
         self._table = table
         self.week = week
+        ## First index is keys()
+        self._rows: typing.Tuple[dict,...] = tuple(self.table.todicts(keyfactory = keyfactory)[1:])
+        self._nameindex: typing.Dict[str,int] = {}
+        self._originalidindex: typing.Dict[str,int] = {}
+        self.buildindexes()
 
     @property
-    def rows(self):
-        ## First index is keys()
-        return self.table.todicts(keyfactory = keyfactory)[1:]
+    def rows(self)-> typing.Tuple[dict,...]:
+        return self._rows
 
     @property
     def table(self)->Tables.EnhancedTable:
         return self._table
+
+    def buildindexes(self):
+        """ Populates the name (and, where available, originalid) rank indexes """
+        raise NotImplementedError("buildindexes() must be implemented by subclasses")
     
     def rank(self, show: "Episode|ShowName")-> int|None:
         raise NotImplementedError("rank() must be implemented by subclasses")
@@ -1017,20 +1246,27 @@ class HypeListV1(HypeList):
     def __init__(self, table: Tables.EnhancedTable, week: "RankingSheet"):
         super().__init__(table, week)
 
+    def buildindexes(self):
+        ## Not all Hype List Tables have a Last List column
+        self._hypelist = tuple(row[self.NAMEHEADER] for row in self.rows if row.get(self.NAMEHEADER))
+        self._history = tuple(row[self.LASTHEADER] for row in self.rows if row.get(self.LASTHEADER))
+        for i,name in enumerate(self._hypelist, start = 1):
+            ## Keep the first occurence (as list.index would)
+            self._nameindex.setdefault(name, i)
+
     @property
-    def hypelist(self)->typing.List[str]:
-        return[row[self.NAMEHEADER] for row in self.rows if row[self.NAMEHEADER]]
+    def hypelist(self)->typing.Tuple[str,...]:
+        return self._hypelist
         
     @property
-    def history(self)->typing.List[str]:
-        return [row[self.LASTHEADER] for row in self.rows if row[self.LASTHEADER]]
+    def history(self)->typing.Tuple[str,...]:
+        return self._history
 
     def rank(self,show: "Episode|ShowName")-> int|None:
         """ Returns the Rank on the current HypeList of the given show (None if the show is not on the hypelist) """
         if isinstance(show,Episode):
             show = show.name
-        if show in self.hypelist: return self.hypelist.index(show)+1
-        return None
+        return self._nameindex.get(show)
 
 class HypeListv4(HypeList):
     """ HypelistV4:
@@ -1059,34 +1295,81 @@ class HypeListv4(HypeList):
     LASTHEADER = None
 
     def __init__(self, table: Tables.EnhancedTable, week: "RankingSheet", historytable: Tables.EnhancedTable|None):
-        super().__init__(table, week)
         self._historytable = historytable
+        super().__init__(table, week)
+
+    def buildindexes(self):
+        history = []
+        if self._historytable:
+            history = self._historytable.todicts(keyfactory = keyfactory)[1:]
+        self._history = tuple(history)
+        for i,row in enumerate(self.rows, start=1):
+            if row.get(self.NAMEHEADER) is not None:
+                self._nameindex.setdefault(row[self.NAMEHEADER], i)
+            if (oid := _originalidkey(row.get(self.OIDHEADER))) is not None:
+                self._originalidindex.setdefault(oid, i)
 
     @property
-    def hypelist(self):
+    def hypelist(self)-> typing.Tuple[dict,...]:
         return self.rows
 
     @property
-    def history(self):
-        if self._historytable:
-            return self._historytable.todicts(keyfactory = keyfactory)[1:]
-        return []
+    def history(self)-> typing.Tuple[dict,...]:
+        return self._history
 
     def rank(self, show: "Episode|ShowOriginalID|ShowName")-> int|None:
+        """ Returns the Rank on the current HypeList of the given show (None if the show is not on the hypelist).
+
+            Episodes and integers are looked up by OriginalID; strings are looked up by Name.
+        """
         if isinstance(show, Episode):
+            if show.originalid is None:
+                return self._nameindex.get(show.name)
             show = int(show.originalid)
         if isinstance(show, int):
-            show = str(show)
-            header = self.OIDHEADER
-        elif isinstance(show, str):
-            header = self.NAMEHEADER
-        for i,row in enumerate(self.hypelist, start=1):
-            if row[header]==show:
-                return i
-        return None
+            return self._originalidindex.get(_originalidkey(show))
+        return self._nameindex.get(show)
 
 EpisodeDict = typing.Dict[str|int, "Episode"]
 
+class _EpisodeDict(dict):
+    """ A dict of Episodes which clears its RankingSheet's cached rankings whenever it is modified """
+    def __init__(self, week: "RankingSheet", *args, **kw):
+        super().__init__(*args, **kw)
+        self._week = week
+
+    def _changed(self):
+        self._week.clearrankingcache()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+    def clear(self):
+        super().clear()
+        self._changed()
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._changed()
+        return result
+    def popitem(self):
+        result = super().popitem()
+        self._changed()
+        return result
+    def setdefault(self, key, default = None):
+        result = super().setdefault(key, default)
+        self._changed()
+        return result
+    def update(self, *args, **kw):
+        super().update(*args, **kw)
+        self._changed()
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self._changed()
+        return result
+
 
 class RankingSheet():
     RANKHEADER="rank"
@@ -1116,6 +1399,7 @@ class RankingSheet():
         self.hypelist: HypeList|None = None
         if hypelist and self.hypelist: self.hypelist = self.HYPELIST(hypelist,self)
 
+        self._rankingcache: dict|None = None
         self.shows: EpisodeDict = dict()
         ## Index-0 of todicts is keys()
         shows = self.table.todicts(keyfactory = keyfactory)[1:]
@@ -1156,6 +1440,40 @@ class RankingSheet():
     @property
     def record(self):
         return self._record
+    @property
+    def shows(self)-> EpisodeDict:
+        return self._shows
+    @shows.setter
+    def shows(self, shows: EpisodeDict):
+        self._shows = _EpisodeDict(self, shows)
+        self.clearrankingcache()
+
+    def clearrankingcache(self):
+        """ Clears the cached rankings (see getrankingcache).
+
+            This is done automatically when shows is modified or when an Episode's rank or ranktotal is changed.
+        """
+        self._rankingcache = None
+
+    def getrankingcache(self)-> dict:
+        """ Returns the sorted rankings and rank range for the week, computing them if necessary.
+
+            The result is a dict with keys:
+                episoderanking: the Episodes with a rank, sorted by rank (ties sorted by name)
+                seasonranking: the Episodes with a ranktotal, sorted by ranktotal (ties sorted by name)
+                minrank/maxrank: the lowest and highest episode rank (None if no episodes are ranked)
+        """
+        if self._rankingcache is None:
+            episoderanking = [show for show in self.shows.values() if show.rank is not None]
+            episoderanking = sorted(sorted(episoderanking,key=lambda show:show.name),key=lambda show: show.rank)
+            seasonranking = [show for show in self.shows.values() if show.ranktotal is not None]
+            seasonranking = sorted(sorted(seasonranking,key=lambda show:show.name),key=lambda show: show.ranktotal)
+            minrank = maxrank = None
+            if episoderanking:
+                ## episoderanking is sorted by rank
+                minrank, maxrank = episoderanking[0].rank, episoderanking[-1].rank
+            self._rankingcache = dict(episoderanking = episoderanking, seasonranking = seasonranking, minrank = minrank, maxrank = maxrank)
+        return self._rankingcache
 
     def setshowstats(self,showstats: typing.Dict[str|int, "Show"]):
         for show,stats in showstats.items():
@@ -1168,12 +1486,10 @@ class RankingSheet():
                     thisshow.originalid = stats.originalid
 
     def getepisoderanking(self) -> typing.List["Episode"]:
-        rankings=[show for show in self.shows.values() if show.rank is not None]
-        return sorted(sorted(rankings,key=lambda show:show.name),key=lambda show: show.rank)
+        return list(self.getrankingcache()['episoderanking'])
     
     def getseasonranking(self) -> typing.List["Episode"]:
-        rankings=[show for show in self.shows.values() if show.ranktotal is not None]
-        return sorted(sorted(rankings,key=lambda show:show.name),key=lambda show: show.ranktotal)
+        return list(self.getrankingcache()['seasonranking'])
     
     def gethypelistranking(self) -> typing.List["Episode"]:
         rankings=[show for show in self.shows.values() if show.hypelistrank is not None]
@@ -1184,12 +1500,29 @@ class RankingSheet():
     
     def getepisodenormalize(self,episode: "Episode")-> float:
         """ Returns the normalized value for the show's Ranking. """
-        rankings = self.getepisoderanking()
-        minrank = min(rankings, key = lambda ranking: ranking.rank).rank
-        maxrank = max(rankings, key = lambda ranking: ranking.rank).rank
+        cache = self.getrankingcache()
+        if not cache['episoderanking']:
+            raise ValueError("No episodes are ranked for this week")
+        minrank, maxrank = cache['minrank'], cache['maxrank']
         BASE,CEIL = 0,1
         return BASE + ( (episode.rank - minrank) * (CEIL - BASE) ) / ( maxrank - minrank)
 
+    def normalized_ranks(self)-> typing.Dict[str, float]:
+        """ Returns the normalized value for every ranked Episode as a dict {episode name: normalized value}.
+
+            Equivalent to calling getepisodenormalize for each Episode in getepisoderanking, but computed in a single pass.
+        """
+        cache = self.getrankingcache()
+        rankings = cache['episoderanking']
+        if not rankings: return {}
+        minrank, maxrank = cache['minrank'], cache['maxrank']
+        if maxrank == minrank:
+            raise ZeroDivisionError("Cannot normalize ranks: all ranks are equal")
+        BASE,CEIL = 0,1
+        ranks = numpy.fromiter((episode.rank for episode in rankings), dtype = float, count = len(rankings))
+        normalized = BASE + ( (ranks - minrank) * (CEIL - BASE) ) / ( maxrank - minrank)
+        return dict(zip((episode.name for episode in rankings), normalized.tolist()))
+
 class RankingSheetV1(RankingSheet):
     """ Ranking Sheet for Record Versions prior to 4"""
     HYPELIST = HypeListV1
@@ -1226,6 +1559,7 @@ class RankingSheetV4(RankingSheetV3_1):
 RankingSheetVersions = RankingSheet|RankingSheetV1|RankingSheetV3|RankingSheetV3_1|RankingSheetV4
 
 class Episode():
+    __slots__ = ("originalid", "seasonid", "name", "week", "_rank", "_ranktotal", "episodenumber", "hypelistocc", "showstats")
     def __init__(self, originalid: int, name: str, week:RankingSheet, rank: int, ranktotal: int,
                  episode: int, hypelistocc:typing.Optional[int]=0, seasonid: typing.Optional[int] = None,
                  showstats: Show|None = None):
@@ -1239,6 +1573,23 @@ class Episode():
         self.hypelistocc=hypelistocc
         self.showstats = showstats
 
+    ## Changing rank or ranktotal invalidates the week's cached rankings
+    @property
+    def rank(self):
+        return self._rank
+    @rank.setter
+    def rank(self, rank):
+        self._rank = rank
+        self.week.clearrankingcache()
+
+    @property
+    def ranktotal(self):
+        return self._ranktotal
+    @ranktotal.setter
+    def ranktotal(self, ranktotal):
+        self._ranktotal = ranktotal
+        self.week.clearrankingcache()
+
     @property
     def hypelistrank(self):
         if self.week.hypelist:
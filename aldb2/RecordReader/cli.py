@@ -1,7 +1,7 @@
 ## Builtin
 import pathlib
 ## This Module
-from aldb2.RecordReader import master
+from aldb2.RecordReader import bookchecker, master, streaming
 ## Third Party
 import click
 
@@ -11,10 +11,19 @@ def cli():
 
 @cli.command()
 @click.option("--recurse", "-r", is_flag=True,  default = False)
-def compilemaster(recurse):
+@click.option("--jobs", "-j", type=int, default = 1, help = "Number of processes used to parse Records (0 for one per cpu)")
+@click.option("--incremental", "-i", is_flag=True, default = False, help = "Only parse Records that changed since the last incremental compile")
+@click.option("--watch", "-w", is_flag=True, default = False, help = "Keep running and recompile (incrementally) whenever a Record changes")
+@click.option("--interval", type=float, default = 1.0, help = "Seconds between checks for changes (--watch)")
+@click.option("--debounce", type=float, default = 2.0, help = "Seconds without further changes before recompiling (--watch)")
+def compilemaster(recurse, jobs, incremental, watch, interval, debounce):
     dire = pathlib.Path.cwd()
+    if watch:
+        click.echo("Watching for changes to Records (Ctrl+C to stop)...")
+        master.watch_directory(dire, recurse = recurse, interval = interval, debounce = debounce, workers = jobs, output = click.echo)
+        return
     click.echo("Compile Master Stats and Episodes...")
-    master.compile_directory(dire, recurse= recurse)
+    master.compile_directory(dire, recurse= recurse, workers = jobs, incremental = incremental)
     click.echo("Done")
 
 
@@ -25,6 +34,26 @@ def compilemaster(recurse):
 def compile_firstepisodes(directory, output, recurse):
     click.echo("Compile First Episodes...")
     master.compile_firstepisodes(directory, output, recurse)
+
+@cli.command()
+@click.option("--directory", "-d",  type=click.Path(exists=True), default = pathlib.Path.cwd())
+@click.option("--recurse", "-r", is_flag=True,  default = False)
+@click.option("--jobs", "-j", type=int, default = 1, help = "Number of processes used to parse Records (0 for one per cpu)")
+def checkformulas(directory, recurse, jobs):
+    """ Reports changes to the Week 1 formulas between Record versions """
+    bookchecker.checkdirectory(directory, recurse = recurse, workers = jobs, output = click.echo)
+
+@cli.command()
+@click.argument("files", nargs = -1, type=click.Path(exists=True))
+@click.option("--repeat", "-n", type=int, default = 3)
+def benchmark(files, repeat):
+    """ Compares the time taken to read all Tables in the given Records using each Workbook reader """
+    if not files:
+        files = master.listrecordfiles(pathlib.Path.cwd())
+    results = streaming.benchmark(files, repeat = repeat)
+    baseline = results['openpyxl']
+    for name,seconds in results.items():
+        click.echo(f"{name}: {seconds:.3f}s ({baseline/seconds:.1f}x)")
     
     
 
@@ -8,8 +8,16 @@
 """
 
 ## Builtin
+import concurrent.futures
+import contextlib
 import csv
+import datetime
+import functools
+import itertools
+import json
+import os
 import pathlib
+import time
 import warnings
 
 ## This module
@@ -23,6 +31,11 @@ DEFAULTSTATFILE = (root / "master_stats.csv").resolve()
 DEFAULTEPISODEFILE = (root / "master_episodes.csv").resolve()
 del root
 
+## Name of the incremental compilation manifest (saved alongside the master files)
+MANIFESTNAME = "master_manifest.json"
+## Manifests with a different version are discarded
+MANIFESTVERSION = 1
+
 def load_masterstats(file):
     """ Loads a masterstats csv file """
     file = testfileobj(file)
@@ -31,18 +44,96 @@ def load_masterstats(file):
         seasons = list(reader)
     return [MasterStat(**season) for season in seasons]
 
+def _savecsv(rows, fieldnames, file):
+    """ Writes an iterable of dicts to a master csv file """
+    with MasterWriter(file, fieldnames) as writer:
+        writer.writerows(rows)
+
+def _optional(factory):
+    """ Returns a converter which returns None for blank csv values and otherwise calls factory on the value """
+    def convert(value):
+        if value is None or value == "": return None
+        return factory(value)
+    return convert
+
+def _toint(value)-> int:
+    """ Converts a csv value to an int (Excel values may have been written as floats: e.g.- "3.0") """
+    try: return int(value)
+    except ValueError: return int(float(value))
+
+def _tobool(value)-> bool:
+    """ Converts a csv value written from a bool (or blank) to a bool """
+    return str(value).strip().lower() in ("true","1")
+
+def _todatetime(value):
+    """ Converts a csv datetime (as written by str(datetime)) to a datetime; other values are returned as-is """
+    try: return datetime.datetime.fromisoformat(value)
+    except ValueError: return value
+
+_optionalstr = _optional(str)
+## Converters used by iter_masterstats and iter_masterepisodes; columns that are not listed are converted with _optionalstr
+MASTERSTATTYPES = dict(seasonindex = _optional(float), seasonid = _optional(_toint), watching = _tobool, include = _tobool,
+                       group = _optional(_toint), firstepisode = _optional(_todatetime))
+MASTEREPISODETYPES = dict(seasonindex = _optional(float), seasonid = _optional(_toint), week = _toint, rank = float,
+                          episodenumber = _toint, hypelistrank = _optional(_toint))
+
+def _coercerow(row, types):
+    return {key:types.get(key, _optionalstr)(value) for key,value in row.items()}
+
+def _buildseasonfilter(where):
+    """ Converts the where argument of iter_masterstats/iter_masterepisodes into a (seasonindexes, callable) tuple """
+    if where is None: return None, None
+    if callable(where): return None, where
+    if isinstance(where, (str, float, anime.AnimeSeason)) or not isiterable(where):
+        where = [where,]
+    return {getanimeseason(season).seasonindex for season in where}, None
+
+def _itermaster(file, types, cls, where):
+    seasons, test = _buildseasonfilter(where)
+    file = testfileobj(file)
+    with open(file,'r', encoding = "utf-8", newline = "") as f:
+        for row in csv.DictReader(f):
+            row = _coercerow(row, types)
+            ## Filter on the row before creating the object
+            if seasons is not None and row['seasonindex'] not in seasons: continue
+            obj = cls(**row)
+            if test is None or test(obj):
+                yield obj
+
+def iter_masterstats(file, where = None):
+    """ A generator which lazily loads MasterStats from a masterstats csv file.
+
+        Unlike load_masterstats, values are converted to their proper types: seasonindex is a float,
+        seasonid and group are ints, watching and include are bools, firstepisode is a datetime,
+        and blank values are None.
+        where can be used to filter the MasterStats: it can either be a callable which accepts
+        a MasterStat and returns True if it should be yielded or one or more seasons (AnimeSeasons
+        or values accepted by anime.parseanimeseason, such as seasonindexes).
+    """
+    yield from _itermaster(file, MASTERSTATTYPES, MasterStat, where)
+
+def masterstatfields():
+    """ Returns the column names for a masterstats file """
+    return list(MasterStat(None,None).to_dict().keys())
+
 def save_masterstats(output,file):
-    """ Saves a masterstats file with the given list of MasterStat objects """
-    file = pathlib.Path(file).resolve()
-    if not isiterable(output) or not all(isinstance(obj,MasterStat) for obj in output):
+    """ Saves a masterstats file with the given list (or other iterable) of MasterStat objects """
+    if not isiterable(output):
         raise ValueError("output must be a list of MasterStat objects")
-    with open(file,'w', newline = "", encoding = "utf-8") as f:
-        fieldnames = MasterStat(None,None).to_dict().keys()
-        writer = csv.DictWriter(f,fieldnames = fieldnames)
-        writer.writeheader()
-        writer.writerows([stat.to_dict() for stat in output])
+    with MasterStatWriter(file) as writer:
+        writer.writerows(output)
+
+@functools.lru_cache(maxsize = None)
+def getanimeseason(seasonindex)-> anime.AnimeSeason:
+    """ Returns a shared AnimeSeason for the given seasonindex.
+
+        Master files contain many rows for the same season, so a single AnimeSeason is created per seasonindex.
+        As the returned instance is shared, it should not be modified.
+    """
+    return anime.parseanimeseason_toobject(seasonindex)
 
 class MasterStat(classes.Show):
+    __slots__ = ("seasonindex",)
     def list_from_SeasonRecord(seasonrecord:classes.SeasonRecord):
         """ Creates a list of MasterStats from the SeasonRecord's ShowStats """
         stats = list(seasonrecord.showstats.shows.values())
@@ -61,7 +152,7 @@ class MasterStat(classes.Show):
                                 watching = watching, include = include, originalname = originalname, name = name, channel = channel, day = day, firstepisode = firstepisode,
                                 group = group, channelhomepage = channelhomepage, image = image, rssfeedname = rssfeedname, hashtag = hashtag, website = website, pv = pv,
                                 showboyid = showboyid, annid = annid, anilistid = anilistid, malid = malid, anidbid = anidbid,
-                                notes = notes, **kw)
+                                notes = notes, lastseason = lastseason, **kw)
         self.seasonindex = seasonindex
 
     def to_dict(self):
@@ -79,19 +170,96 @@ def load_masterepisodes(file):
         seasons = list(reader)
     return [MasterEpisode(**season) for season in seasons]
 
+def masterepisodefields():
+    """ Returns the column names for a masterepisodes file """
+    return list(MasterEpisode(None,None,1.0,None,None,None,None).to_dict().keys())
+
+def iter_masterepisodes(file, where = None):
+    """ A generator which lazily loads MasterEpisodes from a masterepisodes csv file.
+
+        Unlike load_masterepisodes, values are converted to their proper types: seasonindex and rank
+        are floats, seasonid, week, and episodenumber are ints, hypelistrank is an int or None,
+        and blank values are None.
+        where is the same as for iter_masterstats.
+    """
+    yield from _itermaster(file, MASTEREPISODETYPES, MasterEpisode, where)
+
 def save_masterepisodes(output,file):
-    """ Saves a masterepisodes file with the given list of MasterEpisode objects """
-    file = pathlib.Path(file).resolve()
-    if not isiterable(output) or not all(isinstance(obj,MasterEpisode) for obj in output):
-        raise ValueError("output must be a list of MasterStat objects")
-    with open(file,'w', newline = "", encoding = "utf-8") as f:
-        fieldnames = MasterEpisode(None,None,1.0,None,None,None,None).to_dict().keys()
-        writer = csv.DictWriter(f,fieldnames = fieldnames)
-        writer.writeheader()
-        writer.writerows([stat.to_dict() for stat in output])
+    """ Saves a masterepisodes file with the given list (or other iterable) of MasterEpisode objects """
+    if not isiterable(output):
+        raise ValueError("output must be a list of MasterEpisode objects")
+    with MasterEpisodeWriter(file) as writer:
+        writer.writerows(output)
+
+class MasterWriter():
+    """ A context manager which writes rows to a master csv file as they are supplied.
+
+        If append is True and the file already has content, rows are added to the end of the file
+        (and the header is not rewritten); otherwise the file is overwritten.
+        If atomic is True, rows are written to a temporary file next to the file which replaces the file
+        when the writer is closed: if the writer exits with an exception (or discard is called) the
+        temporary file is removed and the file is left unchanged. atomic cannot be used with append.
+        If cls is supplied, rows must be instances of cls (and are converted via to_dict);
+        otherwise rows should be dicts.
+    """
+    cls = None
+    def __init__(self, file, fieldnames, append = False, atomic = False):
+        if append and atomic:
+            raise ValueError("MasterWriter cannot be both append and atomic")
+        self.file = pathlib.Path(file).resolve()
+        self.fieldnames = fieldnames
+        self.append = append
+        self.atomic = atomic
+        self._file = None
+        self._writer = None
+
+    @property
+    def tempfile(self)-> pathlib.Path:
+        """ The temporary file used when atomic is True """
+        return self.file.with_name(f".{self.file.name}.tmp")
+
+    def open(self):
+        writeheader = not (self.append and self.file.exists() and self.file.stat().st_size)
+        target = self.tempfile if self.atomic else self.file
+        self._file = open(target, 'a' if self.append else 'w', newline = "", encoding = "utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames = self.fieldnames)
+        if writeheader: self._writer.writeheader()
+        return self
+
+    def writerow(self, row):
+        if self.cls is not None:
+            if not isinstance(row, self.cls):
+                raise ValueError(f"{self.__class__.__name__} can only write {self.cls.__name__} objects")
+            row = row.to_dict()
+        self._writer.writerow(row)
+
+    def writerows(self, rows):
+        for row in rows: self.writerow(row)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = self._writer = None
+            if self.atomic: os.replace(self.tempfile, self.file)
+
+    def discard(self):
+        """ Closes the writer without replacing the file (only available when atomic is True) """
+        if not self.atomic:
+            raise ValueError("Only atomic MasterWriters can be discarded")
+        if self._file:
+            self._file.close()
+            self._file = self._writer = None
+        self.tempfile.unlink(missing_ok = True)
+
+    def __enter__(self):
+        return self.open()
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None and self.atomic: self.discard()
+        else: self.close()
 
 class MasterEpisode():
     """ The Master Ranking Sheet is a bit different from the normal Ranking Sheet """
+    __slots__ = ("seasonid", "originalid", "seasonindex", "animeseason", "week", "rank", "episodenumber", "hypelistrank")
     def list_from_SeasonRecord(seasonrecord:classes.SeasonRecord):
         """ Converts a SeasonRecord into a list of MasterEpisodes.
         
@@ -109,7 +277,7 @@ class MasterEpisode():
         self.seasonid = seasonid
         self.originalid = originalid
         self.seasonindex = seasonindex
-        self.animeseason = anime.parseanimeseason_toobject(seasonindex)
+        self.animeseason = getanimeseason(seasonindex)
         self.week = week
         self.rank = rank
         self.episodenumber = episodenumber
@@ -126,12 +294,146 @@ class MasterEpisode():
 
 
 
-def compile_directory(directory, statsfile = None, episodesfile = None, recurse = False):
+class MasterStatWriter(MasterWriter):
+    """ A MasterWriter for MasterStats """
+    cls = MasterStat
+    def __init__(self, file, append = False):
+        super().__init__(file, masterstatfields(), append = append)
+
+class MasterEpisodeWriter(MasterWriter):
+    """ A MasterWriter for MasterEpisodes """
+    cls = MasterEpisode
+    def __init__(self, file, append = False):
+        super().__init__(file, masterepisodefields(), append = append)
+
+def listrecordfiles(directory, recurse = False):
+    """ Returns a list of all validly-named Record files in the directory (and, if recurse is True, its subdirectories) """
+    files = list(classes.listvalidfilenames(directory))
+    if recurse:
+        for child in directory.iterdir():
+            if child.is_dir(): files.extend(listrecordfiles(child, recurse = recurse))
+    return files
+
+def compile_record(file, mode = "full"):
+    """ Compiles a single Record file into master rows.
+
+        Returns a tuple (seasonindex, stats, episodes) where stats and episodes are lists of
+        MasterStat.to_dict() and MasterEpisode.to_dict() dicts respectively. Only these lightweight
+        values are returned so that this function can be used with a process pool.
+        mode is passed to SeasonRecord.
+    """
+    record = classes.SeasonRecord(file, mode = mode)
+    try:
+        seasonindex = record.recordstats.animeseason.seasonindex
+        ## Old versions of RecordReader (pre-aldb2) used the OriginalID instead of the SeasonID
+        ## SeasonID is preferred in aldb2, so we're going to attempt to find and update the seasonid
+        stats = MasterStat.list_from_SeasonRecord(record)
+        serieslookup = {show.originalid:show for show in stats}
+
+        episodes = MasterEpisode.list_from_SeasonRecord(record)
+        for episode in episodes:
+            if not episode.seasonid and episode.originalid in serieslookup:
+                episode.seasonid = serieslookup[episode.originalid].seasonid
+    finally:
+        record.close()
+    return seasonindex, [stat.to_dict() for stat in stats], [episode.to_dict() for episode in episodes]
+
+def _timedcompile(file, mode = "full"):
+    """ Calls compile_record, returning a tuple (result, seconds taken) """
+    start = time.perf_counter()
+    result = compile_record(file, mode = mode)
+    return result, time.perf_counter() - start
+
+def iter_compiled(files, workers = None, mode = "full"):
+    """ A generator which compiles each Record file (see compile_record), yielding tuples (file, result, seconds taken) in files order.
+
+        If workers is greater than 1, Records are compiled in a process pool with that many processes (0 or
+        less uses one process per cpu); results are yielded as they become available. Otherwise Records are
+        compiled one-at-a-time.
+    """
+    files = list(files)
+    if files and workers is not None and (workers > 1 or workers <= 0):
+        if workers <= 0: workers = None
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+            ## executor.map yields results in files order as they become available
+            for file,(result, seconds) in zip(files, executor.map(_timedcompile, files, itertools.repeat(mode))):
+                yield file, result, seconds
+    else:
+        ## Due to the potential memory overhead, we'll be doing records One-at-a-time (so we can close the file afterwards)
+        for file in files:
+            result, seconds = _timedcompile(file, mode = mode)
+            yield file, result, seconds
+
+def load_manifest(file):
+    """ Loads a compile manifest, returning its mapping of {record path: entry}.
+
+        Returns an empty dict if the file does not exist or was created by a different manifest version.
+        Each entry has the keys: size, mtime, hash, seasonindex, stats, and episodes (see compile_directory).
+    """
+    file = pathlib.Path(file)
+    if not file.exists(): return {}
+    try:
+        with open(file,'r', encoding = "utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        warnings.warn(f"Could not read manifest: {file}")
+        return {}
+    if manifest.get("version") != MANIFESTVERSION: return {}
+    return manifest['records']
+
+def save_manifest(records, file):
+    """ Saves a compile manifest with the given mapping of {record path: entry} """
+    ## Non-json values (i.e.- datetimes) are saved as they would be written by csv (str)
+    with open(file,'w', encoding = "utf-8") as f:
+        json.dump(dict(version = MANIFESTVERSION, records = records), f, default = str)
+
+def getmanifestfile(directory, statsfile, episodesfile):
+    """ Returns the default manifest location: next to the statsfile or episodesfile (or in directory if neither is output) """
+    for file in (statsfile, episodesfile):
+        if file: return pathlib.Path(file).resolve().parent / MANIFESTNAME
+    return pathlib.Path(directory).resolve() / MANIFESTNAME
+
+def checkmanifestentry(file, entry):
+    """ Returns the file's current fingerprint {size, mtime, hash} if it differs from the manifest entry (or the entry is None); otherwise returns None.
+
+        The file is only hashed if its size or mtime have changed.
+    """
+    stat = pathlib.Path(file).stat()
+    fingerprint = dict(size = stat.st_size, mtime = stat.st_mtime_ns)
+    if entry and entry['size'] == fingerprint['size'] and entry['mtime'] == fingerprint['mtime']:
+        return None
+    fingerprint['hash'] = classes.hashfile(file)
+    if entry and entry['hash'] == fingerprint['hash']:
+        ## Touched but not changed: keep the new mtime so that it is not rehashed next time
+        entry['mtime'] = fingerprint['mtime']
+        return None
+    return fingerprint
+
+def _report(file, stats, episodes, seconds, output = print):
+    """ Outputs the results of compiling a Record (one line per call to output) """
+    output(str(file))
+    output(f"\tShows: {len(stats)}")
+    output(f"\tEpisodes: {len(episodes)}")
+    output(f"\tParsed in: {seconds:.2f}s")
+
+def compile_directory(directory, statsfile = None, episodesfile = None, recurse = False, workers = None, mode = "full", incremental = False, manifest = None, output = print):
     """ Compiles a directory of SeasonRecords into masterstats and masterepisodes files
     
         statsfile and episodesfile should be valid filename paths if they are provided.
         If not provided, they will be the module defaults (in the current work directory).
         If recurse is True, will search each subdirectory for SeasonRecords (default is False).
+        If workers is greater than 1, Records will be parsed in a process pool with that many
+        processes (0 or less uses one process per cpu). Otherwise Records are parsed one-at-a-time.
+        mode is passed to each SeasonRecord (see SeasonRecord).
+        Records are output in season order (as determined by their filenames; ties retain directory order)
+        so that the output files are the same regardless of workers. Each Record's rows are written
+        to temporary files as soon as that Record has been compiled; the output files are only replaced
+        once every Record has been compiled, so they are left unchanged if any Record fails.
+        If incremental is True, a compile manifest recording each Record's size, mtime, sha256 hash
+        and compiled rows is maintained (by default next to the output files: see getmanifestfile; 
+        otherwise manifest should be the manifest's file path). Only Records which are new or have
+        changed since the manifest was saved are parsed and Records that no longer exist are dropped.
+        output is called with each line of progress (default print).
     """
     directory = testfileobj(directory)
     if not directory.is_dir():
@@ -141,43 +443,109 @@ def compile_directory(directory, statsfile = None, episodesfile = None, recurse
     if episodesfile is None:
         episodesfile = DEFAULTEPISODEFILE
 
-    outstats = list()
-    outepisodes = list()
+    ## Records are output in season order (based on their filenames); sort is stable, so this is deterministic regardless of workers
+    recordfiles = sorted(listrecordfiles(directory, recurse = recurse), key = lambda file: classes.extractseasonfromfilename(file.name))
 
-    def check_directory(directory):
-        recordfiles = classes.listvalidfilenames(directory)
+    entries = {}
+    if incremental:
+        if manifest is None:
+            manifest = getmanifestfile(directory, statsfile, episodesfile)
+        entries = load_manifest(manifest)
+    fingerprints = {}
+    tocompile = []
+    for file in recordfiles:
+        if incremental:
+            key = str(file.resolve())
+            fingerprint = checkmanifestentry(file, entries.get(key))
+            ## Unchanged files are loaded from the manifest
+            if fingerprint is None: continue
+            fingerprints[key] = fingerprint
+        tocompile.append(file)
+
+    newentries = {}
+    with contextlib.ExitStack() as stack:
+        compiled = stack.enter_context(contextlib.closing(iter_compiled(tocompile, workers = workers, mode = mode)))
+        tocompile = set(tocompile)
+
+        statswriter = episodeswriter = None
+        if statsfile:
+            statswriter = stack.enter_context(MasterWriter(statsfile, masterstatfields(), atomic = True))
+        if episodesfile:
+            episodeswriter = stack.enter_context(MasterWriter(episodesfile, masterepisodefields(), atomic = True))
 
-        ## Due to the potential memory overhead, we'll be doing records One-at-a-time (so we can close the file afterwards)
         for file in recordfiles:
-            print(file)
-            record = classes.SeasonRecord(file)
-            ## Old versions of RecordReader (pre-aldb2) used the OriginalID instead of the SeasonID
-            ## SeasonID is preferred in aldb2, so we're going to attempt to find and update the seasonid
-            serieslookup = MasterStat.list_from_SeasonRecord(record)
-            print("\tShows:",len(serieslookup))
-            outstats.extend(serieslookup)
-            serieslookup = {show.originalid:show for show in serieslookup}
-
-            episodes = MasterEpisode.list_from_SeasonRecord(record)
-            for episode in episodes:
-                if not episode.seasonid and episode.originalid in serieslookup:
-                    episode.seasonid = serieslookup[episode.originalid].seasonid
-            print("\tEpisodes:", len(episodes))
-            outepisodes.extend(episodes)
-            record.xlsx.close()
-        
-    def recursion(directory):
-        check_directory(directory)
-        for child in directory.iterdir():
-            if child.is_dir(): recursion(child)
-    
-    if recurse: recursion(directory)
-    else: check_directory(directory)
+            key = str(file.resolve())
+            if file in tocompile:
+                file, (seasonindex, stats, episodes), seconds = next(compiled)
+                _report(file, stats, episodes, seconds, output = output)
+                if incremental:
+                    newentries[key] = dict(fingerprints[key], seasonindex = seasonindex, stats = stats, episodes = episodes)
+            else:
+                entry = newentries[key] = entries[key]
+                stats, episodes = entry['stats'], entry['episodes']
+            ## Rows are written as each Record is processed
+            if statswriter: statswriter.writerows(stats)
+            if episodeswriter: episodeswriter.writerows(episodes)
+
+    if incremental:
+        ## Records which no longer exist are dropped from the manifest (and therefore the output)
+        save_manifest(newentries, manifest)
+
+def snapshot_directory(directory, recurse = False):
+    """ Returns a mapping of {Record file: (size, mtime)} for the Records in the directory """
+    out = {}
+    for file in listrecordfiles(directory, recurse = recurse):
+        try: stat = file.stat()
+        ## File was removed after it was listed
+        except FileNotFoundError: continue
+        out[file] = (stat.st_size, stat.st_mtime_ns)
+    return out
+
+def watch_directory(directory, statsfile = None, episodesfile = None, recurse = False, interval = 1.0, debounce = 2.0, workers = None, mode = "full", manifest = None, output = print, stop = None):
+    """ Watches a directory of SeasonRecords and recompiles the master files whenever a Record is added, changed, or removed.
+
+        The master files are first brought up to date with an incremental compile (see compile_directory).
+        The directory is then polled every interval seconds: once no further changes have been seen for
+        debounce seconds (Excel writes a file multiple times when saving), an incremental compile is run
+        so that only the changed Records are parsed and the other Records' rows are reused from the manifest.
+        If a compile fails, the failure is reported and the master files (and manifest) are left as they were.
+        Runs until interrupted (KeyboardInterrupt) or, if provided, until stop() returns True (checked after each poll).
+        statsfile, episodesfile, recurse, workers, mode, manifest, and output are passed to compile_directory.
+    """
+    def recompile():
+        try:
+            compile_directory(directory, statsfile = statsfile, episodesfile = episodesfile, recurse = recurse, workers = workers,
+                              mode = mode, incremental = True, manifest = manifest, output = output)
+        ## The master files are only replaced once every Record compiles.
+        ## The file may be mid-save or otherwise unreadable: it will be recompiled when it changes again
+        except Exception as e:
+            output(f"Compile failed: {e}")
+            return False
+        return True
 
-    if statsfile:
-        save_masterstats(outstats, statsfile)
-    if episodesfile:
-        save_masterepisodes(outepisodes, episodesfile)
+    ## Snapshot first so that changes made during the initial compile are picked up
+    snapshot = snapshot_directory(directory, recurse = recurse)
+    recompile()
+    output(f"Watching {directory} ({len(snapshot)} Records)...")
+    pending = {}
+    try:
+        while not (stop and stop()):
+            time.sleep(interval)
+            current = snapshot_directory(directory, recurse = recurse)
+            now = time.monotonic()
+            for file in current.keys() | snapshot.keys():
+                if current.get(file) != snapshot.get(file):
+                    pending[file] = now
+            snapshot = current
+            if pending and all(now - changed >= debounce for changed in pending.values()):
+                for file in sorted(pending):
+                    output(f"{'Changed' if file in current else 'Removed'}: {file.name}")
+                pending.clear()
+                start = time.perf_counter()
+                if recompile():
+                    output(f"Master files updated in {time.perf_counter() - start:.2f}s")
+    except KeyboardInterrupt:
+        pass
 
 def compile_firstepisodes(directory, output, recurse = False):
     results = []
@@ -5,11 +5,18 @@ from alcustoms import sql
 
 ## Builtin
 import collections
+import contextlib
 import datetime
+import heapq
+import itertools
+import os
 import pathlib
+import queue
+import threading
 ## Sister Module
 from aldb2.Anime import anime
 from aldb2.Anime import sql as animesql
+from aldb2.Core.sql import util
 from aldb2.webmodules import sql as websql
 
 """ Dependencies: Core, Anime, AnimeLife, webmodules """
@@ -43,396 +50,875 @@ class ImportResult():
     def success(self):
         return bool(self.result)
 
-def import_master(db, masterstats = None, masterepisodes = None, overwrite = False):
-    """ Import masterstats and/or masterepisodes into the given database.
+ImportResults = collections.namedtuple("ImportResults","stats, episodes")
+""" The outcome of an import: stats and episodes are lists of ImportResults (for each MasterStat and MasterEpisode, respectively) """
+
+def _tofirstepisode(value):
+    """ Converts a MasterStat's firstepisode (a datetime from a Record or iter_masterstats, or a string from load_masterstats) to a datetime """
+    if not value: return None
+    if isinstance(value,datetime.datetime): return value
+    if isinstance(value,datetime.date): return datetime.datetime.combine(value,datetime.time())
+    return datetime.datetime.fromisoformat(str(value))
+
+@util.row_factory_saver
+def _getanimemedium(db):
+    result = db.execute("""SELECT mediumid FROM mediums WHERE medium LIKE 'anime';""").fetchone()
+    if result is None:
+        raise AttributeError("anime medium is not defined in the database")
+    return result[0]
+
+@util.row_factory_saver
+def _writerankings(db, inserts, updates):
+    """ Adds new al_weeklyranking rows and updates existing ones; both should be lists of tuples of (week, animeseason, episodenumber, rank, hypelistrank) """
+    db.executemany("""INSERT INTO al_weeklyranking (week, animeseason, episodenumber, rank, hypelistrank) VALUES (?,?,?,?,?);""", inserts)
+    db.executemany("""UPDATE al_weeklyranking SET rank = :rank, hypelistrank = :hypelistrank WHERE week = :week AND animeseason = :animeseason AND episodenumber = :episodenumber;""",
+                   [dict(week = week, animeseason = animeseason, episodenumber = episodenumber, rank = rank, hypelistrank = hypelistrank)
+                    for (week, animeseason, episodenumber, rank, hypelistrank) in updates])
+
+@util.row_factory_saver
+def _addsiteid(db, seasonid, websiteid, siteid):
+    """ Adds the siteid for the season and website if it is not already set (webmodules_siteids replaces any other siteid for the season and website) """
+    db.execute("""INSERT INTO webmodules_siteids (season, website, siteid) SELECT :season, :website, :siteid
+WHERE NOT EXISTS (SELECT 1 FROM webmodules_siteids WHERE season = :season AND website = :website AND siteid = :siteid);""",
+               dict(season = seasonid, website = websiteid, siteid = siteid))
+
+@util.row_factory_saver
+def _updateepisodetotals(db, seasonids = None):
+    """ Raises season.episodes and animelibrary.episodeswatched to the number of ranked episodes for each of the given seasons
+        (adding the season to the library if necessary). If seasonids is None, all seasons with ranked episodes are updated.
+        Rankings whose seasonid is not in the season table are ignored.
+
+        The episodes are counted for all seasons at once with a single grouped query and the updates are batched.
+    """
+    counts = db.execute("""
+SELECT animeseasons.seasonid, COUNT(*) FROM al_weeklyranking
+JOIN animeseasons ON al_weeklyranking.animeseason = animeseasons.animeseasonid
+JOIN season ON animeseasons.seasonid = season.seasonid
+GROUP BY animeseasons.seasonid;""").fetchall()
+    if seasonids is not None:
+        seasonids = set(seasonids)
+        counts = [(seasonid, count) for (seasonid, count) in counts if seasonid in seasonids]
+    counts = [dict(seasonid = seasonid, count = count) for (seasonid, count) in counts]
+    db.executemany("""UPDATE season SET episodes = :count WHERE seasonid = :seasonid AND (episodes IS NULL OR episodes < :count);""", counts)
+    db.executemany("""INSERT INTO animelibrary (season) SELECT :seasonid WHERE NOT EXISTS (SELECT 1 FROM animelibrary WHERE season = :seasonid);""", counts)
+    db.executemany("""UPDATE animelibrary SET episodeswatched = :count
+WHERE libraryid = (SELECT MIN(libraryid) FROM animelibrary WHERE season = :seasonid) AND (episodeswatched IS NULL OR episodeswatched < :count);""", counts)
+
+class ImportContext():
+    """ Lookup tables for MasterImporter.
+
+        Each lookup is loaded from the database the first time it is needed (i.e.- once per import) and
+        is kept up to date as the importer adds rows, so that per-row lookups are dictionary hits.
+            seasonlookup: {yearseason name: yearseasonid} (see Anime.sql.getseasonallookup)
+            seasonids: set of season.seasonid
+            websites: {webmodules_website name: wmsiteid}
+            animeseasons: {(seasonid, yearseasonid, year): animeseasonid}
+            rankings: set of al_weeklyranking (animeseason, week, episodenumber) keys (see rankingkey)
+        The animeseasons and rankings lookups are only maintained by the row-by-row import: bulk imports
+        only use seasonlookup and websites.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.seasonlookup = animesql.getseasonallookup(db)
+        self._seasonids = None
+        self._websites = None
+        ## {site: webmodules_website id}
+        self._siteids = {}
+        self._animeseasons = None
+        self._rankings = None
+
+    def _fetchall(self, query):
+        with sql.Utilities.temp_row_factory(self.db,None):
+            return self.db.execute(query).fetchall()
 
-        In order to import stats and episodes with this method, the show/episode's SeasonID must
-        be set. This method returns a 
+    @property
+    def seasonids(self)-> set:
+        if self._seasonids is None:
+            self._seasonids = {seasonid for (seasonid,) in self._fetchall("""SELECT seasonid FROM season;""")}
+        return self._seasonids
 
-        db should be a properly set up Database Connection for aldb2.
-        By default, masterstats and masterepisodes refer to the module-default master file names
-        in the current work directory. If provided, masterstats and/or masterepisodes should refer
-        to existing files. If False, the file will not be imported into the database. If left as
-        the default and the given file does not exist, the import for that filetype will be
-        silently skipped.
-        If overwrite is True, the database will be updated to match the provided files; existing
-        records in the database that do not exist in the master file will not be removed or modified.
-        By default (overwrite is False), this method will not update existing records and will only
-        add missing ones.
-    """
-    with sql.Utilities.temp_row_factory(db,sql.advancedrow_factory):
-        if masterstats:
-            masterstats = pathlib.Path(masterstats).resolve()
-            if not masterstats.exists():
-                raise ValueError("masterstats must be an existing file.")
-        if masterepisodes:
-            masterepisodes = pathlib.Path(masterepisodes).resolve()
-            if not masterepisodes.exists():
-                raise ValueError("masterepisodes must be an existing file.")
-        if masterstats is None:
-            masterstats = pathlib.Path(master.DEFAULTSTATFILE).resolve()
-            if not masterstats.exists():
-                masterstats = None
-        if masterepisodes is None:
-            masterepisodes = pathlib.Path(master.DEFAULTEPISODEFILE).resolve()
-            if not masterepisodes.exists():
-                masterepisodes = None
-
-        stats = []
-        if masterstats:
-            stats = master.load_masterstats(masterstats)
-        episodes = []
-        if masterepisodes:
-            episodes = master.load_masterepisodes(masterepisodes)
-
-        ## Potential early exit to save time
-        if not stats and not episodes: return
-
-        ## Constant, Lookup, and Table Setup 
-        ANIMEMEDIUM = db.getadvancedtable("mediums").quickselect(medium__like = "anime").first()
-        if ANIMEMEDIUM is None:
-            raise AttributeError("anime medium is not defined in the database")
-        ANIMEMEDIUM = ANIMEMEDIUM.mediumid
-        SEASONLOOKUP = animesql.getseasonallookup(db)
-
-        if stats:
-            """
-                ### Stats
-                # Season Table: seasonid 
-                #
-                # Aliases: originalname name	
-                # AnimeLibrary: notes
-                # AnimeSeasons: seasonindex
-                # Images_Anime: image
-                # Links_Anime: website channel/channelhomepage pv
-                # AiringInfo: firstepisode
-                # webmodules_SiteIDs: showboyid annid anilistid malid anidbid 
-                #
-                # Unused: originalid seriesid subseriesid watching include day group rssfeedname hashtag lastseason 
-                #
-                ## >seriesid and subseriesid should validate seasonid
-            
-            """
-
-            seasontable = db.getadvancedtable("season")
-            aliasestable = db.getadvancedtable("aliases_season")
-            animeseasonstable = db.getadvancedtable("animeseasons")
-            librarytable = db.getadvancedtable("animelibrary")
-            linkstable = db.getadvancedtable("links_anime")
-            imagestable = db.getadvancedtable("images_anime")
-            airingtable = db.getadvancedtable("airinginfo")
-            sitestable = db.getadvancedtable("webmodules_siteids")
-            websitetable = db.getadvancedtable("webmodules_website")
+    @property
+    def websites(self)-> dict:
+        if self._websites is None:
+            self._websites = dict(self._fetchall("""SELECT name, wmsiteid FROM webmodules_website;"""))
+        return self._websites
+
+    @property
+    def animeseasons(self)-> dict:
+        if self._animeseasons is None:
+            self._animeseasons = {}
+            ## Ordered so that the first animeseasonid is kept for duplicate rows
+            for (seasonid, yearseasonid, year, animeseasonid) in self._fetchall("""SELECT seasonid, season, year, animeseasonid FROM animeseasons ORDER BY animeseasonid;"""):
+                self._animeseasons.setdefault((seasonid, yearseasonid, year), animeseasonid)
+        return self._animeseasons
+
+    @property
+    def rankings(self)-> set:
+        if self._rankings is None:
+            self._rankings = {self.rankingkey(animeseason, week, episodenumber) for (animeseason, week, episodenumber)
+                              in self._fetchall("""SELECT animeseason, week, episodenumber FROM al_weeklyranking;""")}
+        return self._rankings
+
+    @staticmethod
+    def rankingkey(animeseasonid, week, episodenumber)-> tuple:
+        """ Returns the rankings key for an al_weeklyranking row or MasterEpisode.
+
+            week and episodenumber are normalized to an int and a float (respectively) as they may be strings
+            when read from a master file (e.g.- "1" or "1.0" from load_masterepisodes).
+        """
+        return (animeseasonid, int(float(week)), float(episodenumber))
+
+    @staticmethod
+    def toseasonid(seasonid):
+        """ Converts a seasonid (which may be a string or float when read from a master file or Record) to an integer (it is returned unchanged if it cannot be converted) """
+        try: return int(float(seasonid))
+        except (TypeError, ValueError): return seasonid
+
+    def getseasonid(self, seasonid)-> int|None:
+        """ Returns the given seasonid as an integer if it exists in the season table, otherwise None """
+        seasonid = self.toseasonid(seasonid)
+        if seasonid in self.seasonids: return seasonid
+        return None
+
+    def getwebsiteid(self, site)-> int:
+        """ Returns the webmodules_website id for the given site name or url (see webmodules.sql.validate_add_siteid) """
+        if site not in self._siteids:
+            _module = websql.get_sitemodule(self.db, site)
+            if _module.SITENAME not in self.websites:
+                raise ValueError("Could not get ID for website")
+            self._siteids[site] = self.websites[_module.SITENAME]
+        return self._siteids[site]
+
+    def getanimeseasonid(self, seasonid, yearseasonid, year)-> int:
+        """ Returns the animeseasonid for the given season, yearseason, and year (adding it if it does not exist) """
+        key = (self.toseasonid(seasonid), yearseasonid, year)
+        if key not in self.animeseasons:
+            with sql.Utilities.temp_row_factory(self.db,None):
+                self.animeseasons[key] = self.db.execute("""INSERT INTO animeseasons (seasonid, season, year) VALUES (?,?,?);""",key).lastrowid
+        return self.animeseasons[key]
+
+def _iterstatsiteids(season):
+    """ Yields (site, siteid) for each of the MasterStat's site ids (e.g.- malid) which is set """
+    for (kw,value) in season.to_dict().items():
+        if value and kw.endswith("id") and kw.lower() not in ['originalid','seasonid','subseriesid','seriesid']:
+            yield kw.rstrip("id"), value
+
+## Aliases, links, and images are shared between apps and identify their owner by (node, tablename): MasterStats belong to the Season (node = seasonid).
+## Each table ignores rows which are already present. aliases only allows a single unofficial alias per language for each node,
+## so the first alias imported for each language is kept.
+ALIASSQL = """INSERT OR IGNORE INTO aliases (node, tablename, alias, language) VALUES (:node, 'season', :alias, :language);"""
+LINKSQL = """INSERT OR IGNORE INTO links (node, tablename, url, identification) VALUES (:node, 'season', :url, :identification);"""
+IMAGESQL = """INSERT OR IGNORE INTO images (node, tablename, url, imagetype) VALUES (:node, 'season', :url, :imagetype);"""
+
+#################### Bulk Import
+## Temporary tables used by MasterImporter's bulk mode
+IMPORTTABLES = [
+    """CREATE TEMP TABLE IF NOT EXISTS import_stats (idx INTEGER PRIMARY KEY, seasonid INT NOT NULL, name TEXT, originalname TEXT, notes TEXT, yearseason INT, year INT, animeseasonid INT, firstepisode TEXT, time TEXT, image TEXT, website TEXT, channelhomepage TEXT, pv TEXT);""",
+    """CREATE TEMP TABLE IF NOT EXISTS import_siteids (idx INT NOT NULL, seasonid INT NOT NULL, website INT NOT NULL, siteid TEXT NOT NULL);""",
+    """CREATE TEMP TABLE IF NOT EXISTS import_episodes (seasonid INT NOT NULL, yearseason INT NOT NULL, year INT NOT NULL, animeseasonid INT, week INT, episodenumber REAL, rank REAL, hypelistrank INT);""",
+    """CREATE INDEX IF NOT EXISTS temp.import_episodes_ranking ON import_episodes (animeseasonid, week, episodenumber);""",
+    ]
+
+## Set-based statements run by _bulkimportstats (in order) once import_stats and import_siteids are populated.
+## Rows are inserted in the order that the row-by-row import would add them (i.e.- by MasterStat) so that both modes produce the same rows.
+BULKSTATSQL = [
+## Aliases
+"""INSERT OR IGNORE INTO aliases (node, tablename, alias, language)
+SELECT seasonid, 'season', alias, language FROM (
+    SELECT idx, 0 AS position, seasonid, name AS alias, 'english' AS language FROM import_stats WHERE name IS NOT NULL
+    UNION ALL
+    SELECT idx, 1, seasonid, originalname, 'japanese' FROM import_stats WHERE originalname IS NOT NULL)
+ORDER BY idx, position;""",
+## Notes (appended to the Season's first library entry)
+"""INSERT INTO animelibrary (season)
+SELECT seasonid FROM import_stats AS new
+WHERE notes IS NOT NULL AND NOT EXISTS (SELECT 1 FROM animelibrary WHERE season = new.seasonid)
+GROUP BY seasonid ORDER BY MIN(idx);""",
+"""UPDATE animelibrary SET notes = COALESCE(notes,'') || (
+    SELECT group_concat(notes,'') FROM (SELECT notes FROM import_stats WHERE seasonid = animelibrary.season AND notes IS NOT NULL ORDER BY idx))
+WHERE libraryid IN (SELECT MIN(libraryid) FROM animelibrary WHERE season IN (SELECT seasonid FROM import_stats WHERE notes IS NOT NULL) GROUP BY season);""",
+## Anime Seasons
+"""INSERT INTO animeseasons (seasonid, season, year)
+SELECT seasonid, yearseason, year FROM import_stats AS new
+WHERE NOT EXISTS (SELECT 1 FROM animeseasons WHERE seasonid = new.seasonid AND season = new.yearseason AND year = new.year)
+GROUP BY seasonid, yearseason, year ORDER BY MIN(idx);""",
+"""UPDATE import_stats SET animeseasonid = (
+    SELECT MIN(animeseasonid) FROM animeseasons
+    WHERE animeseasons.seasonid = import_stats.seasonid AND animeseasons.season = import_stats.yearseason AND animeseasons.year = import_stats.year);""",
+## First Episode (the last MasterStat for each Anime Season wins)
+"""INSERT INTO airinginfo (animeseason)
+SELECT animeseasonid FROM import_stats AS new
+WHERE firstepisode IS NOT NULL AND NOT EXISTS (SELECT 1 FROM airinginfo WHERE animeseason = new.animeseasonid)
+GROUP BY animeseasonid ORDER BY MIN(idx);""",
+"""UPDATE airinginfo SET (firstepisode, time) = (
+    SELECT firstepisode, time FROM import_stats WHERE animeseasonid = airinginfo.animeseason AND firstepisode IS NOT NULL ORDER BY idx DESC LIMIT 1)
+WHERE airinginfoid IN (SELECT MIN(airinginfoid) FROM airinginfo WHERE animeseason IN (SELECT animeseasonid FROM import_stats WHERE firstepisode IS NOT NULL) GROUP BY animeseason);""",
+## Image
+"""INSERT OR IGNORE INTO images (node, tablename, url, imagetype)
+SELECT seasonid, 'season', image, 'poster' FROM import_stats WHERE image IS NOT NULL ORDER BY idx;""",
+## Website, Stream, and PV
+"""INSERT OR IGNORE INTO links (node, tablename, url, identification)
+SELECT seasonid, 'season', url, identification FROM (
+    SELECT idx, 0 AS position, seasonid, website AS url, 'homepage' AS identification FROM import_stats WHERE website IS NOT NULL
+    UNION ALL
+    SELECT idx, 1, seasonid, channelhomepage, 'stream' FROM import_stats WHERE channelhomepage IS NOT NULL
+    UNION ALL
+    SELECT idx, 2, seasonid, pv, 'pv' FROM import_stats WHERE pv IS NOT NULL)
+ORDER BY idx, position;""",
+## Site IDs (webmodules_siteids replaces on conflict, so the last siteid for each Season/website wins)
+"""INSERT INTO webmodules_siteids (season, website, siteid)
+SELECT seasonid, website, siteid FROM import_siteids AS new
+WHERE rowid IN (SELECT MAX(rowid) FROM import_siteids GROUP BY seasonid, website)
+    AND NOT EXISTS (SELECT 1 FROM webmodules_siteids WHERE season = new.seasonid AND website = new.website AND siteid = new.siteid)
+ORDER BY rowid;""",
+]
+
+## Set-based statements run by _bulkimportepisodes (in order) once import_episodes is populated
+BULKEPISODESQL = [
+"""INSERT INTO animeseasons (seasonid, season, year)
+SELECT seasonid, yearseason, year FROM import_episodes AS new
+WHERE NOT EXISTS (SELECT 1 FROM animeseasons WHERE seasonid = new.seasonid AND season = new.yearseason AND year = new.year)
+GROUP BY seasonid, yearseason, year ORDER BY MIN(rowid);""",
+"""UPDATE import_episodes SET animeseasonid = (
+    SELECT MIN(animeseasonid) FROM animeseasons
+    WHERE animeseasons.seasonid = import_episodes.seasonid AND animeseasons.season = import_episodes.yearseason AND animeseasons.year = import_episodes.year);""",
+## Existing rankings are updated before new ones are added. The last row for each ranking wins and new rankings are added in the order
+## that they first appear (as the row-by-row import does: an upsert would use up an AUTOINCREMENT id for each conflicting row)
+"""UPDATE al_weeklyranking SET (rank, hypelistrank) = (
+    SELECT rank, hypelistrank FROM import_episodes
+    WHERE animeseasonid = al_weeklyranking.animeseason AND week = al_weeklyranking.week AND episodenumber = al_weeklyranking.episodenumber
+    ORDER BY rowid DESC LIMIT 1)
+WHERE EXISTS (SELECT 1 FROM import_episodes
+    WHERE animeseasonid = al_weeklyranking.animeseason AND week = al_weeklyranking.week AND episodenumber = al_weeklyranking.episodenumber);""",
+"""INSERT INTO al_weeklyranking (week, animeseason, episodenumber, rank, hypelistrank)
+SELECT week, animeseasonid, episodenumber, rank, hypelistrank FROM import_episodes AS new
+WHERE rowid IN (SELECT MAX(rowid) FROM import_episodes GROUP BY animeseasonid, week, episodenumber)
+    AND NOT EXISTS (SELECT 1 FROM al_weeklyranking WHERE animeseason = new.animeseasonid AND week = new.week AND episodenumber = new.episodenumber)
+ORDER BY (SELECT MIN(rowid) FROM import_episodes WHERE animeseasonid = new.animeseasonid AND week = new.week AND episodenumber = new.episodenumber);""",
+]
+
+@util.row_factory_saver
+def _createimporttables(db):
+    for statement in IMPORTTABLES: db.execute(statement)
 
+@util.row_factory_saver
+def _dropimporttables(db):
+    for table in ["import_stats","import_siteids","import_episodes"]:
+        db.execute(f"""DROP TABLE IF EXISTS temp.{table};""")
+
+@util.row_factory_saver
+def _bulkimportstats(db, stats, context):
+    """ Imports a batch of MasterStats using the import_stats and import_siteids temporary tables and returns a list of ImportResults.
+
+        context should be the ImportContext for the import.
+    """
+    results = [None for season in stats]
+    rows = []
+    for idx,season in enumerate(stats):
+        if not season.seasonid:
+            results[idx] = ImportResult(False,"No seasonid",season)
+            continue
+        animeseason = master.getanimeseason(season.seasonindex)
+        dt = _tofirstepisode(season.firstepisode)
+        rows.append((idx, context.toseasonid(season.seasonid), season.name or None, season.originalname or None, season.notes or None,
+                     context.seasonlookup[animeseason.season], animeseason.year,
+                     str(dt.date()) if dt else None, str(dt.time().replace(microsecond = 0)) if dt else None,
+                     season.image or None, season.website or None, season.channelhomepage or None, season.pv or None))
+    db.execute("""DELETE FROM import_stats;""")
+    db.execute("""DELETE FROM import_siteids;""")
+    db.executemany("""INSERT INTO import_stats (idx, seasonid, name, originalname, notes, yearseason, year, firstepisode, time, image, website, channelhomepage, pv)
+VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?);""", rows)
+
+    missing = [idx for (idx,) in db.execute("""SELECT idx FROM import_stats WHERE seasonid NOT IN (SELECT seasonid FROM season);""")]
+    for idx in missing:
+        results[idx] = ImportResult(False,"seasonid not in Database",stats[idx])
+    db.executemany("""DELETE FROM import_stats WHERE idx = ?;""", [(idx,) for idx in missing])
+
+    siteids = []
+    for idx,season in enumerate(stats):
+        if results[idx] is not None: continue
+        for site,value in _iterstatsiteids(season):
+            siteids.append((idx, context.toseasonid(season.seasonid), context.getwebsiteid(site), value))
+        results[idx] = ImportResult(True,None,season)
+    db.executemany("""INSERT INTO import_siteids (idx, seasonid, website, siteid) VALUES (?,?,?,?);""", siteids)
+
+    for statement in BULKSTATSQL: db.execute(statement)
+    return results
+
+@util.row_factory_saver
+def _bulkimportepisodes(db, rows):
+    """ Imports a batch of episode rows of (seasonid, yearseason, year, week, episodenumber, rank, hypelistrank) using the import_episodes temporary table """
+    db.execute("""DELETE FROM import_episodes;""")
+    db.executemany("""INSERT INTO import_episodes (seasonid, yearseason, year, week, episodenumber, rank, hypelistrank) VALUES (?,?,?,?,?,?,?);""", rows)
+    for statement in BULKEPISODESQL: db.execute(statement)
+
+class MasterImporter():
+    """ Imports MasterStats and MasterEpisodes into the database.
+
+        MasterStats and MasterEpisodes can come from any source: master files (see import_master) or
+        SeasonRecords (see import_records). They are buffered and written in batches of batchsize.
+        When finish is called, the remaining objects are written and the episode totals of each
+        season that received episodes are updated.
+
+        If bulk is True, each batch is loaded into temporary tables and imported with set-based
+        INSERT...SELECT statements instead of looking up and updating each field of each MasterStat
+        individually. Both modes produce the same ImportResults and database rows (apart from the ids of
+        webmodules_siteids rows which are replaced more than once during an import).
+        Lookups are shared between batches via an ImportContext.
+
+        MasterImporter does not commit: it should be used inside a transaction (import_master and
+        import_records run the whole import inside a single transaction).
+        In order to import stats and episodes, the show/episode's SeasonID must be set.
+    """
+    def __init__(self, db, overwrite = False, batchsize = 1000, bulk = False):
+        self.db = db
+        self.overwrite = overwrite
+        self.batchsize = batchsize
+        self.bulk = bulk
+        self.results = ImportResults([],[])
+        self._stats = []
+        self._episodes = []
+        ## Seasons which have received episodes (see finish)
+        self._episodeseasons = set()
+
+        self.animemedium = _getanimemedium(db)
+        self.context = ImportContext(db)
+        if bulk: _createimporttables(db)
+
+    def addstats(self, stats):
+        """ Adds MasterStats to the import """
+        for stat in stats:
+            self._stats.append(stat)
+            if len(self._stats) >= self.batchsize: self.writestats()
+
+    def addepisodes(self, episodes):
+        """ Adds MasterEpisodes to the import """
+        for episode in episodes:
+            self._episodes.append(episode)
+            if len(self._episodes) >= self.batchsize: self.writeepisodes()
+
+    def flush(self):
+        """ Writes all buffered MasterStats and MasterEpisodes """
+        self.writestats()
+        self.writeepisodes()
+
+    def finish(self)-> ImportResults:
+        """ Flushes the import, updates episode totals, and returns the ImportResults """
+        self.flush()
+        if self._episodeseasons:
+            _updateepisodetotals(self.db, self._episodeseasons)
+        self._episodeseasons.clear()
+        if self.bulk: _dropimporttables(self.db)
+        return self.results
+
+    def writestats(self):
+        """ Writes the buffered MasterStats """
+        stats, self._stats = self._stats, []
+        if not stats: return
+        if self.bulk:
+            self.results.stats.extend(_bulkimportstats(self.db, stats, self.context))
+            return
+        """
+            ### Stats
+            # Season Table: seasonid 
+            #
+            # Aliases: originalname name	
+            # AnimeLibrary: notes
+            # AnimeSeasons: seasonindex
+            # Images: image
+            # Links: website channel/channelhomepage pv
+            # AiringInfo: firstepisode
+            # webmodules_SiteIDs: showboyid annid anilistid malid anidbid 
+            #
+            # Unused: originalid seriesid subseriesid watching include day group rssfeedname hashtag lastseason 
+            #
+            ## >seriesid and subseriesid should validate seasonid
+        
+        """
+        db, context = self.db, self.context
+        with sql.Utilities.temp_row_factory(db,None):
             for season in stats:
                 ## We'll use continue to cut down on the indentation
                 if not season.seasonid:
-                    outstats.append(ImportResult(False,"No seasonid",season))
+                    self.results.stats.append(ImportResult(False,"No seasonid",season))
                     continue
-                dbentry = seasontable.quickselect(seasonid = season.seasonid).first()
-                #print(f"Updating Season: {dbentry.row}")
+                seasonid = context.getseasonid(season.seasonid)
             
-                if not dbentry: 
-                    outstats.append(ImportResult(False,"seasonid not in Database",season))
+                if seasonid is None: 
+                    self.results.stats.append(ImportResult(False,"seasonid not in Database",season))
                     continue
 
-                ## English Name
-                if season.name:
-                    result = aliasestable.get_or_addrow(season = season.seasonid, seasonalias = season.name, language = "english").first()
-                    #print(f"Added English Name: {seasontable.quickselect(pk = dbentry).first().row}")
-
-                ## Japanese Alias
-                if season.originalname:
-                    result = aliasestable.get_or_addrow(season = season.seasonid, seasonalias = season.originalname, language = "japanese").first()
-                    #print(f"Added Japanese Alias: {aliasestable.quickselect(pk = result).first().row}")
+                ## English Name and Japanese Alias
+                for alias,language in [(season.name, "english"), (season.originalname, "japanese")]:
+                    if alias:
+                        db.execute(ALIASSQL, dict(node = seasonid, alias = alias, language = language))
 
                 ## notes
                 if season.notes:
-                    result = librarytable.get_or_addrow(season = season.seasonid).first()
-                    libraryentry = librarytable.quickselect(libraryid = result).first()
-                    notes = ""
-                    if libraryentry.notes: notes = libraryentry.notes
-                    librarytable.quickupdate(WHERE ={"libraryid":libraryentry}, notes = notes + season.notes)
-                    #print(f"Updated Library: {librarytable.quickselect(pk = libraryentry).first().row}")
+                    db.execute("""INSERT INTO animelibrary (season) SELECT :season WHERE NOT EXISTS (SELECT 1 FROM animelibrary WHERE season = :season);""", dict(season = seasonid))
+                    db.execute("""UPDATE animelibrary SET notes = COALESCE(notes,'') || :notes
+WHERE libraryid = (SELECT MIN(libraryid) FROM animelibrary WHERE season = :season);""", dict(season = seasonid, notes = season.notes))
 
                 ## Season
-                animeseason = anime.parseanimeseason_toobject(season.seasonindex)
-                animeseasonid = animeseasonstable.get_or_addrow(seasonid = dbentry, season = SEASONLOOKUP[animeseason.season], year = animeseason.year).first()
-                res = animeseasonstable.quickselect(pk = animeseasonid).first()
+                animeseason = master.getanimeseason(season.seasonindex)
+                animeseasonid = context.getanimeseasonid(seasonid, context.seasonlookup[animeseason.season], animeseason.year)
 
                 ## firstepisode
-                if season.firstepisode:
-                    airinginfo = airingtable.get_or_addrow(animeseason = animeseasonid).first()
-                    try:
-                        dt = datetime.datetime.strptime(season.firstepisode,"%Y-%m-%d %H:%M:%S")
-                    except:
-                        dt = datetime.datetime.strptime(season.firstepisode,"%Y-%m-%d %H:%M:%S.%f")
-                    airingtable.quickupdate(WHERE = {"pk":airinginfo}, firstepisode = dt.date(), time = str(dt.time().replace(microsecond = 0)))#.strftime("%H:%M:%S"))
-                    #res = airingtable.quickselect(pk = airinginfo).first()
-                    #print(f"Added first episode: {res.row}")
+                dt = _tofirstepisode(season.firstepisode)
+                if dt:
+                    db.execute("""INSERT INTO airinginfo (animeseason) SELECT :animeseason WHERE NOT EXISTS (SELECT 1 FROM airinginfo WHERE animeseason = :animeseason);""",
+                               dict(animeseason = animeseasonid))
+                    db.execute("""UPDATE airinginfo SET firstepisode = :firstepisode, time = :time
+WHERE airinginfoid = (SELECT MIN(airinginfoid) FROM airinginfo WHERE animeseason = :animeseason);""",
+                               dict(animeseason = animeseasonid, firstepisode = str(dt.date()), time = str(dt.time().replace(microsecond = 0))))
 
                 ## image
                 if season.image:
-                    res = imagestable.get_or_addrow(season = season.seasonid, url = season.image, imagetype = "poster").first()
-                    #res = imagestable.quickselect(pk = res).first()
-                    #print(f"Added image: {res.row}")
+                    db.execute(IMAGESQL, dict(node = seasonid, url = season.image, imagetype = "poster"))
                 
-                ## website
-                if season.website:
-                    res = linkstable.get_or_addrow(season = season.seasonid, url = season.website, identification = "homepage").first()
-                    #res = linkstable.quickselect(pk = res).first()
-                    #print(f"Added website: {res.row}")
-
-                ## stream
-                if season.channelhomepage:
-                    res = linkstable.get_or_addrow(season = season.seasonid, url = season.channelhomepage, identification = "stream").first()
-                    #res = linkstable.quickselect(pk = res).first()
-                    #print(f"Added homepage: {res.row}")
-
-                ## pv
-                if season.pv:
-                    res = linkstable.get_or_addrow(season = season.seasonid, url = season.pv, identification = "pv").first()
-                    #res = linkstable.quickselect(pk = res).first()
-                    #print(f"Added pv: {res.row}")
+                ## website, stream, and pv
+                for url,identification in [(season.website, "homepage"), (season.channelhomepage, "stream"), (season.pv, "pv")]:
+                    if url:
+                        db.execute(LINKSQL, dict(node = seasonid, url = url, identification = identification))
 
                 ## siteids
-                for (kw,value) in season.to_dict().items():
-                    if value and kw.endswith("id") and kw.lower() not in ['originalid','seasonid','subseriesid','seriesid']:
-                        site = kw.rstrip("id")
-                        res = websql.validate_add_siteid(db,season.seasonid,site,value)
-                        #res2 = sitestable.quickselect(pk = res).first()
-                        #print(f"Added {site} Siteid: {res2.row} {res2.website.row}")
-
-        if episodes:
-            """
-                ### Episodes
-                # Season Table seasonid
-                #
-                # AnimeLibrary: sum(episodes)
-                # AnimeSeason: seasonindex
-                # AL_WeeklyRanking: week rank episodenumber hypelistrank
-                #
-                # Unused: originalid
-                #
-                ## >seriesid and seasonindex should exist in Stats
-            """
-
-            ## Episodelookup is a lookup formatted: {"{seasonid}-{seasonindex}": [episodes],}
-            episodelookup = collections.defaultdict(list)
-            for episode in episodes:
-                if episode.seasonid and episode.seasonindex:
-                    episodelookup[f"{episode.seasonid}-{episode.seasonindex}"].append(episode)
-
-            seasontable = db.getadvancedtable("season")
-            librarytable = db.getadvancedtable("animelibrary")
-            animeseasonstable = db.getadvancedtable("animeseasons")
-            rankingtable = db.getadvancedtable("al_weeklyranking")
-
-
-            for seasonepisodes in episodelookup.values():
-                first = seasonepisodes[0]
-
-                yearseasonid = first.animeseason.season
-                yearseasonid = SEASONLOOKUP[yearseasonid]
-                seasonid = animeseasonstable.get_or_addrow(seasonid = first.seasonid, season = yearseasonid, year = first.animeseason.year).first()
-                #print("Added AnimeSeason:", dict(animeseasonstable.quickselect(pk = seasonid).first().row))
-
-                for episode in seasonepisodes:
-                    rankingid = rankingtable.quickselect(animeseason = seasonid, week = episode.week, episodenumber = episode.episodenumber).first()
-                    if not rankingid:
-                        rankingid = rankingtable.addrow(animeseason = seasonid, week = episode.week, episodenumber = episode.episodenumber, rank = episode.rank)
-                    rankingtable.quickupdate(WHERE = {"pk":rankingid}, rank = episode.rank, hypelistrank = episode.hypelistrank)
-                    #print("Added Episode:", dict(rankingtable.quickselect(pk = rankingid).first().row))
-
-
-                ## len(episodes)
-                allseasons = animeseasonstable.quickselect(seasonid = first.seasonid)
-                allepisodes = list(itertools.chain.from_iterable([rankingtable.quickselect(animeseason = aseason) for aseason in allseasons]))
-                if not allepisodes:
-                    raise ValueError()
-
-                allepisodes = len(allepisodes)
-
-                ## season.episodes
-                season = seasontable.quickselect(pk = first.seasonid).first()
-                eps = season.episodes
-                if not eps: eps = 0
-                if allepisodes > eps:
-                    seasontable.quickupdate(WHERE = {"pk":season}, episodes = allepisodes)
-                    #print(f"Updated Season episodes count:", dict(seasontable.quickselect(pk = season).first().row))
-
-                ## len(episodes)
-                libraryid = librarytable.get_or_addrow(season = first.seasonid).first()
-                libraryentry = librarytable.quickselect(pk = libraryid).first()
-                eps = libraryentry.episodeswatched
-                if not eps: eps = 0
-                if allepisodes > eps:
-                    librarytable.quickupdate(WHERE = {"pk":libraryentry}, episodeswatched = allepisodes)
-                    #print(f"Updated library episodewatched count:", dict(librarytable.quickselect(pk = libraryentry).first().row))
+                for site,value in _iterstatsiteids(season):
+                    _addsiteid(db, seasonid, context.getwebsiteid(site), value)
+
+                self.results.stats.append(ImportResult(True,None,season))
+
+    def writeepisodes(self):
+        """ Writes the buffered MasterEpisodes """
+        episodes, self._episodes = self._episodes, []
+        if not episodes: return
+        """
+            ### Episodes
+            # Season Table seasonid
+            #
+            # AnimeLibrary: sum(episodes)
+            # AnimeSeason: seasonindex
+            # AL_WeeklyRanking: week rank episodenumber hypelistrank
+            #
+            # Unused: originalid
+            #
+            ## >seriesid and seasonindex should exist in Stats
+        """
+        context = self.context
+        rows = []
+        inserts, updates = [], []
+        for episode in episodes:
+            if not episode.seasonid:
+                self.results.episodes.append(ImportResult(False,"No seasonid",episode))
+                continue
+            if not episode.seasonindex:
+                self.results.episodes.append(ImportResult(False,"No seasonindex",episode))
+                continue
+            seasonid = context.toseasonid(episode.seasonid)
+            animeseason = episode.animeseason
+            ## load_masterepisodes leaves blank hypelistranks as empty strings
+            hypelistrank = episode.hypelistrank if episode.hypelistrank != "" else None
+            if self.bulk:
+                rows.append((seasonid, context.seasonlookup[animeseason.season], animeseason.year, episode.week, episode.episodenumber, episode.rank, hypelistrank))
+            else:
+                animeseasonid = context.getanimeseasonid(seasonid, context.seasonlookup[animeseason.season], animeseason.year)
+                key = context.rankingkey(animeseasonid, episode.week, episode.episodenumber)
+                (animeseasonid, week, episodenumber) = key
+                row = (week, animeseasonid, episodenumber, episode.rank, hypelistrank)
+                if key in context.rankings:
+                    updates.append(row)
+                else:
+                    inserts.append(row)
+                    context.rankings.add(key)
+            self._episodeseasons.add(seasonid)
+            self.results.episodes.append(ImportResult(True,None,episode))
+        if self.bulk: _bulkimportepisodes(self.db, rows)
+        else: _writerankings(self.db, inserts, updates)
+
+def _resolvemasterfile(file, default):
+    """ Validates a masterstats/masterepisodes argument for import_master (see import_master) """
+    if file:
+        file = pathlib.Path(file).resolve()
+        if not file.exists():
+            raise ValueError(f"{file} must be an existing file.")
+        return file
+    if file is None:
+        file = pathlib.Path(default).resolve()
+        if file.exists(): return file
+    return None
+
+def import_master(db, masterstats = None, masterepisodes = None, overwrite = False, batchsize = 1000, bulk = False):
+    """ Import masterstats and/or masterepisodes into the given database.
 
-def compile_masterstats(db, animeseasonid):
-    """ Compiles the MasterStats object from the database for the given animeseasonid """
-    with sql.Utilities.temp_row_factory(db,sql.advancedrow_factory):
-        animeseasonstable = db.getadvancedtable("animeseasons")
-    season = animeseasonstable.quickselect(pk = animeseasonid).first()
-
-    if not season: raise ValueError("Invalid animeseasonid")
-    """ Current stats
-    ## Season
-    seasonid, name
-    ## AnimeSeasons
-    seasonindex, renewal, lastseason
-    ## Aliases_Season
-    originalname (jpn)
-    ## Links_Anime
-    channel + channelhomepage (homepage), website , pv
-    ## AiringInfo
-    firstepisode
-    ## Images_Anime
-    image (poster)
-    ## AnimeLibrary
-    notes
-    ## AL_WeeklyRanking
-    include (can be assumed by existence of episodes)
-    ## Webmodules_SiteIDs
-    showboyid , annid , anilistid , malid , anidbid
-
-    ## Can't use
-    originalid, watching , day , group , rssfeedname , hashtag
+        In order to import stats and episodes with this method, the show/episode's SeasonID must
+        be set. This method returns an ImportResults namedtuple of ImportResults for each MasterStat
+        and MasterEpisode.
+
+        db should be a properly set up Database Connection for aldb2.
+        By default, masterstats and masterepisodes refer to the module-default master file names
+        in the current work directory. If provided, masterstats and/or masterepisodes should refer
+        to existing files. If False, the file will not be imported into the database. If left as
+        the default and the given file does not exist, the import for that filetype will be
+        silently skipped.
+        If overwrite is True, the database will be updated to match the provided files; existing
+        records in the database that do not exist in the master file will not be removed or modified.
+        By default (overwrite is False), this method will not update existing records and will only
+        add missing ones.
+        The files are read lazily (see master.iter_masterstats) and written in batches of batchsize
+        inside a single transaction. If bulk is True, each batch is imported with set-based statements
+        (see MasterImporter).
+        db can be a connection or a database file, in which case a pooled connection is used (see Core.sql.util.pooledconnection).
     """
+    masterstats = _resolvemasterfile(masterstats, master.DEFAULTSTATFILE)
+    masterepisodes = _resolvemasterfile(masterepisodes, master.DEFAULTEPISODEFILE)
+
+    ## Potential early exit to save time
+    if not masterstats and not masterepisodes: return ImportResults([],[])
 
-    with sql.Utilities.temp_row_factory(db,sql.advancedrow_factory):
-        aliasestable = db.getadvancedtable("aliases_season")
-        linkstable = db.getadvancedtable("links_anime")
-        airingtable = db.getadvancedtable("airinginfo")
-        imagestable = db.getadvancedtable("images_anime")
-        librarytable = db.getadvancedtable("animelibrary")
-        rankingtable = db.getadvancedtable("al_weeklyranking")
-        websitetable = db.getadvancedtable("webmodules_website")
-        siteidtable = db.getadvancedtable("webmodules_siteids")
-    
+    with util.pooledconnection(db) as db, db:
+        importer = MasterImporter(db, overwrite = overwrite, batchsize = batchsize, bulk = bulk)
+        if masterstats:
+            importer.addstats(master.iter_masterstats(masterstats))
+        if masterepisodes:
+            importer.addepisodes(master.iter_masterepisodes(masterepisodes))
+        return importer.finish()
+
+def import_records(db, files, workers = None, mode = "full", overwrite = False, batchsize = 1000, bulk = False, masterstats = None, masterepisodes = None):
+    """ Imports Records into the given database without creating master files first.
+
+        files should be an iterable of Record files (e.g.- master.listrecordfiles). The Records are compiled
+        via master.iter_compiled (workers and mode are passed to it) and each Record's MasterStats and
+        MasterEpisodes are passed to a MasterImporter as soon as it is compiled. The whole import runs
+        inside a single transaction.
+        If masterstats and/or masterepisodes are provided, the compiled MasterStats/MasterEpisodes are also
+        exported to those files.
+        batchsize and bulk are passed to the MasterImporter.
+        db can be a connection or a database file, in which case a pooled connection is used (see Core.sql.util.pooledconnection).
+        Returns an ImportResults namedtuple (see import_master).
+    """
+    with contextlib.ExitStack() as stack:
+        statswriter = episodeswriter = None
+        if masterstats:
+            statswriter = stack.enter_context(master.MasterStatWriter(masterstats))
+        if masterepisodes:
+            episodeswriter = stack.enter_context(master.MasterEpisodeWriter(masterepisodes))
+        db = stack.enter_context(util.pooledconnection(db))
+        ## Transaction
+        stack.enter_context(db)
+        importer = MasterImporter(db, overwrite = overwrite, batchsize = batchsize, bulk = bulk)
+        for file, (seasonindex, stats, episodes), seconds in master.iter_compiled(files, workers = workers, mode = mode):
+            stats = [master.MasterStat(**stat) for stat in stats]
+            episodes = [master.MasterEpisode(**episode) for episode in episodes]
+            importer.addstats(stats)
+            importer.addepisodes(episodes)
+            if statswriter: statswriter.writerows(stats)
+            if episodeswriter: episodeswriter.writerows(episodes)
+        return importer.finish()
+
+## Site ID columns of MasterStats which are exported from webmodules_siteids
+EXPORTSITEIDS = ["showboyid", "annid", "anilistid", "malid", "anidbid"]
+## Maximum number of animeseasonids bound to a single export query
+EXPORTCHUNKSIZE = 500
+
+""" Current stats
+## Season
+seasonid, name (falls back to season.season), seriesid
+## AnimeSeasons
+seasonindex, renewal, lastseason
+## Aliases (tablename = 'season')
+name (english), originalname (japanese)
+## Links (tablename = 'season')
+channelhomepage (stream), website (homepage), pv
+## AiringInfo
+firstepisode
+## Images (tablename = 'season')
+image (poster)
+## AnimeLibrary
+notes
+## AL_WeeklyRanking
+include (can be assumed by existence of episodes)
+## Webmodules_SiteIDs
+showboyid , annid , anilistid , malid , anidbid
+
+## Can't use
+originalid, watching , day , group , rssfeedname , hashtag
+"""
+## Returns one row per animeseason with all MasterStat columns. Rows which are "first" for the legacy quickselect().first() lookups
+## are selected with SQLite's bare column MIN(rowid) aggregate and then pivoted with conditional aggregation.
+## {animeseasonids} is replaced with the placeholders for the animeseasonids and the site id columns are bound by name (see _exportsitenames)
+MASTERSTATSQL = """
+WITH
+    selected AS (
+        SELECT animeseasons.animeseasonid, animeseasons.seasonid, animeseasons.season AS yearseasonid, yearseason.season AS yearseason, animeseasons.year
+        FROM animeseasons
+        LEFT JOIN yearseason ON animeseasons.season = yearseason.yearseasonid
+        WHERE animeseasons.animeseasonid IN ({animeseasonids})
+        ),
+    seasonaliases AS (
+        SELECT season,
+            MAX(CASE WHEN language = 'english' THEN alias END) AS name,
+            MAX(CASE WHEN language = 'japanese' THEN alias END) AS originalname
+        FROM (
+            SELECT node AS season, lower(language) AS language, alias, MIN(rowid)
+            FROM aliases WHERE tablename = 'season' AND node IN (SELECT seasonid FROM selected)
+            GROUP BY node, lower(language))
+        GROUP BY season
+        ),
+    seasonlinks AS (
+        SELECT season,
+            MAX(CASE WHEN identification = 'stream' THEN url END) AS channelhomepage,
+            MAX(CASE WHEN identification = 'homepage' THEN url END) AS website,
+            MAX(CASE WHEN identification = 'pv' THEN url END) AS pv
+        FROM (
+            SELECT node AS season, identification, url, MIN(rowid)
+            FROM links WHERE tablename = 'season' AND node IN (SELECT seasonid FROM selected)
+            GROUP BY node, identification)
+        GROUP BY season
+        ),
+    posters AS (
+        SELECT node AS season, url AS image, MIN(rowid)
+        FROM images WHERE tablename = 'season' AND imagetype = 'poster' AND node IN (SELECT seasonid FROM selected)
+        GROUP BY node
+        ),
+    airing AS (
+        SELECT animeseason, firstepisode, time, MIN(airinginfoid)
+        FROM airinginfo WHERE animeseason IN (SELECT animeseasonid FROM selected)
+        GROUP BY animeseason
+        ),
+    library AS (
+        SELECT season, notes, MIN(libraryid)
+        FROM animelibrary WHERE season IN (SELECT seasonid FROM selected)
+        GROUP BY season
+        ),
+    rankings AS (
+        SELECT DISTINCT animeseason
+        FROM al_weeklyranking WHERE animeseason IN (SELECT animeseasonid FROM selected)
+        ),
+    siteids AS (
+        SELECT season,
+            MAX(CASE WHEN name = :showboyid THEN siteid END) AS showboyid,
+            MAX(CASE WHEN name = :annid THEN siteid END) AS annid,
+            MAX(CASE WHEN name = :anilistid THEN siteid END) AS anilistid,
+            MAX(CASE WHEN name = :malid THEN siteid END) AS malid,
+            MAX(CASE WHEN name = :anidbid THEN siteid END) AS anidbid
+        FROM (
+            SELECT webmodules_siteids.season, webmodules_website.name, webmodules_siteids.siteid, MIN(webmodules_siteids.rowid)
+            FROM webmodules_siteids
+            LEFT JOIN webmodules_website ON webmodules_siteids.website = webmodules_website.wmsiteid
+            WHERE webmodules_siteids.season IN (SELECT seasonid FROM selected)
+            GROUP BY webmodules_siteids.season, webmodules_website.name)
+        GROUP BY season
+        ),
+    previous AS (
+        SELECT selected.animeseasonid, yearseason.season AS lastyearseason, prior.year AS lastyear, MAX(prior.year * 10 + prior.season)
+        FROM selected
+        JOIN animeseasons AS prior ON prior.seasonid = selected.seasonid AND prior.year * 10 + prior.season < selected.year * 10 + selected.yearseasonid
+        LEFT JOIN yearseason ON prior.season = yearseason.yearseasonid
+        GROUP BY selected.animeseasonid
+        )
+SELECT selected.animeseasonid, selected.seasonid, season.series AS seriesid, selected.yearseason, selected.year,
+    COALESCE(seasonaliases.name, season.season) AS name, seasonaliases.originalname,
+    seasonlinks.channelhomepage, seasonlinks.website, seasonlinks.pv,
+    airing.firstepisode, airing.time, posters.image, library.notes,
+    rankings.animeseason IS NOT NULL AS include,
+    previous.lastyearseason, previous.lastyear,
+    siteids.showboyid, siteids.annid, siteids.anilistid, siteids.malid, siteids.anidbid
+FROM selected
+LEFT JOIN season ON selected.seasonid = season.seasonid
+LEFT JOIN seasonaliases ON selected.seasonid = seasonaliases.season
+LEFT JOIN seasonlinks ON selected.seasonid = seasonlinks.season
+LEFT JOIN posters ON selected.seasonid = posters.season
+LEFT JOIN airing ON selected.animeseasonid = airing.animeseason
+LEFT JOIN library ON selected.seasonid = library.season
+LEFT JOIN rankings ON selected.animeseasonid = rankings.animeseason
+LEFT JOIN siteids ON selected.seasonid = siteids.season
+LEFT JOIN previous ON selected.animeseasonid = previous.animeseasonid
+ORDER BY selected.animeseasonid;"""
+
+def _chunks(values, size):
+    """ Splits a list into lists of at most size values """
+    return [values[i:i+size] for i in range(0, len(values), size)]
+
+def _exportsitenames(db):
+    """ Returns a mapping of {site id column: webmodules_website name} for EXPORTSITEIDS (the site modules are resolved once per export) """
+    return {heading:websql.get_sitemodule(db, heading.rstrip("id")).SITENAME for heading in EXPORTSITEIDS}
+
+def _masterstatfromrow(row):
+    """ Converts a row of MASTERSTATSQL to a MasterStat """
     ## Originalid is a positional arg butcannot be retrieved at current
     ## (may add a recordreader datbabase table later that can track it)
     output = dict(originalid = None)
-    output['seasonid'] = season.seasonid.pk
-    output['subseriesid'] = season.seasonid.subseries.pk
-    output['seriesid'] = season.seasonid.subseries.series.pk
-
-    yseason = animesql.get_AnimeSeason(season)
-    output['seasonindex'] = float(yseason)
-    
-    allaseas = animeseasonstable.quickselect(seasonid = season.seasonid)
-    for seas in allaseas:
-        if not seas.season:
-            print(seas.row)
-        seas.AnimeSeason = animesql.get_AnimeSeason(seas)
-    previousseas = sorted([seas for seas in allaseas if  seas.AnimeSeason < yseason], key = lambda seas: seas.AnimeSeason)
-
-    if previousseas:
+    for key in ["seasonid", "seriesid", "name", "originalname", "channelhomepage", "website", "pv", "image", "notes"] + EXPORTSITEIDS:
+        if row[key] is not None: output[key] = row[key]
+    output['seasonindex'] = anime.AnimeSeason(row['yearseason'], row['year']).seasonindex
+    if row['lastyear'] is not None:
         output['renewal'] = True
-        output['lastseason'] = str(previousseas[-1].AnimeSeason)
-
-    enalias = aliasestable.quickselect(season = season.seasonid, language__like = "english").first()
-    if enalias:
-        output['name'] = enalias.seasonalias
-    else:
-        with sql.Utilities.temp_row_factory(db,sql.dict_factory):
-            res = db.execute("""SELECT fulltext FROM season_fulltext WHERE seasonid = ?;""",(season.seasonid.pk,)).fetchone()
-            output['name'] = res
-    jpalias = aliasestable.quickselect(season = season.seasonid, language__like = "japanese").first()
-    if jpalias:
-        output['originalname'] = jpalias.seasonalias
-
-    homepage = linkstable.quickselect(season = season.seasonid, identification = "stream").first()
-    if homepage:
-        output['channelhomepage'] = homepage.url
-    website = linkstable.quickselect(season = season.seasonid, identification = "homepage").first()
-    if website:
-        output['website'] = website.url
-    pv = linkstable.quickselect(season = season.seasonid, identification = "pv").first()
-    if pv:
-        output['pv'] = pv.url
-
-    airinginfo = airingtable.quickselect(animeseason = season).first()
-    if airinginfo:
-        if airinginfo.firstepisode and airinginfo.time:
-            output['firstepisode'] = datetime.datetime.strptime(airinginfo.firstepisode+" "+airinginfo.time,"%Y-%m-%d %H:%M:%S")
-
-    poster = imagestable.quickselect(season = season.seasonid, imagetype = "poster").first()
-    if poster:
-        output['poster'] = poster.url
-
-    libraryitem = librarytable.quickselect(season = season.seasonid).first()
-    if libraryitem.notes:
-        output['notes'] = libraryitem.notes
-
-    episodes = rankingtable.quickselect(animeseason = season)
+        output['lastseason'] = str(anime.AnimeSeason(row['lastyearseason'], row['lastyear']))
+    if row['firstepisode'] and row['time']:
+        output['firstepisode'] = datetime.datetime.strptime(row['firstepisode']+" "+row['time'],"%Y-%m-%d %H:%M:%S")
     ## If we had any episode rankings, then the season is included
-    if episodes:
+    if row['include']:
         output['include'] = True
-    
-    for heading in ["showboyid", "annid", "anilistid", "malid", "anidbid"]:
-        sitename = heading.rstrip("id")
-        sitemodule = websql.get_sitemodule(db,sitename)
-        site = websitetable.quickselect(name = sitemodule.SITENAME).first()
-        sid = siteidtable.quickselect(season = season.seasonid, website = site).first()
-        if sid:
-            #print(f"{season.pk}\t{sitename}\t{sid}")
-            output[heading] = sid.siteid
-
     return master.MasterStat(**output)
 
-def compile_masterepisodes(db, animeseasonid):
-    """ Compiles a list of MasterEpisode objects from the database for the given animeseasonid """
-    with sql.Utilities.temp_row_factory(db,sql.advancedrow_factory):
-        animeseasonstable = db.getadvancedtable("animeseasons")
-        rankingtable = db.getadvancedtable("al_weeklyranking")
-
-    season = animeseasonstable.quickselect(pk = animeseasonid).first()
-    episodes = rankingtable.quickselect(animeseason = season)
-    """ Current Stats:
-        ## Season
-        seasonid
-        ## AnimeSeasons
-        seasonindex
-        ## AL_WeeklyRanking
-        week, rank, episodenumber, hypelistrank
-        ## Unused
-        originalid
+def compile_masterstats(db, animeseasonid):
+    """ Compiles the MasterStats object from the database for the given animeseasonid """
+    stats = list(iter_exportmasterstats(db, [animeseasonid]))
+    if not stats: raise ValueError("Invalid animeseasonid")
+    return stats[0]
+
+## Returns the al_weeklyranking rows of the given animeseasonids ({animeseasonids} is replaced with their placeholders).
+## Rows are sorted by season and week, and then in the order they were added to the database.
+MASTEREPISODESQL = """
+SELECT animeseasons.seasonid, yearseason.season AS yearseason, animeseasons.year,
+    al_weeklyranking.week, al_weeklyranking.rank, al_weeklyranking.episodenumber, al_weeklyranking.hypelistrank
+FROM al_weeklyranking
+LEFT JOIN animeseasons ON al_weeklyranking.animeseason = animeseasons.animeseasonid
+LEFT JOIN yearseason ON animeseasons.season = yearseason.yearseasonid
+WHERE al_weeklyranking.animeseason IN ({animeseasonids})
+ORDER BY animeseasons.year, animeseasons.season, al_weeklyranking.week, al_weeklyranking.animeseason, al_weeklyranking.animeweekid;"""
+
+def _masterepisodefromrow(row):
+    """ Converts a row of MASTEREPISODESQL to a MasterEpisode """
+    ## Originalid is a positional arg butcannot be retrieved at current
+    ## (may add a recordreader datbabase table later that can track it)
+    return master.MasterEpisode(originalid = None, seasonid = row['seasonid'], seasonindex = anime.AnimeSeason(row['yearseason'], row['year']).seasonindex,
+                                week = row['week'], rank = row['rank'], episodenumber = row['episodenumber'], hypelistrank = row['hypelistrank'])
+
+@util.row_factory_saver
+def _exportseasongroups(db, animeseasonids):
+    """ Groups the animeseasonids by season (i.e.- seasonindex), returning a list of lists of animeseasonids in season order """
+    animeseasonids = set(animeseasonids)
+    rows = db.execute("""SELECT animeseasonid, year, season FROM animeseasons ORDER BY year, season, animeseasonid;""").fetchall()
+    rows = [row for row in rows if row[0] in animeseasonids]
+    return [[animeseasonid for (animeseasonid, year, season) in group] for key,group in itertools.groupby(rows, key = lambda row: row[1:])]
+
+def _iterexportepisodes(db, seasongroups):
+    """ Yields the MasterEpisodes of each group of animeseasonids (see _exportseasongroups) """
+    for group in seasongroups:
+        query = MASTEREPISODESQL.format(animeseasonids = ",".join("?" for animeseasonid in group))
+        with sql.Utilities.temp_row_factory(db,sql.dict_factory):
+            rows = db.execute(query, group).fetchall()
+        for row in rows:
+            yield _masterepisodefromrow(row)
+
+def _exportstatchunk(db, chunk, sitenames):
+    """ Returns the MasterStats for a list of animeseasonids (see MASTERSTATSQL) """
+    query = MASTERSTATSQL.format(animeseasonids = ",".join(f":id{i}" for i in range(len(chunk))))
+    params = dict(sitenames, **{f"id{i}":animeseasonid for i,animeseasonid in enumerate(chunk)})
+    with sql.Utilities.temp_row_factory(db,sql.dict_factory):
+        rows = db.execute(query, params).fetchall()
+    return [_masterstatfromrow(row) for row in rows]
+
+## Number of items buffered by each export worker (see _threadediter)
+EXPORTBUFFER = 1000
+
+def _threadediter(function, *args, maxsize = EXPORTBUFFER):
+    """ Runs the generator function(*args) in a worker thread and yields its items.
+
+        At most maxsize items are buffered, so the worker only runs ahead of the consumer by that amount.
+        Exceptions raised by the worker are reraised to the consumer. If the consumer stops early
+        (i.e.- the generator is closed), the worker is stopped as well.
     """
-    def convert(episode):
-        ## Originalid is a positional arg butcannot be retrieved at current
-        ## (may add a recordreader datbabase table later that can track it)
-        output = dict(originalid = None)
-        output['week'], output['rank'],output['episodenumber'],output['hypelistrank'] =\
-            episode.week, episode.rank, episode.episodenumber,episode.hypelistrank
-        output['seasonindex'] = float(animesql.get_AnimeSeason(episode.animeseason))
-        output['seasonid'] = episode.animeseason.seasonid.seasonid
-        return master.MasterEpisode(**output)
-
-    return [convert(episode) for episode in episodes]
-
-def export_master(db, seasons = None, masterstats = None, masterepisodes = None):
-    """ Exports database into masterstats and masterepisodes files.
-
-        This function uses RecordReader.master's save_masterstats and save_masterepisodes to export masterstats and masterepisodes (respectively).
-        seasons should be a list of AnimeSeason objects or objects that can be parsed into AnimeSeasons by Anime.anime.parseanimeseason.
-        If seasons is None, all seasons will be exported from the database.
-        If masterstats or masterepisodes if False, that file will not be exported. If not supplied, these files will be exported to
-        the current work directory using the names "master_episodes.csv" and "master_episodes.csv", respectively. Otherwise, filenames or file
-        paths should be supplied.
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout = .1)
+                return True
+            except queue.Full: pass
+        return False
+
+    def run():
+        try:
+            for item in function(*args):
+                if not put((True, item)): return
+        except BaseException as e:
+            put((False, e))
+        else:
+            put((False, None))
+
+    thread = threading.Thread(target = run, daemon = True)
+    thread.start()
+    try:
+        while True:
+            isitem, item = items.get()
+            if isitem:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        stop.set()
+        thread.join()
+
+def _readonlyexport(file, function, *args):
+    """ Uses a pooled read-only connection to the database file for the duration of the generator function(connection, *args) """
+    with util.getconnectionmanager().reader(file) as connection:
+        yield from function(connection, *args)
+
+def _iterstatchunks(connection, chunks, sitenames):
+    for chunk in chunks:
+        yield _exportstatchunk(connection, chunk, sitenames)
+
+def _exportworkers(db, workers):
+    """ Returns the database file and number of workers to use for a parallel export, or (None, 1) if the export should run on db itself """
+    if workers is None or workers == 1: return None, 1
+    file = util.getdatabasefile(db)
+    if file is None: return None, 1
+    if workers <= 0: workers = os.cpu_count() or 1
+    return file, workers
+
+def iter_exportmasterstats(db, animeseasonids, workers = None):
+    """ Yields a MasterStat for each of the given animeseasonids (in animeseasonid order).
+
+        All columns are selected with a single query per EXPORTCHUNKSIZE animeseasons (see MASTERSTATSQL).
+        If workers is greater than 1, the chunks are queried by that many worker threads (0 or less uses
+        one thread per cpu), each with its own read-only connection. In-memory databases are always exported
+        on db.
     """
-    if masterstats is None:
-        masterstats = master.DEFAULTSTATFILE
-    if masterepisodes is None:
-        masterepisodes = master.DEFAULTEPISODEFILE
+    sitenames = _exportsitenames(db)
+    chunks = _chunks(sorted(set(animeseasonids)), EXPORTCHUNKSIZE)
+    file, workers = _exportworkers(db, workers)
+    if workers == 1:
+        for chunk in chunks:
+            yield from _exportstatchunk(db, chunk, sitenames)
+        return
+    ## Chunks are dealt out to the workers in turn and collected in the same order
+    streams = [_threadediter(_readonlyexport, file, _iterstatchunks, chunks[i::workers], sitenames, maxsize = 2) for i in range(workers)]
+    try:
+        for i in range(len(chunks)):
+            yield from next(streams[i % workers])
+    finally:
+        for stream in streams: stream.close()
+
+def iter_exportmasterepisodes(db, animeseasonids, workers = None):
+    """ Yields the MasterEpisodes for the given animeseasonids sorted by seasonindex and then week.
+
+        If workers is greater than 1, the export is sharded by season across that many worker threads
+        (0 or less uses one thread per cpu), each with its own read-only connection. Each worker
+        produces its episodes in (seasonindex, week) order and the results are combined with a k-way merge,
+        so only a bounded number of MasterEpisodes are held in memory. In-memory databases are always
+        exported on db.
+    """
+    groups = _exportseasongroups(db, animeseasonids)
+    file, workers = _exportworkers(db, workers)
+    if workers == 1:
+        yield from _iterexportepisodes(db, groups)
+        return
+    streams = [_threadediter(_readonlyexport, file, _iterexportepisodes, groups[i::workers]) for i in range(workers)]
+    try:
+        yield from heapq.merge(*streams, key = lambda episode: (episode.seasonindex, episode.week))
+    finally:
+        for stream in streams: stream.close()
 
-    if masterstats and masterstats.exists():
-        raise FileExistsError("masterstats file already exists")
-    if masterepisodes and masterepisodes.exists():
-        raise FileExistsError("masterepisodes file already exists")
+def compile_masterepisodes(db, animeseasonid):
+    """ Compiles a list of MasterEpisode objects from the database for the given animeseasonid """
+    return list(iter_exportmasterepisodes(db, [animeseasonid]))
 
-    rankingtable = db.getadvancedtable("al_weeklyranking")
+def _exportanimeseasonids(db, seasons):
+    """ Returns the animeseasonids to export for export_master's seasons argument (or None if there are no seasons to export) """
     trf = sql.Utilities.temp_row_factory
     if seasons:
         if not isinstance(seasons,(list,tuple)):
@@ -454,32 +940,46 @@ FROM aseas
 LEFT JOIN animeseasons ON animeseasons.animeseasonid = aseas.animeseason""").fetchall()
             seasons = [anime.parseanimeseason_toobject(season) for season in seasons]
 
-    ## Should only happen if no rankings have occured and seasons has not been manually set
-    if not seasons: return
-    seasons = [f'"{season}"' for season in seasons]
-    seasons = f"({','.join(seasons)})"
-    animeseasonstable = db.getadvancedtable("animeseasons")
-    with trf(db,sql.AdvancedRow_Factory(parent = animeseasonstable)):
-        series = db.execute(f"""
-WITH
-    yearseas AS (
-        SELECT animeseasonid, yearseason.season||" "||year AS yearseason
-        FROM animeseasons
-        LEFT JOIN yearseason ON animeseasons.season = yearseason.yearseasonid
-        )
-    SELECT animeseasons.animeseasonid as animeseasonid
-    FROM animeseasons
-    LEFT JOIN yearseas ON animeseasons.animeseasonid = yearseas.animeseasonid
-    WHERE yearseas.yearseason IN {seasons};
-""").fetchall()
-    
-    if masterstats:
-        seasons = [compile_masterstats(db,**season.row)
-                   for season in series]
-        master.save_masterstats(seasons,masterstats)
-
-    if masterepisodes:
-        episodes = [compile_masterepisodes(db,**season.row) for season in series]
-        episodes = list(itertools.chain.from_iterable(episodes))
-        episodes = sorted(sorted(episodes, key = lambda episode: episode.week), key = lambda episode: episode.seasonindex)
-        master.save_masterepisodes(episodes,masterepisodes)
\ No newline at end of file
+    if not seasons: return None
+    seasons = [str(season) for season in seasons]
+    with trf(db,None):
+        return [animeseasonid for (animeseasonid,) in db.execute(f"""
+SELECT animeseasonid
+FROM animeseasons
+LEFT JOIN yearseason ON animeseasons.season = yearseason.yearseasonid
+WHERE yearseason.season||' '||year IN ({",".join("?" for season in seasons)});""", seasons)]
+
+def export_master(db, seasons = None, masterstats = None, masterepisodes = None, workers = None):
+    """ Exports database into masterstats and masterepisodes files.
+
+        This function uses RecordReader.master's save_masterstats and save_masterepisodes to export masterstats and masterepisodes (respectively).
+        seasons should be a list of AnimeSeason objects or objects that can be parsed into AnimeSeasons by Anime.anime.parseanimeseason.
+        If seasons is None, all seasons will be exported from the database.
+        If masterstats or masterepisodes if False, that file will not be exported. If not supplied, these files will be exported to
+        the current work directory using the names "master_episodes.csv" and "master_episodes.csv", respectively. Otherwise, filenames or file
+        paths should be supplied.
+        If workers is greater than 1, the export is run by that many worker threads with read-only connections (see iter_exportmasterstats
+        and iter_exportmasterepisodes); in either case, the files are written as the rows are produced.
+        db can be a connection or a database file, in which case a pooled read-only connection is used (see Core.sql.util.pooledconnection).
+    """
+    if masterstats is None:
+        masterstats = master.DEFAULTSTATFILE
+    if masterepisodes is None:
+        masterepisodes = master.DEFAULTEPISODEFILE
+
+    if masterstats: masterstats = pathlib.Path(masterstats)
+    if masterepisodes: masterepisodes = pathlib.Path(masterepisodes)
+    if masterstats and masterstats.exists():
+        raise FileExistsError("masterstats file already exists")
+    if masterepisodes and masterepisodes.exists():
+        raise FileExistsError("masterepisodes file already exists")
+
+    with util.pooledconnection(db, readonly = True) as db:
+        animeseasonids = _exportanimeseasonids(db, seasons)
+        ## Should only happen if no rankings have occured and seasons has not been manually set
+        if animeseasonids is None: return
+        if masterstats:
+            master.save_masterstats(iter_exportmasterstats(db, animeseasonids, workers = workers),masterstats)
+
+        if masterepisodes:
+            master.save_masterepisodes(iter_exportmasterepisodes(db, animeseasonids, workers = workers),masterepisodes)
@@ -0,0 +1,554 @@
+""" aldb2.RecordReader.streaming
+
+    Read-only access to the Excel Tables in a Record Workbook.
+
+    AL_Excel.load_workbook (openpyxl's edit mode) builds every cell of every worksheet before
+    a single Table can be parsed. The classes in this module instead read the Workbook's Table
+    catalogue directly from the xlsx archive and then pull only the cell ranges belonging to
+    those Tables: StreamReader reads them from a read-only openpyxl Workbook while DirectReader
+    parses the Worksheet xml itself (without creating any openpyxl objects).
+
+    StreamTable mimics the parts of AL_Excel.EnhancedTable that are used by RecordReader
+    (displayName, ref, worksheet, and todicts) so that it can be passed to the RecordReader
+    classes in place of an EnhancedTable.
+"""
+
+## Builtin
+import collections
+import functools
+import pathlib
+import posixpath
+import re
+import time
+import typing
+import zipfile
+from xml.etree import ElementTree
+
+## Third Party
+import openpyxl
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+MAINNS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELNS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGERELNS = "http://schemas.openxmlformats.org/package/2006/relationships"
+TABLERELTYPE = RELNS + "/table"
+SHAREDSTRINGSRELTYPE = RELNS + "/sharedStrings"
+STYLESRELTYPE = RELNS + "/styles"
+
+WORKBOOKPATH = "xl/workbook.xml"
+
+## Used by peektables
+TABLETAGRE = re.compile(rb"<(?:\w+:)?table\s(?P<attributes>[^>]*)>")
+ATTRIBUTERE = re.compile(rb"""(\w+)\s*=\s*["']([^"']*)["']""")
+
+TableInfo = collections.namedtuple("TableInfo", "displayName, sheet, ref, headerrows, totalsrows, columns")
+""" A Table definition from the xlsx archive.
+
+    displayName: the Table's Name (as shown in Excel)
+    sheet: the name of the Worksheet that contains the Table
+    ref: the Table's cell range (e.g.- "A1:F20")
+    headerrows: the number of header rows (0 or 1)
+    totalsrows: the number of totals rows at the bottom of the Table
+    columns: the Table's column names as recorded in the Table definition
+"""
+
+def _qualify(tag: str, namespace: str = MAINNS)-> str:
+    return f"{{{namespace}}}{tag}"
+
+def _resolvetarget(source: str, target: str)-> str:
+    """ Resolves a relationship Target relative to the archive part that references it """
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+
+def _relspath(part: str)-> str:
+    """ Returns the path of the relationships part for the given archive part """
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", f"{name}.rels")
+
+def _readrelationships(archive: zipfile.ZipFile, part: str)-> typing.Dict[str, typing.Tuple[str,str]]:
+    """ Returns a mapping of {Relationship Id: (Type, resolved Target)} for the given archive part """
+    relspath = _relspath(part)
+    if relspath not in archive.NameToInfo:
+        return {}
+    root = ElementTree.fromstring(archive.read(relspath))
+    out = {}
+    for rel in root.iter(_qualify("Relationship", PACKAGERELNS)):
+        if rel.get("TargetMode") == "External": continue
+        out[rel.get("Id")] = (rel.get("Type"), _resolvetarget(part, rel.get("Target")))
+    return out
+
+def readsheetparts(archive: zipfile.ZipFile)-> typing.Dict[str,str]:
+    """ Returns an (ordered) mapping of {Worksheet Name: archive path of the Worksheet} """
+    root = ElementTree.fromstring(archive.read(WORKBOOKPATH))
+    rels = _readrelationships(archive, WORKBOOKPATH)
+    out = {}
+    for sheet in root.iter(_qualify("sheet")):
+        rid = sheet.get(_qualify("id", RELNS))
+        if rid not in rels: continue
+        out[sheet.get("name")] = rels[rid][1]
+    return out
+
+def _tableinfo(root: ElementTree.Element|dict, sheetname: str|None, columns: list|None)-> TableInfo:
+    ## headerRowCount defaults to 1 and totalsRowCount defaults to 0 per the OOXML spec
+    return TableInfo(displayName = root.get("displayName"), sheet = sheetname, ref = root.get("ref"),
+                     headerrows = int(root.get("headerRowCount", 1)), totalsrows = int(root.get("totalsRowCount", 0)),
+                     columns = columns)
+
+def readsheettables(archive: zipfile.ZipFile, sheetname: str, part: str)-> typing.List[TableInfo]:
+    """ Returns a list of TableInfos for the Tables on the given Worksheet (part should be the Worksheet's archive path) """
+    out = []
+    for (reltype, target) in _readrelationships(archive, part).values():
+        if reltype != TABLERELTYPE: continue
+        root = ElementTree.fromstring(archive.read(target))
+        columns = [column.get("name") for column in root.iter(_qualify("tableColumn"))]
+        out.append(_tableinfo(root, sheetname, columns))
+    return out
+
+def readtablecatalogue(archive: zipfile.ZipFile, sheetparts: typing.Optional[typing.Dict[str,str]] = None)-> typing.Dict[str,TableInfo]:
+    """ Returns a mapping of {Table displayName: TableInfo} for all Tables in the xlsx archive.
+
+        Only the Workbook, Worksheet relationship, and Table definition parts are read: no cell data is parsed.
+        sheetparts may be supplied if readsheetparts has already been called on the archive.
+    """
+    if sheetparts is None:
+        sheetparts = readsheetparts(archive)
+    out = {}
+    for sheetname, part in sheetparts.items():
+        for info in readsheettables(archive, sheetname, part):
+            out[info.displayName] = info
+    return out
+
+def peektables(archive: zipfile.ZipFile)-> typing.Dict[str,TableInfo]:
+    """ A faster, partial version of readtablecatalogue which only reads the opening tag of each Table definition.
+
+        The TableInfos' sheet and columns are None.
+    """
+    out = {}
+    for info in archive.infolist():
+        if not info.filename.startswith("xl/tables/") or not info.filename.endswith(".xml"): continue
+        ## Creating an xml parser for each (small) Table part costs more than reading it, so the
+        ## attributes of the opening tag are extracted with a regex instead
+        match = TABLETAGRE.search(archive.read(info))
+        if not match: continue
+        root = {key.decode():value.decode() for key,value in ATTRIBUTERE.findall(match.group("attributes"))}
+        out[root["displayName"]] = _tableinfo(root, None, None)
+    return out
+
+class StreamTable():
+    """ A read-only stand-in for AL_Excel.EnhancedTable whose rows are supplied by a StreamReader """
+    def __init__(self, info: TableInfo, reader: "StreamReader"):
+        self.info = info
+        self.reader = reader
+
+    @property
+    def displayName(self)-> str:
+        return self.info.displayName
+    @property
+    def ref(self)-> str:
+        return self.info.ref
+    @property
+    def worksheet(self):
+        ## Readers which do not create Worksheets (i.e.- DirectReader) return None
+        return self.reader.sheets.get(self.info.sheet)
+
+    def rows(self)-> typing.List[tuple]:
+        """ Returns the Table's cell values (header row included) as a list of tuples """
+        return self.reader.tablerows(self.info)
+
+    def todicts(self, keyfactory: typing.Optional[typing.Callable[[str],str]] = None)-> list:
+        """ Returns the Table's rows in the same format as AL_Excel.EnhancedTable.todicts:
+            index 0 is the list of (keyfactory-converted) headers and each subsequent index is a
+            dict for one row of the Table.
+        """
+        rows = self.rows()
+        if self.info.headerrows:
+            headers, rows = rows[0], rows[1:]
+            ## Fill any blank header cells with the column name from the Table definition
+            headers = [header if header is not None else column for header,column in zip(headers, self.info.columns)]
+        else:
+            headers = list(self.info.columns)
+        if self.info.totalsrows:
+            rows = rows[:-self.info.totalsrows]
+        if keyfactory:
+            headers = [keyfactory(str(header)) for header in headers]
+        return [list(headers),]+[dict(zip(headers,row)) for row in rows]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}<{self.displayName}:{self.ref}>"
+
+class StreamReader():
+    """ Reads a Workbook's Tables using a read-only openpyxl Workbook.
+
+        The Table catalogue is read from the archive when the StreamReader is created. Cell values
+        are only read when a Table's rows are requested: at that point every Table on the same
+        Worksheet is read in a single pass over the Worksheet (read-only Worksheets are re-parsed
+        from the start of the sheet for each iteration) and their rows are retained until the
+        StreamReader is closed.
+    """
+    def __init__(self, file: str|pathlib.Path, data_only: bool = True):
+        self.file = pathlib.Path(file)
+        with zipfile.ZipFile(self.file) as archive:
+            self.sheetparts = readsheetparts(archive)
+            self.catalogue = readtablecatalogue(archive, self.sheetparts)
+        self.workbook = openpyxl.load_workbook(filename = str(self.file), read_only = True, data_only = data_only)
+        self._sheets = None
+        self._rows: typing.Dict[str, typing.List[tuple]] = {}
+
+    @property
+    def sheets(self)-> dict:
+        if self._sheets is None:
+            self._sheets = {sheet:self.workbook[sheet] for sheet in self.workbook.sheetnames}
+        return self._sheets
+
+    def gettables(self)-> typing.Dict[str, StreamTable]:
+        """ Returns a mapping of {displayName: StreamTable} for every Table in the Workbook """
+        return {name:StreamTable(info, self) for name,info in self.catalogue.items()}
+
+    def tablerows(self, info: TableInfo)-> typing.List[tuple]:
+        """ Returns the cell values for the given Table (loading its Worksheet's Tables if necessary) """
+        if info.displayName not in self._rows:
+            self._loadsheet(info.sheet)
+        return self._rows[info.displayName]
+
+    def _loadsheet(self, sheetname: str):
+        """ Reads the values for all Tables on the given sheet in one pass """
+        tables = [(info, range_boundaries(info.ref)) for info in self.catalogue.values() if info.sheet == sheetname]
+        minrow = min(bounds[1] for info,bounds in tables)
+        maxrow = max(bounds[3] for info,bounds in tables)
+        mincol = min(bounds[0] for info,bounds in tables)
+        maxcol = max(bounds[2] for info,bounds in tables)
+        output = {info.displayName:[] for info,bounds in tables}
+        worksheet = self.sheets[sheetname]
+        for rowindex,row in enumerate(worksheet.iter_rows(min_row = minrow, max_row = maxrow, min_col = mincol, max_col = maxcol, values_only = True),
+                                      start = minrow):
+            for info,(left,top,right,bottom) in tables:
+                if top <= rowindex <= bottom:
+                    output[info.displayName].append(tuple(row[left-mincol:right-mincol+1]))
+        self._rows.update(output)
+
+    def parsesheet(self, sheetname: str, displayName: str, startrow: int = 1, startcolumn: int = 1)-> StreamTable:
+        """ Equivalent of RecordStats.parsesheet for a read-only Worksheet.
+
+            Reads the contiguous block of cells starting at the given row and column: the header row ends at
+            the first blank header and the Table ends at the first completely blank row.
+        """
+        worksheet = self.sheets[sheetname]
+        rows = []
+        width = None
+        for row in worksheet.iter_rows(min_row = startrow, min_col = startcolumn, values_only = True):
+            if width is None:
+                width = len(row)
+                if None in row: width = row.index(None)
+                if not width: break
+            row = tuple(row[:width])
+            ## read-only rows may be shorter than the header if trailing cells are blank
+            row = row + (None,)*(width-len(row))
+            if all(value is None for value in row): break
+            rows.append(row)
+        if not rows:
+            raise ValueError(f"Could not locate a Table on Worksheet: {sheetname}")
+        columns = [str(header) for header in rows[0]]
+        info = TableInfo(displayName = displayName, sheet = sheetname, ref = None,
+                         headerrows = 1, totalsrows = 0, columns = columns)
+        self._rows[displayName] = rows
+        return StreamTable(info, self)
+
+    def close(self):
+        self.workbook.close()
+        self._rows.clear()
+
+@functools.lru_cache(maxsize = None)
+def _columnindex(letters: str)-> int:
+    return column_index_from_string(letters)
+
+def _splitcoordinate(coordinate: str)-> typing.Tuple[int,int]:
+    """ Splits a cell reference (e.g.- "AB12") into a (column index, row) tuple """
+    for i,char in enumerate(coordinate):
+        if char.isdigit():
+            return _columnindex(coordinate[:i]), int(coordinate[i:])
+    raise ValueError(f"Invalid cell reference: {coordinate}")
+
+def _castnumber(value: str)-> int|float:
+    """ Converts a numeric cell value the same way openpyxl does """
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+def _elementtext(element: ElementTree.Element)-> str:
+    """ Returns the text of a Shared String or Inline String element (joining rich text runs and ignoring phonetic runs) """
+    t = element.find(_qualify("t"))
+    if t is not None:
+        return t.text or ""
+    return "".join(t.text or "" for r in element.iterfind(_qualify("r")) for t in r.iterfind(_qualify("t")))
+
+class DirectReader():
+    """ Reads a Workbook's Tables by parsing the xlsx archive directly.
+
+        The Table catalogue, Shared Strings, and cell Styles (only the number formats needed to
+        identify dates) are read from the archive as they are needed. Cell values are only read when a Table's rows are
+        requested: each Worksheet is parsed incrementally (see ElementTree.iterparse) up to the last row
+        that belongs to a Table and the values of all of the Tables on that Worksheet are retained until the
+        DirectReader is closed. Values are converted the same way that openpyxl converts them, so rows are
+        the same as those returned by StreamReader. If data_only is False, formulas are returned in place of
+        their cached values (as strings starting with "=").
+
+        DirectReader provides the same interface as StreamReader except that no Worksheets are created:
+        sheets is always empty and Tables' worksheets are None.
+    """
+    def __init__(self, file: str|pathlib.Path, data_only: bool = True):
+        self.file = pathlib.Path(file)
+        self.data_only = data_only
+        self.archive = zipfile.ZipFile(self.file)
+        self.sheetparts = readsheetparts(self.archive)
+        self._catalogue = None
+        self._sheetcatalogues: typing.Dict[str, typing.List[TableInfo]] = {}
+        self._workbookrels = None
+        self.sheets = {}
+        self._rows: typing.Dict[str, typing.List[tuple]] = {}
+        self._sharedstrings: typing.List[str] = []
+        self._stringparser = None
+        self._dateformats = None
+        self._timedeltaformats = None
+        self.epoch = CALENDAR_WINDOWS_1900
+
+    @property
+    def catalogue(self)-> typing.Dict[str,TableInfo]:
+        """ The Workbook's Table catalogue (see readtablecatalogue); read on first access """
+        if self._catalogue is None:
+            self._catalogue = readtablecatalogue(self.archive, self.sheetparts)
+        return self._catalogue
+
+    def sheetcatalogue(self, sheetname: str)-> typing.List[TableInfo]:
+        """ Returns the TableInfos for the Tables on the given Worksheet (without reading the whole catalogue) """
+        if self._catalogue is not None:
+            return [info for info in self._catalogue.values() if info.sheet == sheetname]
+        if sheetname not in self._sheetcatalogues:
+            self._sheetcatalogues[sheetname] = readsheettables(self.archive, sheetname, self.sheetparts[sheetname])
+        return self._sheetcatalogues[sheetname]
+
+    def _getpart(self, reltype: str)-> str|None:
+        """ Returns the archive path of the Workbook part with the given relationship type """
+        if self._workbookrels is None:
+            self._workbookrels = _readrelationships(self.archive, WORKBOOKPATH)
+        for (rtype, target) in self._workbookrels.values():
+            if rtype == reltype: return target
+
+    def _iterstrings(self)-> typing.Generator[str,None,None]:
+        part = self._getpart(SHAREDSTRINGSRELTYPE)
+        if not part: return
+        si = _qualify("si")
+        with self.archive.open(part) as f:
+            for event,element in ElementTree.iterparse(f):
+                if element.tag == si:
+                    yield _elementtext(element)
+                    element.clear()
+
+    def getstring(self, index: int)-> str:
+        """ Returns the Shared String at the given index.
+
+            Shared Strings are only parsed as far as the highest index that has been requested
+            (a Workbook's Shared Strings can be much larger than what is needed to read a few Tables).
+        """
+        strings = self._sharedstrings
+        if index >= len(strings):
+            if self._stringparser is None:
+                self._stringparser = self._iterstrings()
+            for string in self._stringparser:
+                strings.append(string)
+                if index < len(strings): break
+        return strings[index]
+
+    @property
+    def sharedstrings(self)-> typing.List[str]:
+        """ All of the Workbook's Shared Strings """
+        if self._stringparser is None:
+            self._stringparser = self._iterstrings()
+        self._sharedstrings.extend(self._stringparser)
+        return self._sharedstrings
+
+    def _loadstyles(self):
+        """ Determines which cell Styles (by index) are date and timedelta formats (and the Workbook's date epoch) """
+        self._dateformats, self._timedeltaformats = set(), set()
+        properties = ElementTree.fromstring(self.archive.read(WORKBOOKPATH)).find(_qualify("workbookPr"))
+        if properties is not None and properties.get("date1904") in ("1","true"):
+            self.epoch = CALENDAR_MAC_1904
+        part = self._getpart(STYLESRELTYPE)
+        if not part: return
+        root = ElementTree.fromstring(self.archive.read(part))
+        formats = dict(BUILTIN_FORMATS)
+        numfmts = root.find(_qualify("numFmts"))
+        if numfmts is not None:
+            for numfmt in numfmts.iterfind(_qualify("numFmt")):
+                formats[int(numfmt.get("numFmtId"))] = numfmt.get("formatCode")
+        cellxfs = root.find(_qualify("cellXfs"))
+        if cellxfs is None: return
+        for index,xf in enumerate(cellxfs.iterfind(_qualify("xf"))):
+            fmt = formats.get(int(xf.get("numFmtId", 0)))
+            if fmt and is_date_format(fmt):
+                self._dateformats.add(index)
+                if is_timedelta_format(fmt): self._timedeltaformats.add(index)
+
+    @property
+    def dateformats(self)-> typing.Set[int]:
+        if self._dateformats is None: self._loadstyles()
+        return self._dateformats
+
+    def gettables(self)-> typing.Dict[str, StreamTable]:
+        """ Returns a mapping of {displayName: StreamTable} for every Table in the Workbook """
+        return {name:StreamTable(info, self) for name,info in self.catalogue.items()}
+
+    def tablerows(self, info: TableInfo)-> typing.List[tuple]:
+        """ Returns the cell values for the given Table (loading its Worksheet's Tables if necessary) """
+        if info.displayName not in self._rows:
+            self._loadsheet(info.sheet)
+        return self._rows[info.displayName]
+
+    def itersheet(self, sheetname: str, minrow: int = 1, maxrow: int|None = None, mincol: int = 1, maxcol: int|None = None)-> typing.Generator[typing.Tuple[int, typing.Dict[int,typing.Any]],None,None]:
+        """ Parses the given Worksheet, yielding (row number, {column index: value}) for each row
+            in the given bounds that contains at least one cell. Parsing stops after maxrow.
+        """
+        getstring = self.getstring
+        dateformats = self.dateformats
+        timedeltaformats = self._timedeltaformats
+        data_only = self.data_only
+        sharedformulas = {}
+        rowtag, ctag, vtag, ftag, istag = _qualify("row"), _qualify("c"), _qualify("v"), _qualify("f"), _qualify("is")
+        rownumber = 0
+        with self.archive.open(self.sheetparts[sheetname]) as f:
+            for event,element in ElementTree.iterparse(f):
+                if element.tag != rowtag: continue
+                r = element.get("r")
+                rownumber = int(r) if r else rownumber + 1
+                if maxrow is not None and rownumber > maxrow: break
+                if rownumber < minrow:
+                    element.clear()
+                    continue
+                values = {}
+                column = 0
+                for cell in element.iterfind(ctag):
+                    coordinate = cell.get("r")
+                    column = _splitcoordinate(coordinate)[0] if coordinate else column + 1
+                    if column < mincol or (maxcol is not None and column > maxcol): continue
+                    datatype = cell.get("t", "n")
+                    formula = cell.find(ftag)
+                    if not data_only and formula is not None:
+                        value = self._parseformula(formula, coordinate, sharedformulas)
+                    elif datatype == "inlineStr":
+                        child = cell.find(istag)
+                        value = _elementtext(child) if child is not None else None
+                    else:
+                        v = cell.find(vtag)
+                        value = v.text if v is not None else None
+                        if value is not None:
+                            if datatype == "n":
+                                value = _castnumber(value)
+                                style = cell.get("s")
+                                if style and int(style) in dateformats:
+                                    value = from_excel(value, self.epoch, timedelta = int(style) in timedeltaformats)
+                            elif datatype == "s":
+                                value = getstring(int(value))
+                            elif datatype == "b":
+                                value = bool(int(value))
+                            elif datatype == "d":
+                                value = from_ISO8601(value)
+                            ## "str" (formula string) and "e" (error) values are returned as-is
+                    values[column] = value
+                element.clear()
+                if values: yield rownumber, values
+
+    def _parseformula(self, formula: ElementTree.Element, coordinate: str, sharedformulas: dict)-> str:
+        """ Returns the formula for a cell, translating Shared Formulas to the cell's location """
+        text = formula.text
+        if formula.get("t") == "shared" and formula.get("si") is not None:
+            si = formula.get("si")
+            if text:
+                sharedformulas[si] = Translator("=" + text, coordinate)
+            elif si in sharedformulas:
+                return sharedformulas[si].translate_formula(coordinate)
+        return "=" + (text or "")
+
+    def _loadsheet(self, sheetname: str):
+        """ Reads the values for all Tables on the given sheet in one pass """
+        tables = [(info, range_boundaries(info.ref)) for info in self.sheetcatalogue(sheetname)]
+        minrow = min(bounds[1] for info,bounds in tables)
+        maxrow = max(bounds[3] for info,bounds in tables)
+        mincol = min(bounds[0] for info,bounds in tables)
+        maxcol = max(bounds[2] for info,bounds in tables)
+        cells = dict(self.itersheet(sheetname, minrow = minrow, maxrow = maxrow, mincol = mincol, maxcol = maxcol))
+        empty = {}
+        for info,(left,top,right,bottom) in tables:
+            rows = []
+            for rowindex in range(top, bottom+1):
+                row = cells.get(rowindex, empty)
+                rows.append(tuple(row.get(column) for column in range(left, right+1)))
+            self._rows[info.displayName] = rows
+
+    def parsesheet(self, sheetname: str, displayName: str, startrow: int = 1, startcolumn: int = 1)-> StreamTable:
+        """ Equivalent of RecordStats.parsesheet (see StreamReader.parsesheet) """
+        cells = dict(self.itersheet(sheetname, minrow = startrow, mincol = startcolumn))
+        header = cells.get(startrow, {})
+        width = 0
+        while header.get(startcolumn + width) is not None: width += 1
+        rows = []
+        rowindex = startrow
+        while width:
+            row = cells.get(rowindex, {})
+            row = tuple(row.get(column) for column in range(startcolumn, startcolumn + width))
+            if all(value is None for value in row): break
+            rows.append(row)
+            rowindex += 1
+        if not rows:
+            raise ValueError(f"Could not locate a Table on Worksheet: {sheetname}")
+        columns = [str(header) for header in rows[0]]
+        info = TableInfo(displayName = displayName, sheet = sheetname, ref = None,
+                         headerrows = 1, totalsrows = 0, columns = columns)
+        self._rows[displayName] = rows
+        return StreamTable(info, self)
+
+    def close(self):
+        if self._stringparser is not None:
+            self._stringparser.close()
+        self.archive.close()
+        self._rows.clear()
+
+def benchmark(files: typing.Iterable[str|pathlib.Path], repeat: int = 3)-> typing.Dict[str, float]:
+    """ Times reading every Table (via todicts) from each file with AL_Excel ("openpyxl"), StreamReader ("stream"),
+        and DirectReader ("direct").
+
+        Returns a mapping of {reader: best total time in seconds} over repeat runs.
+    """
+    ## Import here as AL_Excel is only needed for the comparison
+    import AL_Excel
+    from AL_Excel import Tables
+
+    def openpyxlpath(file):
+        workbook = AL_Excel.load_workbook(filename = str(file), data_only = True)
+        try:
+            for ws,table in Tables.get_all_tables(workbook): table.todicts()
+        finally:
+            workbook.close()
+
+    def readerpath(cls):
+        def run(file):
+            reader = cls(file)
+            try:
+                for table in reader.gettables().values(): table.todicts()
+            finally:
+                reader.close()
+        return run
+
+    files = list(files)
+    paths = dict(openpyxl = openpyxlpath, stream = readerpath(StreamReader), direct = readerpath(DirectReader))
+    results = {}
+    for name,path in paths.items():
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            for file in files: path(file)
+            times.append(time.perf_counter() - start)
+        results[name] = min(times)
+    return results
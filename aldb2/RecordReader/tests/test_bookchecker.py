@@ -0,0 +1,44 @@
+## Framework
+import unittest
+## Test Target
+from aldb2.RecordReader import bookchecker
+
+## Sister Module
+from aldb2.RecordReader.tests.test_streaming import buildworkbook
+
+## Builtin
+import pathlib
+import tempfile
+from unittest import mock
+## Third Party
+import openpyxl
+
+class BookCheckerCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = pathlib.Path(directory.name)
+        self.cachedir = self.directory / "cache"
+        self.file = self.directory / "__Record Spring 2021.xlsx"
+        buildworkbook(self.file)
+        wb = openpyxl.load_workbook(self.file)
+        wb["Week 1"]["C2"] = "=A2*2"
+        wb.save(self.file)
+        return super().setUp()
+
+    def test_diffformulas(self):
+        """ Tests that added, changed, and removed formulas are reported """
+        old = {"A":"=1", "B":"=2", "C":"=3"}
+        new = {"A":"=1", "B":"=4", "D":"=5"}
+        self.assertEqual(bookchecker.diffformulas(old, new), [("changed", "B", "=2", "=4"), ("added", "D", None, "=5"), ("removed", "C", "=3", None)])
+
+    def test_scan(self):
+        """ Tests that signatures are read from the Week 1 Table and cached by file hash """
+        [(file, signature)] = bookchecker.scan([self.file,], cachedir = self.cachedir)
+        self.assertEqual(signature, dict(version = 4.3, season = "Spring", year = 2021, formulas = {"Rank": "=A2*2"}))
+        with mock.patch.object(bookchecker, "getsignature") as getsignature:
+            self.assertEqual(bookchecker.scan([self.file,], cachedir = self.cachedir), [(file, signature)])
+            getsignature.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+## Framework
+import unittest
+## Test Target
+from aldb2.RecordReader import classes
+
+## Builtin
+import datetime
+import pathlib
+import tempfile
+## Third Party
+import openpyxl
+from openpyxl.worksheet.table import Table
+
+def buildrecord(file, season = "Spring", year = 2021, version = 4.3, weeks = 3, shows = 5):
+    """ Creates a minimal Record Workbook with Record Stats, Show Stats, and a Ranking and Hype List Table for each week.
+
+        Show i has OriginalID i, SeasonID 100+i, and Name "Show i"; Ranks are shuffled each week.
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Record Stats"
+    ws.append(["Year","Season","Version"])
+    ws.append([year,season,version])
+    ws.add_table(Table(displayName = "RecordStats", ref = "A1:C2"))
+    ws = wb.create_sheet("Show Stats")
+    ws.append(["OriginalID","SeasonID","Name","Original Name","First Episode","Watching"])
+    for i in range(1,shows+1):
+        ws.append([i,100+i,f"Show {i}",f"Original {i}",datetime.datetime(year,4,i,22,30),True])
+    ws.add_table(Table(displayName = "Stats", ref = f"A1:F{shows+1}"))
+    for week in range(1,weeks+1):
+        ws = wb.create_sheet(f"Week {week}")
+        ws.append(["OriginalID","Name","Rank","New Rank","Episodes","Hype List Occurences"])
+        for i in range(1,shows+1):
+            ws.append([i,f"Show {i}",(i*3+week)%shows+1,i,week,0])
+        ws.add_table(Table(displayName = f"Week{week}", ref = f"A1:F{shows+1}"))
+        ws["H1"], ws["I1"], ws["J1"] = "OriginalID", "Name", "Occurences"
+        for i in range(1,4):
+            ws.cell(i+1,8,i)
+            ws.cell(i+1,9,f"Show {i}")
+            ws.cell(i+1,10,1)
+        ws.add_table(Table(displayName = f"HypeWeek{week}", ref = "H1:J4"))
+    wb.save(file)
+
+class RecordCase(unittest.TestCase):
+    """ Tests for SeasonRecord using a minimal Record """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file = pathlib.Path(directory.name) / "__Record Spring 2021.xlsx"
+        buildrecord(self.file)
+        self.record = classes.SeasonRecord(self.file, mode = "stream")
+        self.addCleanup(self.record.close)
+        return super().setUp()
+
+    def test_rankingweeks(self):
+        """ Tests that RankingWeeks lists every week but only parses a week when it is accessed """
+        weeks = self.record.weeks
+        self.assertEqual(list(weeks),[1,2,3])
+        self.assertEqual(len(weeks),3)
+        self.assertIn(2,weeks)
+        self.assertFalse(any(weeks.isloaded(week) for week in weeks))
+        week = weeks[2]
+        self.assertIsInstance(week,classes.RankingSheetV4)
+        self.assertEqual(week.weeknumber,2)
+        self.assertTrue(weeks.isloaded(2))
+        self.assertFalse(weeks.isloaded(1))
+        self.assertIs(self.record.week(2),week)
+        self.assertRaises(KeyError,weeks.__getitem__,4)
+
+    def test_rankingweeks_values(self):
+        """ Tests that lazily parsed weeks match the Ranking Tables """
+        for week in self.record.weeks.values():
+            with self.subTest(week = week.weeknumber):
+                self.assertEqual([episode.originalid for episode in week.getepisoderanking()],
+                                 sorted(range(1,6), key = lambda i: (i*3+week.weeknumber)%5+1))
+
+    def test_rankingcache(self):
+        """ Tests that cached rankings are recomputed when the week's shows or an Episode's rank changes """
+        week = self.record.week(1)
+        ranks = {episode.name:episode.rank for episode in week.getepisoderanking()}
+        normalized = week.normalized_ranks()
+        self.assertEqual(normalized,{episode.name:episode.normalizedrank for episode in week.getepisoderanking()})
+        self.assertEqual(normalized,{name:(rank - 1)/4 for name,rank in ranks.items()})
+
+        best = week.getepisoderanking()[0]
+        best.rank = 9
+        self.assertIs(week.getepisoderanking()[-1],best)
+        self.assertEqual(week.normalized_ranks()[best.name],1.0)
+        self.assertEqual(week.normalized_ranks()[week.getepisoderanking()[0].name],0.0)
+
+        best.ranktotal = 0
+        self.assertIs(week.getseasonranking()[0],best)
+
+        del week.shows[best.name]
+        self.assertNotIn(best.name,week.normalized_ranks())
+        self.assertEqual(max(week.normalized_ranks().values()),1.0)
+
+    def test_slots(self):
+        """ Tests that Shows and Episodes are slotted and that their to_dict output is unchanged """
+        show = self.record.showstats.shows[1]
+        episode = self.record.week(1).shows["Show 1"]
+        for obj in [show, episode]:
+            with self.subTest(obj = obj):
+                self.assertFalse(hasattr(obj,"__dict__"))
+                with self.assertRaises(AttributeError):
+                    obj.notanattribute = True
+        self.assertEqual((show.originalid, show.seasonid, show.name, show.originalname, show.watching),(1, 101, "Show 1", "Original 1", True))
+        self.assertEqual(show.to_dict()['firstepisode'],datetime.datetime(2021,4,1,22,30))
+        self.assertIs(episode.showstats,show)
+        self.assertEqual(episode.to_dict()['episodenumber'],1)
+
+class ShowStatsCase(unittest.TestCase):
+    """ Tests for ShowStats name lookups """
+    def setUp(self):
+        self.showstats = classes.MasterShowStats(shows = [
+            dict(originalid = 1, name = "Sword Art Online", originalname = "ソードアート・オンライン"),
+            dict(originalid = 2, name = "Attack on Titan", originalname = "Shingeki no Kyojin"),
+            dict(originalid = 3, name = "attack on titan", originalname = None),
+            ], idvalue = classes.MasterShowStats.MASTERIDVALUE)
+        return super().setUp()
+
+    def test_getshowbyname(self):
+        """ Tests that names and original names are matched case-insensitively and that earlier Shows take precedence """
+        shows = self.showstats.shows
+        self.assertIs(self.showstats.getshowbyname("sword art online"),shows[1])
+        self.assertIs(self.showstats.getshowbyname("SHINGEKI NO KYOJIN"),shows[2])
+        self.assertIs(self.showstats.getshowbyname("ソードアート・オンライン"),shows[1])
+        self.assertIs(self.showstats.getshowbyname("Attack on Titan"),shows[2])
+        self.assertRaises(ValueError,self.showstats.getshowbyname,"Sword Art Onlin")
+        self.assertRaises(ValueError,self.showstats.getshowbyname,1)
+
+    def test_getshowbyname_fuzzy(self):
+        """ Tests that fuzzy lookups only match names within the cutoff """
+        shows = self.showstats.shows
+        self.assertIs(self.showstats.getshowbyname("Sword Art Onlin", fuzzy = True),shows[1])
+        self.assertIs(self.showstats.getshowbyname("Shingeki no Kyoujin", fuzzy = True),shows[2])
+        self.assertRaises(ValueError,self.showstats.getshowbyname,"Sword Art Onlin", fuzzy = True, cutoff = 0.99)
+        self.assertRaises(ValueError,self.showstats.getshowbyname,"Naruto", fuzzy = True)
+
+    def test_buildnameindex(self):
+        """ Tests that the name index is only updated when it is rebuilt """
+        show = self.showstats.shows[1]
+        self.showstats.getshowbyname("Sword Art Online")
+        show.name = "SAO"
+        self.assertRaises(ValueError,self.showstats.getshowbyname,"SAO")
+        self.showstats.buildnameindex()
+        self.assertIs(self.showstats.getshowbyname("sao"),show)
+        self.assertRaises(ValueError,self.showstats.getshowbyname,"Sword Art Online")
+
+class HypeListCase(unittest.TestCase):
+    """ Tests for HypeListV1 and HypeListv4 """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = pathlib.Path(directory.name)
+        return super().setUp()
+
+    def loadweek(self, version, edit = None):
+        """ Builds a Record of the given version, applies edit to its Week 1 Worksheet, and returns Week 1 """
+        file = self.directory / "__Record Spring 2021.xlsx"
+        buildrecord(file, version = version, weeks = 1)
+        if edit:
+            wb = openpyxl.load_workbook(file)
+            edit(wb["Week 1"])
+            wb.save(file)
+        record = classes.SeasonRecord(file, mode = "stream")
+        self.addCleanup(record.close)
+        return record.week(1)
+
+    def loadhypelistv1(self, edit = None):
+        """ Builds a pre-v4 Record and returns a HypeListV1 created from its Week 1 Hype List Table (RankingSheets do not load them) """
+        week = self.loadweek(3.0, edit)
+        return classes.HypeListV1(week._record.weeks.hypetables[1], week)
+
+    def test_v1_norank(self):
+        """ Tests that pre-v4 Hype Lists are not loaded by the RankingSheet, so Episodes have no hypelistrank """
+        week = self.loadweek(3.0)
+        self.assertIn(1, week._record.weeks.hypetables)
+        self.assertIsNone(week.hypelist)
+        self.assertEqual({name:episode.hypelistrank for name,episode in week.shows.items()},
+                         {"Show 1":None,"Show 2":None,"Show 3":None,"Show 4":None,"Show 5":None})
+
+    def test_v1_nolastlist(self):
+        """ Tests that a pre-v4 Hype List without a Last List column can be created """
+        hypelist = self.loadhypelistv1()
+        self.assertEqual(hypelist.hypelist,("Show 1","Show 2","Show 3"))
+        self.assertEqual(hypelist.history,())
+        self.assertEqual(hypelist.rank("Show 3"),3)
+        self.assertIsNone(hypelist.rank("Show 4"))
+
+    def test_v1_lastlist(self):
+        """ Tests that a pre-v4 Hype List's Last List column is read as its history """
+        def edit(sheet):
+            sheet["H1"] = "Last List"
+            for row,name in [(2,"Show 5"),(3,"Show 4"),(4,None)]:
+                sheet.cell(row,8).value = name
+        hypelist = self.loadhypelistv1(edit)
+        self.assertEqual(hypelist.history,("Show 5","Show 4"))
+        self.assertEqual(hypelist.rank("Show 2"),2)
+        self.assertIsNone(hypelist.rank("Show 5"))
+
+    def test_v4_originalid(self):
+        """ Tests that OriginalIDs stored as strings or numbers are matched """
+        def edit(sheet):
+            sheet["H3"] = "2"
+            sheet["A4"] = "3"
+        week = self.loadweek(4.3, edit)
+        self.assertIsInstance(week.hypelist,classes.HypeListv4)
+        self.assertEqual(week.hypelist.rank(2),2)
+        self.assertEqual(week.shows["Show 2"].hypelistrank,2)
+        self.assertEqual(week.shows["Show 3"].originalid,"3")
+        self.assertEqual(week.shows["Show 3"].hypelistrank,3)
+        self.assertEqual(week.hypelist.rank("Show 1"),1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,15 @@ import unittest
 ## Test Target Module
 from aldb2 import RecordReader
 
+## Sister Module
+from aldb2.Anime import anime
+from aldb2.RecordReader.tests.test_classes import buildrecord
+
 ## Builtin
 import csv
 import pathlib
+import tempfile
+from unittest import mock
 
 root = pathlib.Path(__file__).resolve().parent
 TESTDIR1 = (root / "testdir_1").resolve()
@@ -52,6 +58,160 @@ class MasterEpisodesCase(unittest.TestCase):
         finally:
             if outputlocation.exists():
                 outputlocation.unlink()
-        
+
+class MasterCSVCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file = pathlib.Path(directory.name) / "master_episodes.csv"
+        self.episodes = [RecordReader.master.MasterEpisode(seasonid = None, originalid = i, seasonindex = seasonindex, week = 1, rank = i, episodenumber = 1, hypelistrank = i if i < 3 else None)
+                         for seasonindex in (2020.3, 2021.1) for i in range(1,5)]
+        return super().setUp()
+
+    def test_iter_masterepisodes(self):
+        """ Tests that iter_masterepisodes converts values to their proper types and filters by season """
+        RecordReader.master.save_masterepisodes(self.episodes, self.file)
+        result = list(RecordReader.master.iter_masterepisodes(self.file))
+        self.assertEqual(len(result), len(self.episodes))
+        self.assertEqual(result[0].to_dict(), dict(seasonid = None, originalid = "1", seasonindex = 2020.3, week = 1, rank = 1.0, episodenumber = 1, hypelistrank = 1))
+        self.assertIsNone(result[-1].hypelistrank)
+        for where in ["Spring 2021", 2021.1, [2021.1,], lambda episode: episode.seasonindex == 2021.1]:
+            with self.subTest(where = where):
+                result = list(RecordReader.master.iter_masterepisodes(self.file, where = where))
+                self.assertEqual(len(result), 4)
+                self.assertTrue(all(episode.seasonindex == 2021.1 for episode in result))
+
+    def test_append(self):
+        """ Tests that an appending MasterEpisodeWriter adds rows without repeating the header """
+        RecordReader.master.save_masterepisodes(self.episodes[:4], self.file)
+        with RecordReader.master.MasterEpisodeWriter(self.file, append = True) as writer:
+            writer.writerows(self.episodes[4:])
+        with open(self.file, 'r', encoding = "utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), len(self.episodes))
+        self.assertEqual([float(row['seasonindex']) for row in rows], [episode.seasonindex for episode in self.episodes])
+
+class MasterObjectsCase(unittest.TestCase):
+    def test_slots(self):
+        """ Tests that MasterStats and MasterEpisodes are slotted """
+        stat = RecordReader.master.MasterStat(originalid = 1, seasonindex = 2021.1, name = "Show 1")
+        episode = RecordReader.master.MasterEpisode(seasonid = 1, originalid = 1, seasonindex = 2021.1, week = 1, rank = 1, episodenumber = 1)
+        for obj in [stat, episode]:
+            with self.subTest(obj = obj):
+                self.assertFalse(hasattr(obj,"__dict__"))
+                with self.assertRaises(AttributeError):
+                    obj.notanattribute = True
+        self.assertEqual(stat.to_dict()['seasonindex'],2021.1)
+        self.assertNotIn("renewal",stat.to_dict())
+
+    def test_lastseason(self):
+        """ Tests that a MasterStat keeps its lastseason through to_dict and a masterstats file """
+        show = RecordReader.classes.Show(statssheet = None, originalid = 1, seasonid = 1, name = "Show 1", renewal = True, lastseason = "Fall 2020")
+        stat = RecordReader.master.MasterStat(seasonindex = 2021.1, **show.to_dict())
+        self.assertEqual(stat.lastseason,"Fall 2020")
+        self.assertEqual(stat.to_dict()['lastseason'],"Fall 2020")
+        with tempfile.TemporaryDirectory() as directory:
+            file = pathlib.Path(directory) / "masterstats.csv"
+            RecordReader.master.save_masterstats([stat], file)
+            self.assertEqual([loaded.lastseason for loaded in RecordReader.master.load_masterstats(file)],["Fall 2020"])
+
+    def test_getanimeseason(self):
+        """ Tests that MasterEpisodes of the same season share an AnimeSeason """
+        episodes = [RecordReader.master.MasterEpisode(seasonid = 1, originalid = i, seasonindex = 2021.1, week = 1, rank = i, episodenumber = 1) for i in range(3)]
+        self.assertTrue(all(episode.animeseason is episodes[0].animeseason for episode in episodes))
+        self.assertEqual(episodes[0].animeseason,anime.AnimeSeason("Spring",2021))
+        self.assertIs(RecordReader.master.getanimeseason(2021.1),episodes[0].animeseason)
+        ## seasonindices read from a master file are strings
+        self.assertEqual(RecordReader.master.getanimeseason("2021.1"),episodes[0].animeseason)
+
+class CompileDirectoryCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = pathlib.Path(directory.name)
+        self.records = self.directory / "records"
+        self.records.mkdir()
+        for season,year in [("Fall",2020),("Spring",2021),("Winter",2021)]:
+            buildrecord(self.records / f"__Record {season} {year}.xlsx", season = season, year = year)
+        return super().setUp()
+
+    def compile(self, name, **kw):
+        """ Compiles the Records to new master files, returning the files' contents """
+        statsfile, episodesfile = self.directory / f"{name}_stats.csv", self.directory / f"{name}_episodes.csv"
+        RecordReader.master.compile_directory(self.records, statsfile = statsfile, episodesfile = episodesfile, mode = "stream", **kw)
+        return statsfile.read_text(encoding = "utf-8"), episodesfile.read_text(encoding = "utf-8")
+
+    def test_workers(self):
+        """ Tests that compiling with a process pool produces the same files as compiling serially (in season order) """
+        serial = self.compile("serial")
+        self.assertEqual(self.compile("parallel", workers = 2), serial)
+        seasonindices = [row['seasonindex'] for row in csv.DictReader(serial[0].splitlines())]
+        self.assertEqual(seasonindices, sorted(seasonindices, key = float))
+
+    def test_failedrecord(self):
+        """ Tests that the master files are left unchanged if a Record fails to compile """
+        statsfile, episodesfile = self.directory / "stats.csv", self.directory / "episodes.csv"
+        statsfile.write_text("old stats", encoding = "utf-8")
+        episodesfile.write_text("old episodes", encoding = "utf-8")
+        (self.records / "__Record Summer 2021.xlsx").write_bytes(b"not a workbook")
+        for workers in [None, 2]:
+            with self.subTest(workers = workers):
+                with self.assertRaises(Exception):
+                    RecordReader.master.compile_directory(self.records, statsfile = statsfile, episodesfile = episodesfile, mode = "stream", workers = workers)
+                self.assertEqual(statsfile.read_text(encoding = "utf-8"), "old stats")
+                self.assertEqual(episodesfile.read_text(encoding = "utf-8"), "old episodes")
+                self.assertEqual(sorted(file.name for file in self.directory.iterdir()), ["episodes.csv", "records", "stats.csv"])
+
+    def test_watch_failedrecord(self):
+        """ Tests that watch_directory reports through output and keeps the master files when a compile fails """
+        statsfile, episodesfile = self.directory / "stats.csv", self.directory / "episodes.csv"
+        RecordReader.master.compile_directory(self.records, statsfile = statsfile, episodesfile = episodesfile, mode = "stream", output = lambda line: None)
+        stats, episodes = statsfile.read_text(encoding = "utf-8"), episodesfile.read_text(encoding = "utf-8")
+        (self.records / "__Record Summer 2021.xlsx").write_bytes(b"not a workbook")
+        lines = []
+        with mock.patch("builtins.print") as printmock:
+            RecordReader.master.watch_directory(self.records, statsfile = statsfile, episodesfile = episodesfile, interval = 0,
+                                                mode = "stream", output = lines.append, stop = lambda: True)
+        printmock.assert_not_called()
+        self.assertTrue(any(line.startswith("Compile failed") for line in lines))
+        self.assertTrue(lines[-1].startswith("Watching"))
+        self.assertEqual(statsfile.read_text(encoding = "utf-8"), stats)
+        self.assertEqual(episodesfile.read_text(encoding = "utf-8"), episodes)
+
+        (self.records / "__Record Summer 2021.xlsx").unlink()
+        lines.clear()
+        with mock.patch("builtins.print") as printmock:
+            RecordReader.master.watch_directory(self.records, statsfile = statsfile, episodesfile = episodesfile, interval = 0,
+                                                mode = "stream", output = lines.append, stop = lambda: True)
+        printmock.assert_not_called()
+        self.assertIn("\tShows: 5", lines)
+        self.assertEqual(statsfile.read_text(encoding = "utf-8"), stats)
+
+    def test_watch_workers(self):
+        """ Tests that watch_directory passes workers through to compile_directory """
+        with mock.patch.object(RecordReader.master, "compile_directory") as compilemock:
+            RecordReader.master.watch_directory(self.records, interval = 0, workers = 3, output = lambda line: None, stop = lambda: True)
+        compilemock.assert_called_once()
+        self.assertEqual(compilemock.call_args.kwargs['workers'], 3)
+
+    def test_incremental(self):
+        """ Tests that incremental compiles only parse new or changed Records and match a full compile """
+        manifest = self.directory / "manifest.json"
+        full = self.compile("full")
+        compile_record = RecordReader.master.compile_record
+        with mock.patch.object(RecordReader.master, "compile_record", wraps = compile_record) as patched:
+            self.assertEqual(self.compile("incremental", incremental = True, manifest = manifest), full)
+            self.assertEqual(patched.call_count, 3)
+            patched.reset_mock()
+            self.assertEqual(self.compile("incremental", incremental = True, manifest = manifest), full)
+            patched.assert_not_called()
+
+            changed = self.records / "__Record Spring 2021.xlsx"
+            buildrecord(changed, season = "Spring", year = 2021, shows = 4)
+            (self.records / "__Record Fall 2020.xlsx").unlink()
+            result = self.compile("incremental", incremental = True, manifest = manifest)
+            self.assertEqual([call.args[0].name for call in patched.call_args_list], [changed.name])
+        self.assertEqual(result, self.compile("full"))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -5,11 +5,22 @@ from aldb2.RecordReader import sql
 
 ## Sister Module
 from aldb2 import RecordReader
+from aldb2.Anime import anime
 from aldb2.Anime.tests.test_sql import fullsetup as animesetup
 from aldb2.AnimeLife.tests.test_sql import fullsetup as animelifesetup
+from aldb2.Core.sql import util
+from aldb2.RecordReader.tests.test_classes import buildrecord
 
 ## Builtin
+import contextlib
+import datetime
+import itertools
 import pathlib
+import sqlite3
+import tempfile
+import threading
+import types
+from unittest import mock
 
 root = pathlib.Path(__file__).resolve().parent
 MASTERSTATSFILE = (root / "test_master_stats.csv").resolve()
@@ -27,6 +38,46 @@ del root
 def basic_setup(testcase):
     animesetup(testcase)
 
+## webmodules_website names of the MasterStat site id columns (see sql._iterstatsiteids)
+SITES = ["showboy", "ann", "anilist", "mal", "anidb"]
+
+def builddatabase(file = ":memory:"):
+    """ Returns a database (in-memory by default) with the Core, Anime, AnimeLife, and webmodules tables, the anime medium, and SITES """
+    connection = sqlite3.connect(file)
+    for app in ["Core", "Anime", "AnimeLife"]:
+        module, config = util.loadapp(app)
+        util.loadtables(module, config, connection)
+    ## Loaded from its configuration file so that the WebModules site modules are not imported
+    config = util.loadsqljson(pathlib.Path(RecordReader.__file__).parent.parent / "WebModules" / "__init__.py")
+    for table in config['tables']: util.setuptable(config, connection, table)
+    connection.execute("""INSERT INTO mediums (medium) VALUES ('anime');""")
+    connection.executemany("""INSERT INTO webmodules_website (name, domain) VALUES (?,?);""", [(site, f"{site}.example") for site in SITES])
+    connection.commit()
+    return connection
+
+def mocksitemodules():
+    """ Patches webmodules' get_sitemodule to resolve each site to a module with the same SITENAME """
+    return mock.patch.object(sql.websql, "get_sitemodule", lambda db, site: types.SimpleNamespace(SITENAME = site))
+
+def seeddatabase(connection):
+    """ Adds Seasons 1-4 to the database along with an existing alias, library entry, site id, Anime Season, and ranking """
+    connection.executemany("""INSERT INTO season (seasonid, season, medium, episodes) VALUES (?,?,1,?);""",
+                           [(1, "Season One", None), (2, None, 1), (3, "Season Three", 20), (4, "Season Four", None)])
+    connection.execute("""INSERT INTO aliases (node, tablename, alias, language) VALUES (1, 'season', 'Existing Name', 'english');""")
+    connection.execute("""INSERT INTO animelibrary (season, notes, episodeswatched) VALUES (2, 'Old notes. ', 0);""")
+    connection.execute("""INSERT INTO webmodules_siteids (season, website, siteid) VALUES (1, 4, '10');""")
+    connection.execute("""INSERT INTO animeseasons (seasonid, season, year) VALUES (1, 1, 2021);""")
+    connection.execute("""INSERT INTO al_weeklyranking (week, animeseason, episodenumber, rank) VALUES (1, 1, 1, 3);""")
+    connection.commit()
+
+def dumptables(connection):
+    """ Returns the contents of each table written by an import """
+    out = {}
+    for table in ["season", "aliases", "links", "images", "animelibrary", "animeseasons", "airinginfo", "al_weeklyranking"]:
+        out[table] = connection.execute(f"""SELECT * FROM {table} ORDER BY rowid;""").fetchall()
+    out['webmodules_siteids'] = connection.execute("""SELECT season, website, siteid FROM webmodules_siteids ORDER BY season, website;""").fetchall()
+    return out
+
 class MasterstatsCase(unittest.TestCase):
     def setUp(self):
         basic_setup(self)
@@ -37,5 +88,453 @@ class MasterstatsCase(unittest.TestCase):
         """ Tests the upload of a masterstats file """
         sql.import_master(self.connection, masterstats = MASTERSTATSFILE, masterepisodes = False)
 
+class BulkImportCase(unittest.TestCase):
+    """ Tests that MasterImporter's bulk mode matches the row-by-row import """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.statsfile = pathlib.Path(directory.name) / "stats.csv"
+        self.episodesfile = pathlib.Path(directory.name) / "episodes.csv"
+        MasterStat, MasterEpisode = RecordReader.master.MasterStat, RecordReader.master.MasterEpisode
+        RecordReader.master.save_masterstats([
+            MasterStat(1, 2021.1, seasonid = 1, name = "Show One", originalname = "ショー・ワン", website = "https://one.example", pv = "https://pv.example/1",
+                       firstepisode = datetime.datetime(2021,4,3,22,30), notes = "First. ", malid = "11", annid = "5"),
+            MasterStat(2, 2021.1, name = "No SeasonID"),
+            MasterStat(3, 2021.1, seasonid = 99, name = "Not in Database"),
+            MasterStat(4, 2021.1, seasonid = 2, name = "Show Two", channelhomepage = "https://stream.example/2", notes = "Second. ", malid = "20"),
+            MasterStat(5, 2020.3, seasonid = 1, name = "Show One Again", firstepisode = datetime.datetime(2020,10,2,1,0)),
+            MasterStat(6, 2021.1, seasonid = 2, website = "https://stream.example/2", notes = "Third.", malid = "21", firstepisode = datetime.datetime(2021,4,5,12,0)),
+            MasterStat(7, 2021.0, seasonid = 3, originalname = "三", pv = "https://pv.example/3"),
+            ], self.statsfile)
+        RecordReader.master.save_masterepisodes([
+            ## Existing ranking
+            MasterEpisode(1, 1, 2021.1, 1, 2, 1),
+            MasterEpisode(1, 1, 2021.1, 2, 1, 2, hypelistrank = 1),
+            ## Duplicate episode
+            MasterEpisode(1, 1, 2021.1, 2, 5, 2),
+            MasterEpisode(2, 4, 2021.1, 1, 1, 1),
+            MasterEpisode(None, 2, 2021.1, 1, 3, 1),
+            ## New Anime Season
+            MasterEpisode(3, 7, 2021.0, 1, 1, 1),
+            MasterEpisode(3, 7, 2021.0, 2, 1, 2),
+            MasterEpisode(99, 3, 2021.1, 1, 4, 1),
+            ], self.episodesfile)
+        patcher = mocksitemodules()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return super().setUp()
+
+    def runimport(self, **kw):
+        """ Imports the master files into a new, seeded database and returns the ImportResults and the database's contents """
+        connection = builddatabase()
+        self.addCleanup(connection.close)
+        seeddatabase(connection)
+        results = sql.import_master(connection, masterstats = self.statsfile, masterepisodes = self.episodesfile, **kw)
+        results = [[(result.result, result.reason, result.object.to_dict()) for result in group] for group in results]
+        return results, dumptables(connection)
+
+    def test_parity(self):
+        """ Tests that bulk and row-by-row imports produce the same results and rows """
+        for batchsize in [1000, 2]:
+            with self.subTest(batchsize = batchsize):
+                results, tables = self.runimport(batchsize = batchsize)
+                bulkresults, bulktables = self.runimport(batchsize = batchsize, bulk = True)
+                self.assertEqual(bulkresults, results)
+                for table in tables:
+                    with self.subTest(table = table):
+                        self.assertEqual(bulktables[table], tables[table])
+
+    def test_results(self):
+        """ Tests the ImportResults and rows of an import """
+        (stats, episodes), tables = self.runimport(bulk = True)
+        self.assertEqual([reason for (result, reason, stat) in stats],
+                         [None, "No seasonid", "seasonid not in Database", None, None, None, None])
+        self.assertEqual([reason for (result, reason, episode) in episodes], [None, None, None, None, "No seasonid", None, None, None])
+        ## The first unofficial alias for each language is kept
+        self.assertEqual([row[1:] for row in tables['aliases']], [(1, "season", "Existing Name", 0, "english"), (1, "season", "ショー・ワン", 0, "japanese"),
+                                                                   (2, "season", "Show Two", 0, "english"), (3, "season", "三", 0, "japanese")])
+        ## Links are unique by url
+        self.assertEqual([row[1:] for row in tables['links']], [(1, "season", "https://one.example", "homepage"), (1, "season", "https://pv.example/1", "pv"),
+                                                                 (2, "season", "https://stream.example/2", "stream"), (3, "season", "https://pv.example/3", "pv")])
+        self.assertEqual(tables['animeseasons'], [(1, 1, 2021, 1), (2, 1, 2021, 2), (1, 3, 2020, 3), (3, 0, 2021, 4), (99, 1, 2021, 5)])
+        self.assertEqual([row[1:] for row in tables['airinginfo']], [(1, "2021-04-03", "22:30:00"), (3, "2020-10-02", "01:00:00"), (2, "2021-04-05", "12:00:00")])
+        self.assertEqual([(row[1], row[8]) for row in tables['animelibrary']], [(2, "Old notes. Second. Third."), (1, "First. "), (3, None)])
+        self.assertEqual(tables['webmodules_siteids'], [(1, 2, "5"), (1, 4, "11"), (2, 4, "21")])
+        ## The existing ranking and the duplicate episode are updated
+        self.assertEqual([row[1:6] for row in tables['al_weeklyranking']],
+                         [(1, 1, 1.0, 2.0, None), (2, 1, 2.0, 5.0, None), (1, 2, 1.0, 1.0, None), (1, 4, 1.0, 1.0, None), (2, 4, 2.0, 1.0, None), (1, 5, 1.0, 4.0, None)])
+
+class ImportContextCase(unittest.TestCase):
+    """ Tests for ImportContext """
+    def setUp(self):
+        self.connection = builddatabase()
+        self.addCleanup(self.connection.close)
+        seeddatabase(self.connection)
+        self.connection.execute("""INSERT INTO al_weeklyranking (week, animeseason, episodenumber, rank) VALUES (2, 1, 2.5, 1);""")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.episodesfile = pathlib.Path(directory.name) / "episodes.csv"
+        return super().setUp()
+
+    def test_rankings(self):
+        """ Tests that the rankings lookup is loaded from the database and uses the same keys as MasterEpisodes """
+        context = sql.ImportContext(self.connection)
+        self.assertEqual(context.rankings, {(1, 1, 1.0), (1, 2, 2.5)})
+        self.assertEqual(context.rankingkey(1, "2", "2.5"), (1, 2, 2.5))
+        self.assertEqual(context.rankingkey(1, "1.0", "1"), (1, 1, 1.0))
+
+    def test_stringrankings(self):
+        """ Tests that MasterEpisodes loaded with load_masterepisodes (whose values are strings) update the existing rankings """
+        self.episodesfile.write_text("""seasonid,originalid,seasonindex,week,rank,episodenumber,hypelistrank
+1,1,2021.1,1,5,1,
+1,1,2021.1,2.0,4,2.5,2
+1,1,2021.1,3,1,3.0,
+""", encoding = "utf-8")
+        episodes = RecordReader.master.load_masterepisodes(self.episodesfile)
+        self.assertEqual((episodes[1].week, episodes[1].episodenumber), ("2.0", "2.5"))
+        for bulk in [False, True]:
+            with self.subTest(bulk = bulk):
+                with self.connection:
+                    importer = sql.MasterImporter(self.connection, bulk = bulk)
+                    importer.addepisodes(episodes)
+                    results = importer.finish()
+                self.assertTrue(all(result.success for result in results.episodes))
+                self.assertEqual(self.connection.execute("""SELECT week, animeseason, episodenumber, rank, hypelistrank FROM al_weeklyranking ORDER BY animeweekid;""").fetchall(),
+                                 [(1, 1, 1.0, 5.0, None), (2, 1, 2.5, 4.0, 2), (3, 1, 3.0, 1.0, None)])
+
+def referenceepisodetotals(connection, seasonids):
+    """ Updates episode totals one season at a time (as import_master did before _updateepisodetotals) """
+    for seasonid in seasonids:
+        count = connection.execute("""SELECT COUNT(*) FROM al_weeklyranking
+WHERE animeseason IN (SELECT animeseasonid FROM animeseasons WHERE seasonid = ?);""", (seasonid,)).fetchone()[0]
+        if not count: continue
+        season = connection.execute("""SELECT episodes FROM season WHERE seasonid = ?;""", (seasonid,)).fetchone()
+        if season is None: continue
+        if count > (season[0] or 0):
+            connection.execute("""UPDATE season SET episodes = ? WHERE seasonid = ?;""", (count, seasonid))
+        library = connection.execute("""SELECT libraryid, episodeswatched FROM animelibrary WHERE season = ? ORDER BY libraryid;""", (seasonid,)).fetchone()
+        if library is None:
+            library = (connection.execute("""INSERT INTO animelibrary (season) VALUES (?);""", (seasonid,)).lastrowid, None)
+        if count > (library[1] or 0):
+            connection.execute("""UPDATE animelibrary SET episodeswatched = ? WHERE libraryid = ?;""", (count, library[0]))
+
+class EpisodeTotalsCase(unittest.TestCase):
+    """ Tests that _updateepisodetotals matches counting each season's episodes separately """
+    def builddatabase(self):
+        connection = builddatabase()
+        self.addCleanup(connection.close)
+        seeddatabase(connection)
+        ## Season 1 has two Anime Seasons, Season 3 already has more episodes than it has rankings, Season 4 has a second library entry,
+        ## and Season 99 does not exist
+        connection.executemany("""INSERT INTO animeseasons (seasonid, season, year) VALUES (?,?,?);""",
+                               [(1, 2, 2021), (2, 1, 2021), (3, 0, 2021), (4, 3, 2020), (99, 1, 2021)])
+        connection.executemany("""INSERT INTO al_weeklyranking (week, animeseason, episodenumber, rank) VALUES (?,?,?,1);""",
+                               [(week, animeseason, week) for animeseason,weeks in [(1, 3), (2, 2), (3, 4), (4, 2), (5, 3), (6, 1)] for week in range(2, weeks+2)])
+        connection.executemany("""INSERT INTO animelibrary (season, episodeswatched) VALUES (?,?);""", [(4, 1), (4, 0)])
+        connection.commit()
+        return connection
+
+    def test_updateepisodetotals(self):
+        """ Tests that the grouped update matches the per-season reference for all seasons and for subsets of seasons """
+        for seasonids in [None, [1, 3], [2, 4, 99]]:
+            with self.subTest(seasonids = seasonids):
+                connection, reference = self.builddatabase(), self.builddatabase()
+                sql._updateepisodetotals(connection, seasonids)
+                referenceepisodetotals(reference, [1, 2, 3, 4, 99] if seasonids is None else seasonids)
+                for table in ["season", "animelibrary"]:
+                    self.assertEqual(dumptables(connection)[table], dumptables(reference)[table])
+
+    def test_totals(self):
+        """ Tests the totals of each Season and library entry (Seasons which already have more episodes are not lowered) """
+        connection = self.builddatabase()
+        sql._updateepisodetotals(connection)
+        self.assertEqual(connection.execute("""SELECT seasonid, episodes FROM season ORDER BY seasonid;""").fetchall(), [(1, 6), (2, 4), (3, 20), (4, 3)])
+        self.assertEqual(connection.execute("""SELECT season, episodeswatched FROM animelibrary ORDER BY libraryid;""").fetchall(),
+                         [(2, 4), (4, 3), (4, 0), (1, 6), (3, 2)])
+
+def seedexport(connection):
+    """ Adds rows for each MasterStat column to a seeded database (see seeddatabase), including rows which are not the first for their lookup """
+    connection.execute("""UPDATE season SET series = 7 WHERE seasonid = 1;""")
+    connection.executemany("""INSERT INTO animeseasons (seasonid, season, year) VALUES (?,?,?);""",
+                           [(1, 3, 2020), (1, 0, 2020), (2, 1, 2021), (3, 0, 2021), (4, 3, 2020), (4, 2, 2021), (1, 2, 2021)])
+    connection.executemany("""INSERT INTO aliases (node, tablename, alias, official, language) VALUES (?,?,?,?,?);""", [
+        (1, "season", "Official Name", 1, "english"), (1, "series", "Series Name", 0, "Japanese"), (1, "season", "シーズン・ワン", 0, "Japanese"),
+        (1, "season", "公式", 1, "japanese"), (2, "season", "Season Two", 1, "English"), (3, "season", "Romaji", 0, "romaji")])
+    connection.executemany("""INSERT INTO links (node, tablename, url, identification) VALUES (?,?,?,?);""", [
+        (1, "season", "https://stream.example/1", "stream"), (1, "season", "https://stream.example/2", "stream"), (1, "series", "https://series.example", "homepage"),
+        (1, "season", "https://one.example", "homepage"), (2, "season", "https://pv.example/2", "pv")])
+    connection.executemany("""INSERT INTO images (node, tablename, url, imagetype) VALUES (?,?,?,?);""", [
+        (1, "season", "https://img.example/banner.png", "banner"), (1, "season", "https://img.example/1.png", "poster"), (1, "season", "https://img.example/2.png", "poster"),
+        (2, "series", "https://img.example/series.png", "poster")])
+    connection.executemany("""INSERT INTO airinginfo (animeseason, firstepisode, time) VALUES (?,?,?);""", [
+        (1, "2021-04-03", "22:30:00"), (1, "2021-04-04", "23:00:00"), (2, "2020-10-02", None), (5, "2021-04-01", "01:00:00")])
+    connection.executemany("""INSERT INTO animelibrary (season, notes) VALUES (?,?);""", [(2, "Second entry"), (1, None), (1, "Not first"), (3, "Three")])
+    connection.executemany("""INSERT INTO webmodules_siteids (season, website, siteid) VALUES (?,?,?);""", [(1, 1, "boy"), (2, 4, "22"), (2, 5, "dbid"), (3, 3, "33")])
+    connection.executemany("""INSERT INTO al_weeklyranking (week, animeseason, episodenumber, rank, hypelistrank) VALUES (?,?,?,?,?);""", [
+        (2, 1, 2, 1, 1), (1, 5, 1, 2, None), (1, 4, 1, 1, None), (2, 2, 2, 3, 2), (1, 2, 1, 2, None), (1, 8, 1, 1, None), (3, 1, 3, 2, None)])
+    connection.commit()
+
+def referencemasterstat(connection, animeseasonid):
+    """ Compiles a MasterStat with a separate lookup for each column (as compile_masterstats did before MASTERSTATSQL) """
+    def first(query, *args):
+        row = connection.execute(query, args).fetchone()
+        return row[0] if row else None
+    def toanimeseason(yearseasonid, year):
+        return anime.AnimeSeason(first("""SELECT season FROM yearseason WHERE yearseasonid = ?;""", yearseasonid), year)
+    seasonid, yearseasonid, year = connection.execute("""SELECT seasonid, season, year FROM animeseasons WHERE animeseasonid = ?;""", (animeseasonid,)).fetchone()
+    animeseason = toanimeseason(yearseasonid, year)
+    output = dict(originalid = None, seasonid = seasonid, seasonindex = animeseason.seasonindex)
+    output['seriesid'] = first("""SELECT series FROM season WHERE seasonid = ?;""", seasonid)
+
+    previous = sorted(season for season in (toanimeseason(*row) for row in connection.execute("""SELECT season, year FROM animeseasons WHERE seasonid = ?;""", (seasonid,)))
+                      if season < animeseason)
+    if previous:
+        output['renewal'] = True
+        output['lastseason'] = str(previous[-1])
+
+    alias = """SELECT alias FROM aliases WHERE node = ? AND tablename = 'season' AND language LIKE ? ORDER BY aliasid;"""
+    output['name'] = first(alias, seasonid, "english") or first("""SELECT season FROM season WHERE seasonid = ?;""", seasonid)
+    output['originalname'] = first(alias, seasonid, "japanese")
+    link = """SELECT url FROM links WHERE node = ? AND tablename = 'season' AND identification = ? ORDER BY linkid;"""
+    for key, identification in [("channelhomepage", "stream"), ("website", "homepage"), ("pv", "pv")]:
+        output[key] = first(link, seasonid, identification)
+    airing = connection.execute("""SELECT firstepisode, time FROM airinginfo WHERE animeseason = ? ORDER BY airinginfoid;""", (animeseasonid,)).fetchone()
+    if airing and airing[0] and airing[1]:
+        output['firstepisode'] = datetime.datetime.strptime(airing[0]+" "+airing[1], "%Y-%m-%d %H:%M:%S")
+    output['image'] = first("""SELECT url FROM images WHERE node = ? AND tablename = 'season' AND imagetype = 'poster' ORDER BY imagesid;""", seasonid)
+    output['notes'] = first("""SELECT notes FROM animelibrary WHERE season = ? ORDER BY libraryid;""", seasonid)
+    if first("""SELECT COUNT(*) FROM al_weeklyranking WHERE animeseason = ?;""", animeseasonid):
+        output['include'] = True
+    for heading in sql.EXPORTSITEIDS:
+        output[heading] = first("""SELECT siteid FROM webmodules_siteids LEFT JOIN webmodules_website ON website = wmsiteid
+WHERE season = ? AND name = ? ORDER BY wmsiteidid;""", seasonid, heading.rstrip("id"))
+    return RecordReader.master.MasterStat(**{key:value for key,value in output.items() if value is not None or key == "originalid"})
+
+def referencemasterepisodes(connection, animeseasonids):
+    """ Compiles the MasterEpisodes of each animeseason separately and then sorts them by seasonindex and week """
+    episodes = []
+    for animeseasonid in sorted(animeseasonids):
+        seasonid, yearseason, year = connection.execute("""SELECT seasonid, yearseason.season, year FROM animeseasons
+LEFT JOIN yearseason ON animeseasons.season = yearseasonid WHERE animeseasonid = ?;""", (animeseasonid,)).fetchone()
+        seasonindex = anime.AnimeSeason(yearseason, year).seasonindex
+        for (week, rank, episodenumber, hypelistrank) in connection.execute("""SELECT week, rank, episodenumber, hypelistrank FROM al_weeklyranking
+WHERE animeseason = ? ORDER BY animeweekid;""", (animeseasonid,)):
+            episodes.append(RecordReader.master.MasterEpisode(seasonid = seasonid, originalid = None, seasonindex = seasonindex, week = week, rank = rank,
+                                                              episodenumber = episodenumber, hypelistrank = hypelistrank))
+    return sorted(episodes, key = lambda episode: (episode.seasonindex, episode.week))
+
+class ExportCase(unittest.TestCase):
+    """ Tests that the set-based export matches compiling each MasterStat and MasterEpisode separately """
+    def setUp(self):
+        self.connection = builddatabase()
+        self.addCleanup(self.connection.close)
+        seeddatabase(self.connection)
+        seedexport(self.connection)
+        self.animeseasonids = [animeseasonid for (animeseasonid,) in self.connection.execute("""SELECT animeseasonid FROM animeseasons;""")]
+        patcher = mocksitemodules()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return super().setUp()
+
+    def test_exportmasterstats(self):
+        """ Tests every MasterStat against the reference """
+        stats = list(sql.iter_exportmasterstats(self.connection, self.animeseasonids))
+        self.assertEqual([stat.to_dict() for stat in stats],
+                         [referencemasterstat(self.connection, animeseasonid).to_dict() for animeseasonid in sorted(self.animeseasonids)])
+
+    def test_exportmasterstats_values(self):
+        """ Tests the first-row choices, previous season, and name fallback """
+        stats = {stat.seasonindex:stat for stat in sql.iter_exportmasterstats(self.connection, [1, 2, 3, 8])}
+        spring, fall, winter, summer = stats[2021.1], stats[2020.3], stats[2020.0], stats[2021.2]
+        ## The first alias for each language (ignoring case and other tables' aliases)
+        self.assertEqual((spring.name, spring.originalname), ("Existing Name", "シーズン・ワン"))
+        self.assertEqual((spring.channelhomepage, spring.website, spring.pv), ("https://stream.example/1", "https://one.example", None))
+        self.assertEqual(spring.firstepisode, datetime.datetime(2021,4,3,22,30))
+        self.assertEqual((spring.seriesid, spring.malid, spring.showboyid), (7, "10", "boy"))
+        ## The library entry's notes are blank, so notes is not set
+        self.assertIsNone(spring.notes)
+        ## Renewals use the latest previous Anime Season of the same Season
+        self.assertEqual((fall.lastseason, spring.lastseason, summer.lastseason), ("Winter 2020", "Fall 2020", "Spring 2021"))
+        self.assertIsNone(winter.lastseason)
+        self.assertTrue(spring.include)
+        self.assertFalse(winter.include)
+        self.assertIsNone(fall.firstepisode)
+
+        stats = {stat.seasonid:stat for stat in sql.iter_exportmasterstats(self.connection, [4, 5, 6])}
+        self.assertEqual((stats[2].name, stats[2].pv, stats[2].notes, stats[2].anidbid), ("Season Two", "https://pv.example/2", "Old notes. ", "dbid"))
+        ## Falls back to the Season's name
+        self.assertEqual((stats[3].name, stats[3].originalname, stats[3].notes), ("Season Three", None, "Three"))
+
+    def test_exportmasterepisodes(self):
+        """ Tests the exported MasterEpisodes against the reference """
+        episodes = [episode.to_dict() for episode in sql.iter_exportmasterepisodes(self.connection, self.animeseasonids)]
+        self.assertEqual(episodes, [episode.to_dict() for episode in referencemasterepisodes(self.connection, self.animeseasonids)])
+        self.assertEqual(len(episodes), 8)
+
+class ExportWorkersCase(unittest.TestCase):
+    """ Tests for exporting with worker threads """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = pathlib.Path(directory.name)
+        ## Workers use their own connections, so the database must be a file
+        self.connection = builddatabase(str(self.directory / "export.sqlite"))
+        self.addCleanup(self.connection.close)
+        seeddatabase(self.connection)
+        seedexport(self.connection)
+        self.animeseasonids = [animeseasonid for (animeseasonid,) in self.connection.execute("""SELECT animeseasonid FROM animeseasons;""")]
+        for patcher in [mocksitemodules(), mock.patch.object(sql, "EXPORTCHUNKSIZE", 2)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.threads = threading.active_count()
+        return super().setUp()
+
+    def assertWorkersStopped(self):
+        self.assertEqual(threading.active_count(), self.threads)
+
+    def test_exportmasterstats(self):
+        """ Tests that workers produce the same MasterStats in the same order """
+        expected = [stat.to_dict() for stat in sql.iter_exportmasterstats(self.connection, self.animeseasonids, workers = 1)]
+        self.assertEqual(len(expected), len(self.animeseasonids))
+        for workers in [2, 3, 0]:
+            with self.subTest(workers = workers):
+                self.assertEqual([stat.to_dict() for stat in sql.iter_exportmasterstats(self.connection, self.animeseasonids, workers = workers)], expected)
+                self.assertWorkersStopped()
+
+    def test_exportmasterepisodes(self):
+        """ Tests that workers produce the same MasterEpisodes in the same order """
+        expected = [episode.to_dict() for episode in sql.iter_exportmasterepisodes(self.connection, self.animeseasonids, workers = 1)]
+        self.assertEqual(len(expected), 8)
+        for workers in [2, 3, 0]:
+            with self.subTest(workers = workers):
+                self.assertEqual([episode.to_dict() for episode in sql.iter_exportmasterepisodes(self.connection, self.animeseasonids, workers = workers)], expected)
+                self.assertWorkersStopped()
+
+    def test_workerexception(self):
+        """ Tests that an exception raised in a worker is reraised to the caller and that the other workers are stopped """
+        exportstatchunk = sql._exportstatchunk
+        def failingchunk(db, chunk, sitenames):
+            if 5 in chunk: raise sqlite3.OperationalError("worker failed")
+            return exportstatchunk(db, chunk, sitenames)
+        with mock.patch.object(sql, "_exportstatchunk", failingchunk):
+            stats = sql.iter_exportmasterstats(self.connection, self.animeseasonids, workers = 3)
+            ## Chunks before the failing one are still produced
+            self.assertEqual([stat.seasonindex for stat in itertools.islice(stats, 4)], [2021.1, 2020.3, 2020.0, 2021.1])
+            with self.assertRaisesRegex(sqlite3.OperationalError, "worker failed"):
+                next(stats)
+        self.assertWorkersStopped()
+
+    def test_export_master_file(self):
+        """ Tests that export_master and import_master accept a database file and use pooled connections """
+        directory = self.directory
+        file = util.getdatabasefile(self.connection)
+        sql.export_master(self.connection, masterstats = directory / "stats.csv", masterepisodes = directory / "episodes.csv")
+        with mock.patch.object(util.ConnectionManager, "acquire", autospec = True, side_effect = util.ConnectionManager.acquire) as acquire:
+            sql.export_master(file, masterstats = directory / "filestats.csv", masterepisodes = directory / "fileepisodes.csv", workers = 2)
+        self.assertTrue(all(call.kwargs['readonly'] for call in acquire.call_args_list))
+        for name in ["stats", "episodes"]:
+            with self.subTest(name = name):
+                self.assertEqual((directory / f"file{name}.csv").read_text(encoding = "utf-8"), (directory / f"{name}.csv").read_text(encoding = "utf-8"))
+
+        target = directory / "import.sqlite"
+        connection = builddatabase(str(target))
+        seeddatabase(connection)
+        connection.close()
+        results = sql.import_master(target, masterstats = False, masterepisodes = directory / "episodes.csv")
+        self.assertTrue(all(result.success for result in results.episodes))
+        with util.pooledconnection(target, readonly = True) as connection:
+            self.assertEqual(connection.execute("""SELECT COUNT(*) FROM al_weeklyranking;""").fetchone()[0], 8)
+
+    def test_threadediter(self):
+        """ Tests that _threadediter yields the generator's items, reraises its exception, and stops it when closed """
+        def generator(count, fail = False):
+            yield from range(count)
+            if fail: raise ValueError("failed")
+        self.assertEqual(list(sql._threadediter(generator, 5, maxsize = 2)), list(range(5)))
+        items = []
+        with self.assertRaisesRegex(ValueError, "failed"):
+            for item in sql._threadediter(generator, 3, True): items.append(item)
+        self.assertEqual(items, [0, 1, 2])
+
+        stream = sql._threadediter(generator, 1000, maxsize = 1)
+        self.assertEqual(next(stream), 0)
+        stream.close()
+        self.assertWorkersStopped()
+
+class ImportRecordsCase(unittest.TestCase):
+    """ Tests for import_records """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = pathlib.Path(directory.name)
+        self.records = self.directory / "records"
+        self.records.mkdir()
+        ## Records are supplied in season order (as compile_directory outputs them)
+        self.files = []
+        for season,year in [("Fall",2020),("Spring",2021)]:
+            file = self.records / f"__Record {season} {year}.xlsx"
+            buildrecord(file, season = season, year = year)
+            self.files.append(file)
+        patcher = mocksitemodules()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return super().setUp()
+
+    def builddatabase(self):
+        connection = builddatabase()
+        self.addCleanup(connection.close)
+        ## Records' SeasonIDs are 101-105 (see buildrecord)
+        connection.executemany("""INSERT INTO season (seasonid, season, medium) VALUES (?,?,1);""", [(100+i, f"Show {i}") for i in range(1,6)])
+        connection.commit()
+        return connection
+
+    def test_import_records(self):
+        """ Tests that importing Records matches compiling them and importing the master files, and that the master files are exported """
+        statsfile, episodesfile = self.directory / "stats.csv", self.directory / "episodes.csv"
+        RecordReader.master.compile_directory(self.records, statsfile = statsfile, episodesfile = episodesfile, mode = "stream", output = lambda line: None)
+        connection = self.builddatabase()
+        expected = sql.import_master(connection, masterstats = statsfile, masterepisodes = episodesfile)
+        expectedtables = dumptables(connection)
+
+        for bulk in [False, True]:
+            with self.subTest(bulk = bulk):
+                exportstats, exportepisodes = self.directory / f"export_stats_{bulk}.csv", self.directory / f"export_episodes_{bulk}.csv"
+                connection = self.builddatabase()
+                results = sql.import_records(connection, self.files, mode = "stream", batchsize = 7, bulk = bulk,
+                                             masterstats = exportstats, masterepisodes = exportepisodes)
+                self.assertFalse(connection.in_transaction)
+                self.assertEqual(len(results.stats), 10)
+                self.assertEqual(len(results.episodes), 30)
+                self.assertTrue(all(result.success for result in results.stats + results.episodes))
+                self.assertEqual([result.object.name for result in results.stats], [result.object.name for result in expected.stats])
+                self.assertEqual(dumptables(connection), expectedtables)
+                self.assertEqual(exportstats.read_text(encoding = "utf-8"), statsfile.read_text(encoding = "utf-8"))
+                self.assertEqual(exportepisodes.read_text(encoding = "utf-8"), episodesfile.read_text(encoding = "utf-8"))
+
+    def test_import_records_rollback(self):
+        """ Tests that nothing is imported if a Record fails to compile """
+        bad = self.records / "__Record Summer 2021.xlsx"
+        bad.write_bytes(b"not a workbook")
+        connection = self.builddatabase()
+        before = dumptables(connection)
+        with self.assertRaises(Exception):
+            sql.import_records(connection, self.files + [bad], mode = "stream")
+        self.assertFalse(connection.in_transaction)
+        self.assertEqual(dumptables(connection), before)
+
+    def test_import_records_file(self):
+        """ Tests that import_records borrows a writer connection through util.pooledconnection """
+        connection = self.builddatabase()
+        file = self.directory / "import.sqlite"
+        @contextlib.contextmanager
+        def pooledconnection(db, readonly = False):
+            self.assertEqual((db, readonly), (file, False))
+            yield connection
+        with mock.patch.object(util, "pooledconnection", pooledconnection):
+            results = sql.import_records(file, self.files, mode = "stream")
+        self.assertTrue(all(result.success for result in results.stats + results.episodes))
+        self.assertFalse(connection.in_transaction)
+        self.assertEqual(connection.execute("""SELECT COUNT(*) FROM al_weeklyranking;""").fetchone()[0], 30)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
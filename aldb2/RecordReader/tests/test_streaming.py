@@ -0,0 +1,171 @@
+## Framework
+import unittest
+## Test Target
+from aldb2.RecordReader import cache, classes, streaming
+
+## Builtin
+import datetime
+import pathlib
+import tempfile
+from unittest import mock
+## Third Party
+import openpyxl
+from openpyxl.worksheet.table import Table
+
+def buildworkbook(file):
+    """ Creates a small Record-like Workbook with multiple Tables per Worksheet """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Record Stats"
+    ws.append(["Year","Season","Version"])
+    ws.append([2021,"Spring",4.3])
+    ws.add_table(Table(displayName = "RecordStats", ref = "A1:C2"))
+    ws = wb.create_sheet("Week 1")
+    ws.append(["OriginalID","Name","Rank","First Episode"])
+    for i in range(1,6):
+        ws.append([i,f"Show {i}",6-i,datetime.datetime(2021,4,i)])
+    ws.add_table(Table(displayName = "Week1", ref = "A1:D6"))
+    ws["F1"], ws["G1"] = "OriginalID", "Name"
+    for i in range(1,4):
+        ws.cell(i+1,6,i)
+        ws.cell(i+1,7,f"Show {i}")
+    ws.add_table(Table(displayName = "HypeWeek1", ref = "F1:G4"))
+    wb.save(file)
+
+def readrange(file, sheet, ref):
+    """ Reads the cell values for the given range using a fully loaded Workbook """
+    wb = openpyxl.load_workbook(file, data_only = True)
+    try:
+        return [tuple(cell.value for cell in row) for row in wb[sheet][ref]]
+    finally:
+        wb.close()
+
+class StreamReaderCase(unittest.TestCase):
+    readerclass = streaming.StreamReader
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file = pathlib.Path(directory.name) / "__Record Spring 2021.xlsx"
+        buildworkbook(self.file)
+        self.reader = self.readerclass(self.file)
+        self.addCleanup(self.reader.close)
+        return super().setUp()
+
+    def test_catalogue(self):
+        """ Tests that all Tables are located along with their Worksheet and range """
+        catalogue = self.reader.catalogue
+        self.assertEqual(sorted(catalogue), ["HypeWeek1","RecordStats","Week1"])
+        self.assertEqual(catalogue["HypeWeek1"].sheet, "Week 1")
+        self.assertEqual(catalogue["HypeWeek1"].ref, "F1:G4")
+
+    def test_todicts(self):
+        """ Tests that StreamTable.todicts matches the values read from a fully loaded Workbook """
+        tables = self.reader.gettables()
+        for name in ["Week1", "HypeWeek1"]:
+            with self.subTest(name = name):
+                info = self.reader.catalogue[name]
+                headers, *rows = readrange(self.file, info.sheet, info.ref)
+                result = tables[name].todicts()
+                self.assertEqual(result[0], list(headers))
+                self.assertEqual(result[1:], [dict(zip(headers,row)) for row in rows])
+
+    def test_parsesheet(self):
+        """ Tests that parsesheet reads the contiguous block of cells at the top of a sheet """
+        table = self.reader.parsesheet("Record Stats", "Test")
+        self.assertEqual(table.todicts(), [["Year","Season","Version"],{"Year":2021,"Season":"Spring","Version":4.3}])
+
+class DirectReaderCase(StreamReaderCase):
+    """ Runs the StreamReader tests against DirectReader """
+    readerclass = streaming.DirectReader
+
+    def test_formulas(self):
+        """ Tests that formulas are returned instead of values when data_only is False """
+        wb = openpyxl.load_workbook(self.file)
+        wb["Week 1"]["C2"] = "=B2&\"!\""
+        wb.save(self.file)
+        reader = streaming.DirectReader(self.file, data_only = False)
+        self.addCleanup(reader.close)
+        self.assertEqual(reader.gettables()["Week1"].todicts()[1]["Rank"], "=B2&\"!\"")
+
+class PeekCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = pathlib.Path(directory.name)
+        self.file = self.directory / "__Record Spring 2021.xlsx"
+        buildworkbook(self.file)
+        return super().setUp()
+
+    def test_peek(self):
+        """ Tests that SeasonRecord.peek summarizes the Record without loading it """
+        summary = classes.SeasonRecord.peek(self.file)
+        self.assertEqual((summary.version, summary.season, summary.year), (4.3, "Spring", 2021))
+        self.assertEqual(sorted(summary.tables), ["HypeWeek1","RecordStats","Week1"])
+        self.assertEqual(summary.weeks, 1)
+
+    def test_peek_norecordstats(self):
+        """ Tests that peek raises a ValueError when the Record Stats Table only has a header row """
+        def headeronly(ws):
+            ws.delete_rows(2)
+            ws.tables["RecordStats"].ref = "A1:C1"
+        def notable(ws):
+            del ws.tables["RecordStats"]
+            ws.delete_rows(2)
+        for edit in [headeronly, notable]:
+            with self.subTest(edit = edit.__name__):
+                buildworkbook(self.file)
+                wb = openpyxl.load_workbook(self.file)
+                edit(wb["Record Stats"])
+                wb.save(self.file)
+                self.assertRaisesRegex(ValueError, "Record Stats", classes.SeasonRecord.peek, self.file)
+
+    def test_listvalidfilenames(self):
+        """ Tests that listvalidfilenames yields RecordSummaries when peek is True """
+        self.assertEqual(list(classes.listvalidfilenames(self.directory, peek = True)), [classes.SeasonRecord.peek(self.file)])
+
+class CacheCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = pathlib.Path(directory.name)
+        self.file = self.directory / "__Record Spring 2021.xlsx"
+        self.cachedir = self.directory / "cache"
+        buildworkbook(self.file)
+        return super().setUp()
+
+    def test_loadtables(self):
+        """ Tests that the cache is created on the first load and that cached values match the Workbook """
+        tables = cache.loadtables(self.file, cachedir = self.cachedir)
+        self.assertEqual(len(list(self.cachedir.glob("*.pickle"))), 1)
+        cached = cache.loadtables(self.file, cachedir = self.cachedir)
+        reader = streaming.StreamReader(self.file)
+        self.addCleanup(reader.close)
+        for name,table in reader.gettables().items():
+            with self.subTest(name = name):
+                self.assertEqual(tables[name].todicts(), table.todicts())
+                self.assertEqual(cached[name].todicts(), table.todicts())
+
+    def test_changedfile(self):
+        """ Tests that a changed Workbook is not loaded from the old cache file """
+        cache.loadtables(self.file, cachedir = self.cachedir)
+        wb = openpyxl.load_workbook(self.file)
+        wb["Record Stats"]["C2"] = 5.0
+        wb.save(self.file)
+        tables = cache.loadtables(self.file, cachedir = self.cachedir)
+        self.assertEqual(tables["RecordStats"].todicts()[1]["Version"], 5.0)
+        self.assertEqual(len(list(self.cachedir.glob("*.pickle"))), 2)
+
+    def test_writecache(self):
+        """ Tests that writecache leaves no temporary files behind and keeps the old cache file if the write fails """
+        cache.loadtables(self.file, cachedir = self.cachedir)
+        self.assertEqual([file.suffix for file in self.cachedir.iterdir()], [".pickle"])
+        cachefile = next(self.cachedir.glob("*.pickle"))
+        contents = cachefile.read_bytes()
+        with mock.patch.object(cache.pickle, "dump", side_effect = OSError("disk full")):
+            with self.assertRaisesRegex(OSError, "disk full"):
+                cache.writecache(cachefile, {})
+        self.assertEqual(list(self.cachedir.iterdir()), [cachefile])
+        self.assertEqual(cachefile.read_bytes(), contents)
+
+if __name__ == "__main__":
+    unittest.main()